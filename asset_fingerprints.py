@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Content fingerprints for the viewer's static assets.
+
+Every asset the viewer fetches (the generated JSON files and the text
+and audio files of every book) gets a fingerprinted URL of the form
+'path?v=<content hash>'. The URLs are written to asset-map.json, which
+book-structure.json references and script.js loads first; server.py
+also fingerprints the script.js and styles.css references in index.html.
+Because a URL changes exactly when the content does, a response to a
+fingerprinted URL can be cached forever: server.py sends
+'Cache-Control: public, max-age=31536000, immutable' when the v parameter
+matches the file's current hash. vercel.json does the same for static
+deployments, limited to the asset paths below and v values of the
+length written here, since it cannot compare hashes. Repeat visits then
+only fetch assets that actually changed.
+
+Fingerprints use a query parameter instead of renamed copies so that the
+audio files are not stored twice. Hashes are cached in
+.asset_hash_cache.json by path, size and mtime, so a rebuild only reads
+new or changed files.
+
+Usage:
+    python3 asset_fingerprints.py [--root ROOT]
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from book_scanner import AUDIO_EXTENSIONS, DEFAULT_BOOK, discover_books, structure_file
+
+ASSET_MAP_FILE = 'asset-map.json'
+HASH_CACHE_FILE = '.asset_hash_cache.json'
+
+# Top-level assets fetched by script.js
+ROOT_ASSETS = ['book-structure.json', 'book-manifests.json', 'section_characters.json',
+               'section_stats.json', 'books.json']
+
+# Assets inside the book directories; per-folder manifests are left out
+# because the server rewrites them when audio is deleted
+BOOK_EXTENSIONS = AUDIO_EXTENSIONS + ('.txt',)
+
+# vercel.json only treats v values of exactly this many hex digits as fingerprints
+DIGEST_CHARS = 12
+CHUNK_BYTES = 1024 * 1024
+
+# Sent for a fingerprinted URL whose hash matches the file
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:DIGEST_CHARS]
+
+def fingerprinted(rel_path: str, digest: str) -> str:
+    return f"{rel_path}?v={digest}"
+
+def iter_root_assets(root: str, books: List[str]) -> Iterator[Tuple[str, str]]:
+    """Yield (rel_path, full_path) for the fingerprinted files outside the books."""
+    for name in ROOT_ASSETS:
+        full_path = os.path.join(root, name)
+        if os.path.isfile(full_path):
+            yield name, full_path
+
+    for book in books:
+        name = structure_file(book)
+        full_path = os.path.join(root, name)
+        if book != DEFAULT_BOOK and os.path.isfile(full_path):
+            yield name, full_path
+
+def iter_assets(root: str) -> Iterator[Tuple[str, str]]:
+    """Yield (rel_path, full_path) for every fingerprinted asset under root."""
+    books = discover_books(root)
+    yield from iter_root_assets(root, books)
+
+    for book in books:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, book)):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(BOOK_EXTENSIONS):
+                    full_path = os.path.join(dirpath, filename)
+                    yield os.path.relpath(full_path, root).replace('\\', '/'), full_path
+
+class AssetHashes:
+    """Persistent content hashes keyed by site-relative path.
+
+    A hash is reused while the file's size and mtime are unchanged.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: Dict[str, list] = {}
+        self.hashed = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> 'AssetHashes':
+        hashes = cls(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                hashes.entries = entries
+        except (OSError, ValueError):
+            pass
+        return hashes
+
+    def get(self, rel_path: str, full_path: str) -> Optional[str]:
+        """Return the content hash of a file, hashing it only if it changed."""
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self.entries.get(rel_path)
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                return entry[2]
+        try:
+            digest = file_digest(full_path)
+        except OSError:
+            return None
+        with self._lock:
+            self.entries[rel_path] = [st.st_size, st.st_mtime_ns, digest]
+            self.hashed += 1
+            self._dirty = True
+        return digest
+
+    def asset_map(self, root: str) -> Dict[str, str]:
+        """Return {rel_path: fingerprinted URL} for every asset under root.
+
+        Entries for files that no longer exist are dropped from the cache.
+        """
+        assets = {}
+        for rel_path, full_path in iter_assets(root):
+            digest = self.get(rel_path, full_path)
+            if digest is not None:
+                assets[rel_path] = fingerprinted(rel_path, digest)
+        with self._lock:
+            for rel_path in set(self.entries) - set(assets):
+                del self.entries[rel_path]
+                self._dirty = True
+        return assets
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, separators=(',', ':'), ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+def main():
+    from update_audio_manifest import write_json_atomic
+
+    parser = argparse.ArgumentParser(
+        description='Write asset-map.json with content-fingerprinted asset URLs',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument(
+        '--root',
+        type=Path,
+        default=Path(os.path.dirname(os.path.abspath(__file__))),
+        help='Site root directory (default: directory of this script)'
+    )
+    args = parser.parse_args()
+
+    root = args.root.resolve()
+    hashes = AssetHashes.load(str(root / HASH_CACHE_FILE))
+    assets = hashes.asset_map(str(root))
+    hashes.save()
+
+    map_path = root / ASSET_MAP_FILE
+    data = {'version': 1, 'assets': assets}
+    try:
+        with open(map_path, 'r', encoding='utf-8') as f:
+            unchanged = json.load(f) == data
+    except (OSError, ValueError):
+        unchanged = False
+    if not unchanged:
+        write_json_atomic(map_path, data)
+    print(f"Asset map {'unchanged' if unchanged else 'written'}: {len(assets)} assets "
+          f"({hashes.hashed} hashed, {len(assets) - hashes.hashed} cached)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
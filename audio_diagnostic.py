@@ -1,107 +1,300 @@
 #!/usr/bin/env python3
 """
-Comprehensive diagnostic for audio files and manifests
+Verify the audio files and audio manifests of every book.
+
+Each folder of each book (the Intro, the chapters and their sections) is
+listed once by the shared book scanner. The folders are then checked
+concurrently, each in a worker process:
+
+- the folder's audio_manifest.json must list exactly the audio files
+  present in the folder;
+- every MP3 file is walked frame by frame: it must contain an MPEG frame
+  sync, must not lose sync between frames, and its last frame must be
+  complete (a Xing/Info or VBRI frame count larger than the frames found
+  also means the file was cut short);
+- WAV files are read to the end and must hold as many frames as their
+  header announces; other formats get a signature check.
+
+A plain-text summary is printed, or with --json a machine-readable report.
+The exit status is 1 if any manifest differs from its folder or any audio
+file is invalid (with --strict, also on warnings), so the check can gate
+a deploy.
+
+Usage:
+    python3 audio_diagnostic.py [--book-path BOOK_PATH] [--jobs N] [--json] [--strict]
 """
 
 import os
+import sys
 import json
-from pathlib import Path
-
-def scan_all_audio_files():
-    """Scan for all audio files and compare with manifests"""
-    book_path = Path("book1")
-    
-    print("🔍 COMPREHENSIVE AUDIO FILE DIAGNOSTIC")
-    print("=" * 50)
-    
-    total_audio_files = 0
-    total_manifest_files = 0
-    missing_from_manifest = []
-    
-    # Load book structure
+import mmap
+import time
+import wave
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from book_scanner import discover_books, scan_book
+from mp3_metadata import find_first_frame, id3v2_size, parse_frame_header, read_vbr_header
+
+REPORT_VERSION = 1
+
+# Folders are checked in worker processes once there are this many
+MIN_PARALLEL_FOLDERS = 8
+
+WAV_CHUNK_FRAMES = 65536
+
+# Leading bytes of the formats that are not decoded
+SIGNATURES = {
+    '.ogg': [(0, b'OggS')],
+    '.flac': [(0, b'fLaC')],
+    '.m4a': [(4, b'ftyp')],
+}
+
+def verify_mp3(path: str) -> Dict:
+    """Walk every frame of an MP3 file.
+
+    Returns:
+        {'frames': N, 'errors': [...], 'warnings': [...]}
+    """
+    result = {'frames': 0, 'errors': [], 'warnings': []}
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            result['errors'].append('empty file')
+            return result
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = id3v2_size(data)
+            if start >= size:
+                result['errors'].append('ID3v2 tag runs to the end of the file')
+                return result
+            end = size - 128 if size >= 128 and data[size - 128:size - 125] == b'TAG' else size
+            first = find_first_frame(data, start, end)
+            if first is None:
+                result['errors'].append('no MPEG frame sync found')
+                return result
+            if first > start:
+                result['warnings'].append(f'{first - start} bytes before the first frame')
+
+            frames = lost = 0
+            first_lost = None
+            offset = first
+            while offset < end:
+                frame = parse_frame_header(data, offset)
+                if frame is None:
+                    resync = find_first_frame(data, offset + 1, end)
+                    if resync is None:
+                        # Trailing data that is not audio, e.g. an APEv2 tag
+                        result['warnings'].append(f'{end - offset} bytes after the last frame')
+                        break
+                    lost += 1
+                    first_lost = offset if first_lost is None else first_lost
+                    offset = resync
+                    continue
+                if offset + frame.length > end:
+                    result['errors'].append(f'truncated: last frame has {end - offset} of {frame.length} bytes')
+                    break
+                frames += 1
+                offset += frame.length
+            result['frames'] = frames
+            if lost:
+                result['errors'].append(f'lost frame sync {lost} times (first at byte {first_lost})')
+
+            vbr = read_vbr_header(data, first, parse_frame_header(data, first))
+            if vbr is not None:
+                # The Xing/Info/VBRI frame itself carries no audio and is not counted
+                kind, announced, _ = vbr
+                if frames - 1 < announced:
+                    result['errors'].append(f'truncated: {kind} header announces {announced} frames, '
+                                            f'found {frames - 1}')
+                elif frames - 1 > announced:
+                    result['warnings'].append(f'{kind} header announces {announced} frames, '
+                                              f'found {frames - 1}')
+    return result
+
+def verify_wav(path: str) -> Dict:
+    """Read a WAV file to the end and compare with the frame count in its header."""
+    result = {'frames': 0, 'errors': [], 'warnings': []}
+    with wave.open(path, 'rb') as w:
+        announced = w.getnframes()
+        frame_size = w.getsampwidth() * w.getnchannels()
+        frames = 0
+        while True:
+            chunk = w.readframes(WAV_CHUNK_FRAMES)
+            if not chunk:
+                break
+            frames += len(chunk) // frame_size
+    result['frames'] = frames
+    if frames < announced:
+        result['errors'].append(f'truncated: header announces {announced} frames, found {frames}')
+    return result
+
+def verify_signature(path: str, ext: str) -> Dict:
+    result = {'frames': None, 'errors': [], 'warnings': []}
+    with open(path, 'rb') as f:
+        head = f.read(16)
+    if not head:
+        result['errors'].append('empty file')
+    elif not any(head[offset:offset + len(magic)] == magic for offset, magic in SIGNATURES[ext]):
+        result['errors'].append(f'not a {ext.lstrip(".")} file')
+    return result
+
+def verify_audio_file(path: str) -> Dict:
+    """Check one audio file; read errors are reported like any other error."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.mp3':
+            return verify_mp3(path)
+        if ext == '.wav':
+            return verify_wav(path)
+        return verify_signature(path, ext)
+    except (OSError, ValueError, EOFError, wave.Error) as e:
+        return {'frames': None, 'errors': [str(e)], 'warnings': []}
+
+def verify_folder(task: Tuple[str, str, List[str]]) -> Dict:
+    """Compare a folder's manifest with its files and check every audio file.
+
+    Args:
+        task: (rel_path, path, audio filenames listed by the scanner)
+    """
+    rel_path, path, audio_files = task
+    result = {'folder': rel_path, 'audio_files': len(audio_files), 'bytes': 0,
+              'manifest_error': None, 'missing_from_manifest': [], 'missing_files': [],
+              'files': []}
+
+    manifest_path = os.path.join(path, 'audio_manifest.json')
+    manifest = []
     try:
-        with open("book-structure.json", "r") as f:
-            book_structure = json.load(f)
-        print(f"📚 Book structure: {len(book_structure['chapters'])} chapters")
-    except Exception as e:
-        print(f"❌ Error loading book structure: {e}")
-        return
-    
-    print()
-    
-    for chapter in book_structure["chapters"]:
-        chapter_id = chapter["id"]
-        chapter_path = book_path / chapter_id
-        
-        print(f"📖 {chapter_id}: {chapter['title']}")
-        
-        if not chapter.get("sections"):
-            print("   No sections")
-            continue
-            
-        for section in chapter["sections"]:
-            section_id = section["id"]
-            section_path = chapter_path / section_id
-            
-            if not section_path.exists():
-                print(f"   ❌ {section_id}: Directory doesn't exist")
-                continue
-            
-            # Find actual audio files
-            audio_extensions = ['.mp3', '.wav', '.ogg', '.m4a', '.flac']
-            actual_files = []
-            for ext in audio_extensions:
-                actual_files.extend(section_path.glob(f"*{ext}"))
-            actual_files = [f.name for f in actual_files]
-            
-            # Read manifest
-            manifest_path = section_path / "audio_manifest.json"
-            manifest_files = []
-            if manifest_path.exists():
-                try:
-                    with open(manifest_path, "r") as f:
-                        manifest_files = json.load(f)
-                except Exception as e:
-                    print(f"   ❌ {section_id}: Error reading manifest: {e}")
-            
-            total_audio_files += len(actual_files)
-            total_manifest_files += len(manifest_files)
-            
-            # Compare
-            if actual_files:
-                if set(actual_files) == set(manifest_files):
-                    print(f"   ✅ {section_id}: {len(actual_files)} files - {', '.join(actual_files)}")
-                else:
-                    print(f"   ⚠️  {section_id}: MISMATCH")
-                    print(f"      Actual: {actual_files}")
-                    print(f"      Manifest: {manifest_files}")
-                    missing_from_manifest.append(f"{chapter_id}-{section_id}")
-            elif manifest_files:
-                print(f"   ❌ {section_id}: Manifest has files but no actual files found")
-                print(f"      Manifest: {manifest_files}")
-            else:
-                print(f"   ⚪ {section_id}: No audio files")
-    
-    print()
-    print("📊 SUMMARY")
-    print("=" * 50)
-    print(f"Total actual audio files found: {total_audio_files}")
-    print(f"Total files in manifests: {total_manifest_files}")
-    
-    if missing_from_manifest:
-        print(f"Sections with manifest mismatches: {len(missing_from_manifest)}")
-        for section in missing_from_manifest:
-            print(f"  - {section}")
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if not isinstance(manifest, list):
+            result['manifest_error'] = 'manifest is not a list'
+            manifest = []
+    except FileNotFoundError:
+        if audio_files:
+            result['manifest_error'] = 'audio_manifest.json is missing'
+    except (OSError, ValueError) as e:
+        result['manifest_error'] = str(e)
+    result['missing_from_manifest'] = sorted(set(audio_files) - set(manifest))
+    result['missing_files'] = sorted(set(manifest) - set(audio_files))
+
+    for name in audio_files:
+        full_path = os.path.join(path, name)
+        checked = verify_audio_file(full_path)
+        try:
+            size = os.path.getsize(full_path)
+        except OSError:
+            size = None
+        result['bytes'] += size or 0
+        result['files'].append({'file': f"{rel_path}/{name}", 'size': size, **checked})
+    return result
+
+def verify_books(book_paths: List[str], root_dir: str, jobs: int = 1) -> Dict:
+    """Check every folder of the given books and build the report."""
+    started = time.monotonic()
+    tasks = []
+    for book_path in book_paths:
+        book = scan_book(book_path, root_dir, read_texts=False)
+        if book is None:
+            raise FileNotFoundError(book_path)
+        tasks.extend((folder.rel_path, folder.path, folder.audio_files) for folder in book.folders)
+
+    if jobs > 1 and len(tasks) >= MIN_PARALLEL_FOLDERS:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            folders = list(executor.map(verify_folder, tasks, chunksize=max(1, len(tasks) // (jobs * 4))))
     else:
-        print("✅ All manifests match actual files")
-    
-    print()
-    print("🌐 TO TEST IN BROWSER:")
-    print("1. Open http://localhost:8000")
-    print("2. Click 'To-Do' in sidebar")
-    print("3. Console should show:")
-    print(f"   - 'Total audio files loaded: {total_audio_files}'")
-    print(f"   - Individual section logs for all {total_audio_files} files")
-
-if __name__ == "__main__":
-    scan_all_audio_files()
\ No newline at end of file
+        folders = [verify_folder(task) for task in tasks]
+
+    mismatches = [{key: folder[key] for key in ('folder', 'manifest_error', 'missing_from_manifest', 'missing_files')}
+                  for folder in folders
+                  if folder['manifest_error'] or folder['missing_from_manifest'] or folder['missing_files']]
+    invalid = [{'file': entry['file'], 'errors': entry['errors']}
+               for folder in folders for entry in folder['files'] if entry['errors']]
+    warnings = [{'file': entry['file'], 'warnings': entry['warnings']}
+                for folder in folders for entry in folder['files'] if entry['warnings']]
+    return {
+        'version': REPORT_VERSION,
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'books': [os.path.relpath(path, root_dir).replace('\\', '/') for path in book_paths],
+        'duration_seconds': round(time.monotonic() - started, 3),
+        'summary': {
+            'folders': len(folders),
+            'audio_files': sum(folder['audio_files'] for folder in folders),
+            'bytes': sum(folder['bytes'] for folder in folders),
+            'manifest_mismatches': len(mismatches),
+            'invalid_files': len(invalid),
+            'files_with_warnings': len(warnings),
+        },
+        'mismatches': mismatches,
+        'invalid': invalid,
+        'warnings': warnings,
+    }
+
+def print_report(report: Dict):
+    summary = report['summary']
+    print(f"Checked {summary['audio_files']} audio files ({summary['bytes'] / 1e6:.1f} MB) "
+          f"in {summary['folders']} folders of {', '.join(report['books'])} "
+          f"in {report['duration_seconds']:.2f}s")
+    for mismatch in report['mismatches']:
+        print(f"\nManifest mismatch in {mismatch['folder']}/")
+        if mismatch['manifest_error']:
+            print(f"  {mismatch['manifest_error']}")
+        for name in mismatch['missing_from_manifest']:
+            print(f"  not in manifest: {name}")
+        for name in mismatch['missing_files']:
+            print(f"  listed but missing: {name}")
+    for entry in report['invalid']:
+        print(f"\nInvalid: {entry['file']}")
+        for error in entry['errors']:
+            print(f"  {error}")
+    for entry in report['warnings']:
+        print(f"\nWarning: {entry['file']}")
+        for warning in entry['warnings']:
+            print(f"  {warning}")
+    print(f"\n{summary['manifest_mismatches']} manifest mismatches, {summary['invalid_files']} invalid files, "
+          f"{summary['files_with_warnings']} files with warnings")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Verify audio files and audio manifests',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('--book-path', help='Path to one book directory (default: every bookN/ directory '
+                                            'in the current directory)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    parser.add_argument('--strict', action='store_true', help='Also exit with status 1 on warnings')
+    args = parser.parse_args()
+
+    if args.book_path:
+        book_path = os.path.abspath(args.book_path)
+        root_dir = os.path.dirname(book_path)
+        book_paths = [book_path]
+    else:
+        root_dir = os.path.abspath('.')
+        book_paths = [os.path.join(root_dir, name) for name in discover_books(root_dir)]
+        if not book_paths:
+            print("Error: No book directories (book1, book2, ...) found")
+            return 2
+
+    try:
+        report = verify_books(book_paths, root_dir, max(args.jobs, 1))
+    except FileNotFoundError as e:
+        print(f"Error: Book path {e} does not exist")
+        return 2
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+    summary = report['summary']
+    failed = summary['manifest_mismatches'] or summary['invalid_files'] or \
+        (args.strict and summary['files_with_warnings'])
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Benchmark the scanning and manifest tools on a synthetic large book.
+
+A synthetic book (by default 200 chapters of 10 sections, about 12,000
+files) is generated in a temporary site root, with dialogue text files of
+realistic size and small stub MP3 files made of valid MPEG frames. The
+current scripts are copied next to it and each tool is timed in a fresh
+Python process:
+
+    server_scan               server.py's scan_book_directory()
+    generate_book_structure   generate_book_structure.py
+    update_audio_manifest     update_audio_manifest.scan_book_directory()
+    audio_diagnostic          audio_diagnostic.verify_books() on all CPUs
+
+Each tool runs once cold, after generating the book and with the tool's
+persistent caches removed, and then --repeat times warm. The OS page cache
+is not dropped, so "cold" means cold for the tools' own caches. Only the
+tool call is timed (imports and interpreter startup are excluded); peak
+memory is the child process's maximum RSS.
+
+Results are written as JSON together with the git commit they were
+measured on. With --compare, the timings are printed side by side with an
+earlier results file to make regressions between versions visible.
+
+Usage:
+    python3 benchmark.py [--chapters N] [--sections N] [--audio N] [--text-kb KB]
+                         [--repeat N] [--tools NAME ...] [--output FILE]
+                         [--compare FILE] [--keep]
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+# Persistent caches written by the tools, removed before each cold run
+CACHE_FILES = ['.book_scan_cache.json', '.audio_index.json']
+
+# Setup code (not timed) and the timed call for each tool, run in the site root
+TOOLS = {
+    'server_scan': (
+        "import server",
+        "server.MyHTTPRequestHandler.scan_book_directory(None)",
+    ),
+    'generate_book_structure': (
+        "import runpy",
+        "runpy.run_path('generate_book_structure.py', run_name='__main__')",
+    ),
+    'update_audio_manifest': (
+        "from pathlib import Path; from update_audio_manifest import scan_book_directory",
+        "scan_book_directory(Path('book1'))",
+    ),
+    'audio_diagnostic': (
+        "import audio_diagnostic",
+        "audio_diagnostic.verify_books([os.path.abspath('book1')], os.getcwd(), os.cpu_count() or 1)",
+    ),
+}
+
+_CHILD = """
+import io, os, sys, json, time, contextlib
+os.chdir({root!r})
+sys.path.insert(0, {root!r})
+{setup}
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    {call}
+sys.stderr.write(json.dumps({{'seconds': time.perf_counter() - start}}) + '\\n')
+"""
+
+SPEAKERS = ['Sócrates', 'Glaucón', 'Entrevistadora', 'Friedrich von Hayek', 'Miembro de la audiencia']
+WORDS = ('la economía estudia cómo las personas empresas y gobiernos asignan recursos escasos '
+         'entre usos alternativos precio mercado oferta demanda costo de oportunidad incentivo '
+         'equilibrio competencia dinero inflación producción consumo ahorro inversión riqueza').split()
+
+# One MPEG-1 Layer III frame: 128 kbit/s, 44.1 kHz, stereo (417 bytes)
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+def dialogue(rng: random.Random, size: int) -> str:
+    """Generate roughly `size` bytes of "Speaker: text" lines."""
+    lines = []
+    total = 0
+    speakers = rng.sample(SPEAKERS, 2)
+    while total < size:
+        words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 60)))
+        line = f"{speakers[len(lines) % 2]}: {words.capitalize()}."
+        lines.append(line)
+        total += len(line.encode('utf-8')) + 1
+    return '\n'.join(lines) + '\n'
+
+def generate_book(root: Path, chapters: int, sections: int, audio: int,
+                  text_kb: int, seed: int = 0) -> Dict:
+    """Write a synthetic book1/ under root.
+
+    Returns:
+        Counts of the generated folders, files and bytes
+    """
+    rng = random.Random(seed)
+    stub = MP3_FRAME * 24  # about 0.6 s of audio
+    counts = {'chapters': chapters, 'sections': 0, 'folders': 0, 'files': 0, 'bytes': 0}
+
+    def write(path: Path, data):
+        data = data.encode('utf-8') if isinstance(data, str) else data
+        path.write_bytes(data)
+        counts['files'] += 1
+        counts['bytes'] += len(data)
+
+    def folder(path: Path, text_name: str, text_size: int, title: str, prefix: str):
+        path.mkdir(parents=True)
+        counts['folders'] += 1
+        write(path / 'title.txt', title)
+        write(path / text_name, dialogue(rng, text_size))
+        for take in range(audio):
+            write(path / f"{prefix}-main-{take + 1}-compressed.mp3", stub)
+
+    book = root / 'book1'
+    folder(book / 'Intro', 'introduction.txt', text_kb * 1024, 'Introducción', 'book1Intro')
+    for c in range(1, chapters + 1):
+        chapter = book / f"C{c}"
+        folder(chapter, 'chapter.txt', text_kb * 128, f"Capítulo {c}", f"book1C{c}")
+        for s in range(1, sections + 1):
+            section = chapter / f"S{s}"
+            folder(section, 'main.txt', int(text_kb * 1024 * rng.uniform(0.5, 1.5)),
+                   f"Sección {s}", f"C{c}S{s}")
+            write(section / 'description.txt', dialogue(rng, 300))
+            counts['sections'] += 1
+        folder(chapter / 'SINOPSIS', 'sinopsis.txt', text_kb * 128, 'Sinopsis', f"C{c}SINOPSIS")
+    return counts
+
+def copy_tools(root: Path):
+    """Copy the current scripts into the synthetic site root."""
+    for name in os.listdir(REPO_DIR):
+        if name.endswith('.py'):
+            shutil.copy2(os.path.join(REPO_DIR, name), root / name)
+
+def run_tool(root: Path, tool: str) -> Dict:
+    """Run one tool in a fresh interpreter and measure it."""
+    setup, call = TOOLS[tool]
+    code = _CHILD.format(root=str(root), setup=setup, call=call)
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=root,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.read().decode('utf-8', errors='replace')
+    proc.stderr.close()
+    # wait4 reports the resource usage of this child alone
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{tool} failed with exit code {proc.returncode}:\n{stderr}")
+    seconds = json.loads(stderr.strip().splitlines()[-1])['seconds']
+    return {'seconds': seconds, 'peak_rss_kb': usage.ru_maxrss}
+
+def summarize(runs: List[Dict], files: int) -> Dict:
+    seconds = statistics.median(run['seconds'] for run in runs)
+    return {
+        'seconds': round(seconds, 4),
+        'files_per_second': round(files / seconds) if seconds else None,
+        'peak_rss_kb': max(run['peak_rss_kb'] for run in runs),
+        'runs': len(runs),
+    }
+
+def git_version() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark(root: Path, tools: List[str], files: int, repeat: int) -> Dict:
+    results = {}
+    for tool in tools:
+        for name in CACHE_FILES:
+            path = root / name
+            if path.exists():
+                path.unlink()
+        cold = run_tool(root, tool)
+        warm = [run_tool(root, tool) for _ in range(repeat)]
+        results[tool] = {'cold': summarize([cold], files)}
+        if warm:
+            results[tool]['warm'] = summarize(warm, files)
+        line = f"{tool:<25} cold {cold['seconds']:8.3f}s"
+        if warm:
+            line += f"  warm {results[tool]['warm']['seconds']:8.3f}s"
+        print(f"{line}  peak {max(run['peak_rss_kb'] for run in [cold] + warm) / 1024:7.1f} MB")
+    return results
+
+def compare(current: Dict, previous: Dict):
+    """Print the timings of two result files side by side."""
+    print(f"\nCompared with {previous.get('version')} ({previous.get('timestamp')}):")
+    if previous.get('book') != current.get('book'):
+        print("  Warning: the synthetic books differ, ratios are not comparable")
+    for tool, phases in current['results'].items():
+        for phase, result in phases.items():
+            before = previous.get('results', {}).get(tool, {}).get(phase)
+            if not before:
+                continue
+            ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+            print(f"  {tool:<25} {phase:<4} {before['seconds']:8.3f}s -> {result['seconds']:8.3f}s "
+                  f"({ratio:.2f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the book tools on a synthetic large book',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('--chapters', type=int, default=200, help='Chapters (default: 200)')
+    parser.add_argument('--sections', type=int, default=10, help='Sections per chapter (default: 10)')
+    parser.add_argument('--audio', type=int, default=2, help='Audio files per folder (default: 2)')
+    parser.add_argument('--text-kb', type=int, default=10, help='Average main.txt size in KB (default: 10)')
+    parser.add_argument('--repeat', type=int, default=3, help='Warm runs per tool (default: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the text (default: 0)')
+    parser.add_argument('--tools', nargs='+', choices=list(TOOLS), default=list(TOOLS),
+                        help='Tools to benchmark (default: all)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help=f'Results file (default: {DEFAULT_OUTPUT})')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--keep', action='store_true', help='Keep the synthetic site root')
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix='book-benchmark-'))
+    try:
+        print(f"Generating synthetic book in {root} ...")
+        book = generate_book(root, args.chapters, args.sections, args.audio, args.text_kb, args.seed)
+        print(f"{book['chapters']} chapters, {book['sections']} sections, {book['files']} files, "
+              f"{book['bytes'] / 1e6:.1f} MB")
+        copy_tools(root)
+        results = benchmark(root, args.tools, book['files'], max(args.repeat, 0))
+    finally:
+        if args.keep:
+            print(f"Kept {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        'version': git_version(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'book': book,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                compare(report, json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read {args.compare}: {e}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
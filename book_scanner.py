@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Single-pass scanner for the book directory.
+
+server.py, generate_book_structure.py and update_audio_manifest.py all
+consume the tree built here instead of walking book1/ themselves. Every
+folder is listed exactly once with os.scandir, and the DirEntry type and
+stat information cached by that listing is reused for classification and
+mtimes, so no file is stat'ed or listed twice.
+
+Layout of the book directory:
+
+    book1/Intro/          introduction (introduction.txt)
+    book1/C<n>/           chapter (chapter.txt)
+    book1/C<n>/S<m>/      section (main.txt, description.txt)
+    book1/C<n>/SINOPSIS/  chapter synopsis (sinopsis.txt)
+
+Every folder may contain title.txt and any number of audio files. The
+site root may hold any number of books (book1/, book2/, ...); a book's
+own title.txt names it.
+"""
+
+import os
+import re
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Audio files listed in audio_manifest.json
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.ogg', '.flac')
+
+# Audio files the browser can play, used for the primary audioFile entry
+PLAYABLE_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.m4a')
+
+TEXT_EXTENSION = '.txt'
+
+# Book directories in the site root: book1/, book2/, ...
+BOOK_DIR_RE = re.compile(r'^book(\d+)$')
+
+# The book served when none is named, and whose structure is book-structure.json
+DEFAULT_BOOK = 'book1'
+
+@dataclass
+class Folder:
+    """One directory of the book with its files split by kind."""
+    name: str
+    path: str
+    rel_path: str
+    mtime_ns: int = 0
+    audio_files: List[str] = field(default_factory=list)
+    text_files: List[str] = field(default_factory=list)
+    subdirs: List[str] = field(default_factory=list)
+    subdir_mtimes: Dict[str, int] = field(default_factory=dict, repr=False)
+    title: Optional[str] = None
+    description: Optional[str] = None
+
+    @property
+    def primary_audio(self) -> Optional[str]:
+        """Path of the first playable audio file, relative to the site root."""
+        for name in self.audio_files:
+            if name.lower().endswith(PLAYABLE_EXTENSIONS):
+                return f"{self.rel_path}/{name}"
+        return None
+
+    @property
+    def manifest_text_files(self) -> List[str]:
+        """Text files listed in text_manifest.json (everything but title.txt)."""
+        return [name for name in self.text_files if name.lower() != 'title.txt']
+
+@dataclass
+class Section(Folder):
+    """A section (S1, S2, ...) or the chapter's SINOPSIS."""
+
+    @property
+    def is_sinopsis(self) -> bool:
+        return self.name == 'SINOPSIS'
+
+    @property
+    def text_file(self) -> str:
+        return f"{self.rel_path}/{'sinopsis.txt' if self.is_sinopsis else 'main.txt'}"
+
+    @property
+    def display_title(self) -> str:
+        if self.title:
+            return self.title
+        return "Sinopsis" if self.is_sinopsis else f"Sección {self.name[1:]}"
+
+@dataclass
+class Chapter(Folder):
+    """A chapter (C1, C2, ...) or the book's Intro."""
+    sections: List[Section] = field(default_factory=list)
+
+    @property
+    def is_intro(self) -> bool:
+        return self.name == 'Intro'
+
+    @property
+    def text_file(self) -> str:
+        return f"{self.rel_path}/{'introduction.txt' if self.is_intro else 'chapter.txt'}"
+
+    @property
+    def display_title(self) -> str:
+        if self.title:
+            return self.title
+        return "Introducción" if self.is_intro else f"Capítulo {self.name[1:]}"
+
+@dataclass
+class Book:
+    """The whole book: its root folder, the Intro (if any) and the chapters."""
+    root: Folder
+    chapters: List[Chapter] = field(default_factory=list)
+    title: str = ''
+
+    @property
+    def folders(self) -> List[Folder]:
+        """Every chapter and section folder, in reading order."""
+        result = []
+        for chapter in self.chapters:
+            result.append(chapter)
+            result.extend(chapter.sections)
+        return result
+
+def read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def default_book_title(name: str) -> str:
+    match = BOOK_DIR_RE.match(name)
+    return f"Libro {match.group(1)}" if match else name
+
+def book_title(book_path: str) -> str:
+    """Read a book's title.txt without scanning the rest of the book."""
+    return read_text(os.path.join(book_path, 'title.txt')) or default_book_title(os.path.basename(book_path))
+
+def discover_books(root_dir: str) -> List[str]:
+    """Return the names of the book directories in root_dir, in numeric order."""
+    try:
+        with os.scandir(root_dir) as entries:
+            names = [entry.name for entry in entries if entry.is_dir() and BOOK_DIR_RE.match(entry.name)]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    return sorted(names, key=lambda name: int(BOOK_DIR_RE.match(name).group(1)))
+
+def is_book_path(rel_path: str) -> bool:
+    """Check whether a site-relative path lies inside a book directory."""
+    return BOOK_DIR_RE.match(rel_path.split('/', 1)[0]) is not None and '/' in rel_path
+
+def structure_file(book_id: str) -> str:
+    """Name of the static structure file of a book.
+
+    The default book keeps book-structure.json, which the viewer loads.
+    """
+    return 'book-structure.json' if book_id == DEFAULT_BOOK else f'book-structure-{book_id}.json'
+
+def chapter_sort_key(name: str):
+    # Intro first, then C1, C2, ... numerically
+    if name == 'Intro':
+        return (0, 0)
+    return (1, int(name[1:]) if name[1:].isdigit() else 0)
+
+def section_sort_key(name: str):
+    # S1, S2, etc. first, then SINOPSIS last, then anything else
+    if name.startswith('S') and name[1:].isdigit():
+        return (0, int(name[1:]))
+    elif name == 'SINOPSIS':
+        return (1, 0)
+    return (2, 0)
+
+def is_chapter_dir(name: str) -> bool:
+    return name == 'Intro' or name.startswith('C')
+
+def is_section_dir(name: str) -> bool:
+    return name.startswith('S')
+
+class ScanCache:
+    """Persistent per-directory scan results for incremental builds.
+
+    For every folder (keyed by rel_path) the cache records the directory
+    mtime, its entry listing, and the mtime, size and content of the
+    title/description files that were read. A folder whose mtime is
+    unchanged is not listed again, and a text file whose mtime and size
+    are unchanged is not read again.
+    """
+    VERSION = 1
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self._seen = set()
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path: str) -> 'ScanCache':
+        cache = cls(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == cls.VERSION:
+                cache.entries = data.get('folders', {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return cache
+
+    def listing(self, folder: Folder) -> Optional[Dict]:
+        """Return the cached listing of folder if its mtime is unchanged."""
+        self._seen.add(folder.rel_path)
+        entry = self.entries.get(folder.rel_path)
+        if entry is not None and entry['mtime_ns'] == folder.mtime_ns:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store_listing(self, folder: Folder):
+        entry = self.entries.get(folder.rel_path)
+        texts = entry.get('texts', {}) if entry else {}
+        self.entries[folder.rel_path] = {
+            'mtime_ns': folder.mtime_ns,
+            'audio': folder.audio_files,
+            'text': folder.text_files,
+            'dirs': folder.subdirs,
+            'texts': {name: value for name, value in texts.items() if name in folder.text_files},
+        }
+        self._dirty = True
+
+    def read_text(self, folder: Folder, name: str) -> Optional[str]:
+        """Read a text file of folder, reusing the cached content if unchanged."""
+        path = os.path.join(folder.path, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        texts = self.entries.setdefault(folder.rel_path, {'mtime_ns': None}).setdefault('texts', {})
+        cached = texts.get(name)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        content = read_text(path)
+        texts[name] = [st.st_mtime_ns, st.st_size, content]
+        self._dirty = True
+        return content
+
+    def save(self):
+        """Write the cache, dropping folders that were not seen in this scan."""
+        stale = set(self.entries) - self._seen
+        for rel_path in stale:
+            del self.entries[rel_path]
+        if not (self._dirty or stale) or not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'folders': self.entries}, f,
+                      separators=(',', ':'), ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+def scan_folder(folder: Folder, read_texts: bool = True, cache: Optional[ScanCache] = None) -> bool:
+    """Fill in a folder's file lists from a single os.scandir pass.
+
+    Args:
+        folder: Folder whose path is scanned; its lists are replaced
+        read_texts: Also read title.txt and description.txt when present
+        cache: Optional ScanCache; an unchanged folder is restored from it
+               and only its subfolders are stat'ed
+
+    Returns:
+        False if the directory does not exist
+    """
+    try:
+        if not folder.mtime_ns:
+            # Only the book root is not already known from its parent's listing
+            folder.mtime_ns = os.stat(folder.path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+
+    cached = cache.listing(folder) if cache is not None else None
+    if cached is not None:
+        audio, text, dirs = cached['audio'], cached['text'], cached['dirs']
+        dir_mtimes = {}
+        for name in dirs:
+            # A subfolder can change without touching this folder's mtime
+            try:
+                dir_mtimes[name] = os.stat(os.path.join(folder.path, name)).st_mtime_ns
+            except OSError:
+                continue
+        dirs = [name for name in dirs if name in dir_mtimes]
+    else:
+        audio, text, dirs = [], [], []
+        dir_mtimes = {}
+        try:
+            with os.scandir(folder.path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        dirs.append(entry.name)
+                        dir_mtimes[entry.name] = entry.stat().st_mtime_ns
+                    elif entry.is_file():
+                        lower = entry.name.lower()
+                        if lower.endswith(AUDIO_EXTENSIONS):
+                            audio.append(entry.name)
+                        elif lower.endswith(TEXT_EXTENSION):
+                            text.append(entry.name)
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+
+    folder.audio_files = sorted(audio)
+    folder.text_files = sorted(text)
+    folder.subdirs = sorted(dirs)
+    folder.subdir_mtimes = dir_mtimes
+    if cache is not None and cached is None:
+        cache.store_listing(folder)
+
+    if read_texts:
+        read = (lambda name: cache.read_text(folder, name)) if cache is not None else \
+               (lambda name: read_text(os.path.join(folder.path, name)))
+        folder.title = read('title.txt') if 'title.txt' in text else None
+        folder.description = read('description.txt') if 'description.txt' in text else None
+    return True
+
+def scan_book(book_path: str, root_dir: Optional[str] = None, read_texts: bool = True,
+              cache: Optional[ScanCache] = None) -> Optional[Book]:
+    """Scan the book directory into a Book tree.
+
+    Args:
+        book_path: Path to the book directory (e.g. book1/)
+        root_dir: Directory that rel_path values are relative to
+                  (default: the parent of book_path)
+        read_texts: Read titles and descriptions; manifest tools skip this
+        cache: Optional ScanCache for incremental rescans
+
+    Returns:
+        The Book, or None if book_path does not exist
+    """
+    book_path = os.path.abspath(book_path)
+    root_dir = os.path.abspath(root_dir or os.path.dirname(book_path))
+
+    def make(cls, parent, name):
+        return cls(name=name, path=os.path.join(parent.path, name),
+                   rel_path=f"{parent.rel_path}/{name}",
+                   mtime_ns=parent.subdir_mtimes.get(name, 0))
+
+    root = Folder(name=os.path.basename(book_path), path=book_path,
+                  rel_path=os.path.relpath(book_path, root_dir).replace('\\', '/'))
+    if not scan_folder(root, read_texts=read_texts, cache=cache):
+        return None
+
+    book = Book(root=root, title=root.title or default_book_title(root.name))
+    for name in sorted((d for d in root.subdirs if is_chapter_dir(d)), key=chapter_sort_key):
+        chapter = make(Chapter, root, name)
+        if not scan_folder(chapter, read_texts, cache):
+            continue
+        if not chapter.is_intro:
+            for section_name in sorted((d for d in chapter.subdirs if is_section_dir(d)), key=section_sort_key):
+                section = make(Section, chapter, section_name)
+                if scan_folder(section, read_texts, cache):
+                    chapter.sections.append(section)
+        book.chapters.append(chapter)
+    return book
+
+def section_to_dict(section: Section) -> Dict:
+    return {
+        "id": section.name,
+        "title": section.display_title,
+        "textFile": section.text_file,
+        "audioFile": section.primary_audio,
+        # SINOPSIS doesn't have description.txt
+        "description": None if section.is_sinopsis else section.description,
+    }
+
+def chapter_to_dict(chapter: Chapter) -> Dict:
+    return {
+        "id": chapter.name,
+        "title": chapter.display_title,
+        "textFile": chapter.text_file,
+        "audioFile": chapter.primary_audio,
+        "sections": [section_to_dict(section) for section in chapter.sections],
+    }
+
+def book_to_structure(book: Book) -> Dict:
+    """Convert a Book into the book-structure.json document."""
+    return {
+        "id": book.root.name,
+        "title": book.title,
+        "chapters": [chapter_to_dict(chapter) for chapter in book.chapters],
+    }
+
+def book_to_manifests(book: Book) -> Dict:
+    """Collect every folder's audio and text manifest, keyed by 'book1/C1/S1/'."""
+    return {
+        f"{folder.rel_path}/": {
+            'audio': list(folder.audio_files),
+            'text': folder.manifest_text_files,
+        }
+        for folder in book.folders
+    }
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Filesystem watcher that keeps an in-memory index of the book directory.
+
+The index maps every folder under book1/ to its audio files, text files
+and subfolders. A background thread watches the tree with inotify when the
+platform has it (Linux, through ctypes) and falls back to polling directory
+mtimes otherwise. Either way only the directories that changed are
+rescanned, and the resulting add/remove events are published to an
+EventBroker that server.py streams to clients as Server-Sent Events.
+"""
+
+import os
+import json
+import queue
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from collections import deque
+
+import book_scanner
+from book_scanner import Folder
+
+# Seconds to wait for more changes before rescanning a burst of events
+DEBOUNCE_SECONDS = 0.2
+POLL_INTERVAL = 2.0
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+def scan_folder(path):
+    """List one folder without descending into it.
+
+    Returns:
+        Dict with sorted 'audio', 'text' and 'dirs' name lists, or None if
+        the folder no longer exists
+    """
+    folder = Folder(name=os.path.basename(path), path=path, rel_path='')
+    if not book_scanner.scan_folder(folder, read_texts=False):
+        return None
+    return {'audio': folder.audio_files, 'text': folder.text_files, 'dirs': folder.subdirs}
+
+class BookIndex:
+    """In-memory index of every folder under the book directory.
+
+    Folders are keyed by their path relative to root_dir with forward
+    slashes and a trailing slash (e.g. 'book1/C1/S1/'), the same form
+    script.js uses for manifest paths.
+    """
+
+    def __init__(self, book_path, root_dir=None):
+        self.book_path = os.path.abspath(book_path)
+        self.root_dir = os.path.abspath(root_dir or os.path.dirname(self.book_path))
+        self.folders = {}
+        self.version = 0
+        self.updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def folder_key(self, path):
+        rel_path = os.path.relpath(path, self.root_dir).replace('\\', '/')
+        return rel_path.rstrip('/') + '/'
+
+    def folder_path(self, key):
+        return os.path.join(self.root_dir, *key.rstrip('/').split('/'))
+
+    def build(self):
+        """Scan the whole tree once."""
+        with self._lock:
+            self.folders = {}
+            self._scan_tree(self.book_path, [])
+            self.version += 1
+            self.updated_at = time.time()
+
+    def snapshot(self):
+        """Return a copy of the index that is safe to serialize."""
+        with self._lock:
+            return {key: {kind: list(names) for kind, names in folder.items()}
+                    for key, folder in self.folders.items()}
+
+    def manifests(self):
+        """Return every folder's audio and text manifest in one dict.
+
+        Keys are folder paths below the book directory ('book1/C1/S1/');
+        the lists match what update_audio_manifest.py writes to
+        audio_manifest.json and text_manifest.json.
+        """
+        book_key = self.folder_key(self.book_path)
+        with self._lock:
+            return {
+                key: {
+                    'audio': list(folder['audio']),
+                    'text': [name for name in folder['text'] if name.lower() != 'title.txt'],
+                }
+                for key, folder in sorted(self.folders.items())
+                if key != book_key
+            }
+
+    def rescan(self, path):
+        """Rescan one folder and return the change events it produced.
+
+        New subfolders are scanned recursively and vanished ones are
+        dropped together with everything below them.
+        """
+        events = []
+        with self._lock:
+            if os.path.isdir(path):
+                self._rescan_folder(path, events)
+            else:
+                self._drop_tree(self.folder_key(path), events)
+            if events:
+                self.version += 1
+                self.updated_at = time.time()
+        return events
+
+    def _scan_tree(self, path, events):
+        folder = scan_folder(path)
+        if folder is None:
+            return
+        key = self.folder_key(path)
+        self.folders[key] = folder
+        events.append({'event': 'folder_added', 'folder': key,
+                       'audio': list(folder['audio']), 'text': list(folder['text'])})
+        for name in folder['dirs']:
+            self._scan_tree(os.path.join(path, name), events)
+
+    def _drop_tree(self, key, events):
+        for folder_key in [k for k in self.folders if k.startswith(key)]:
+            del self.folders[folder_key]
+            events.append({'event': 'folder_removed', 'folder': folder_key})
+
+    def _rescan_folder(self, path, events):
+        key = self.folder_key(path)
+        old = self.folders.get(key)
+        new = scan_folder(path)
+        if new is None:
+            self._drop_tree(key, events)
+            return
+        if old is None:
+            self._scan_tree(path, events)
+            return
+
+        self.folders[key] = new
+        for kind in ('audio', 'text'):
+            old_names, new_names = set(old[kind]), set(new[kind])
+            for name in sorted(new_names - old_names):
+                events.append({'event': f'{kind}_added', 'folder': key, 'file': name})
+            for name in sorted(old_names - new_names):
+                events.append({'event': f'{kind}_removed', 'folder': key, 'file': name})
+
+        old_dirs, new_dirs = set(old['dirs']), set(new['dirs'])
+        for name in sorted(new_dirs - old_dirs):
+            self._scan_tree(os.path.join(path, name), events)
+        for name in sorted(old_dirs - new_dirs):
+            self._drop_tree(f'{key}{name}/', events)
+
+class EventBroker:
+    """Fan out change events to any number of subscribers.
+
+    Each event gets a monotonically increasing id, and the most recent
+    events are kept so a reconnecting client can resume from its
+    Last-Event-ID. Subscribers that stop reading are dropped rather than
+    allowed to grow without bound.
+    """
+
+    def __init__(self, history_size=256, queue_size=1024):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._queue_size = queue_size
+        self._next_id = 1
+
+    def publish(self, events):
+        with self._lock:
+            for event in events:
+                item = (self._next_id, event)
+                self._next_id += 1
+                self._history.append(item)
+                for subscriber in list(self._subscribers):
+                    try:
+                        subscriber.put_nowait(item)
+                    except queue.Full:
+                        # Too far behind: make room for the drop marker
+                        self._subscribers.discard(subscriber)
+                        try:
+                            subscriber.get_nowait()
+                        except queue.Empty:
+                            pass
+                        subscriber.put_nowait(None)
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber queue, replaying events after last_event_id.
+
+        A None item in the queue means the subscriber was dropped.
+        """
+        subscriber = queue.Queue(maxsize=self._queue_size + len(self._history))
+        with self._lock:
+            if last_event_id is not None:
+                for item in self._history:
+                    if item[0] > last_event_id:
+                        subscriber.put_nowait(item)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+def format_sse(event_id, event):
+    """Encode one event as a Server-Sent Events message."""
+    data = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+    return f"id: {event_id}\nevent: {event['event']}\ndata: {data}\n\n".encode()
+
+class InotifyBackend:
+    """Recursive directory watch on top of the Linux inotify API."""
+
+    def __init__(self, book_path):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError('libc not found')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watches = {}
+        self.add_tree(book_path)
+
+    def add_tree(self, path):
+        for dirpath, _, _ in os.walk(path):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd >= 0:
+                self._watches[wd] = dirpath
+
+    def wait(self, timeout):
+        """Return the set of directories touched within timeout seconds.
+
+        Returns None when the kernel queue overflowed and a full rescan is
+        needed.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_len]
+            offset += _EVENT_HEADER.size + name_len
+            if mask & IN_Q_OVERFLOW:
+                return None
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.add(os.path.dirname(directory))
+                continue
+            changed.add(directory)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(os.path.join(directory, os.fsdecode(name.rstrip(b'\0'))))
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+class PollingBackend:
+    """Portable fallback that compares directory mtimes on an interval."""
+
+    def __init__(self, book_path, interval=POLL_INTERVAL):
+        self._book_path = book_path
+        self._interval = interval
+        self._mtimes = self._collect()
+        self._stop = threading.Event()
+
+    def _collect(self):
+        mtimes = {}
+        for dirpath, _, _ in os.walk(self._book_path):
+            try:
+                mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+        return mtimes
+
+    def wait(self, timeout):
+        # Changes are only seen by polling, so a shorter timeout just means
+        # walking the tree more often; every wait lasts one interval
+        if self._stop.wait(self._interval):
+            return set()
+        current = self._collect()
+        changed = {path for path, mtime in current.items() if self._mtimes.get(path) != mtime}
+        # A vanished directory is reported through its parent
+        changed.update(os.path.dirname(path) for path in self._mtimes if path not in current)
+        self._mtimes = current
+        return changed
+
+    def close(self):
+        self._stop.set()
+
+class BookWatcher(threading.Thread):
+    """Background thread that keeps a BookIndex current and publishes changes."""
+
+    def __init__(self, index, broker, use_inotify=True, on_change=None):
+        super().__init__(name='book-watcher', daemon=True)
+        self.index = index
+        self.broker = broker
+        self.on_change = on_change
+        self._stop_event = threading.Event()
+        self.backend = None
+        if use_inotify:
+            try:
+                self.backend = InotifyBackend(index.book_path)
+            except (OSError, AttributeError):
+                self.backend = None
+        if self.backend is None:
+            self.backend = PollingBackend(index.book_path)
+
+    @property
+    def backend_name(self):
+        return 'inotify' if isinstance(self.backend, InotifyBackend) else 'polling'
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            changed = self.backend.wait(0.5)
+            if changed is None:
+                self._handle_full_rescan()
+                continue
+            if not changed:
+                continue
+            # Collect the rest of a burst (e.g. a multi-file copy)
+            while True:
+                more = self.backend.wait(DEBOUNCE_SECONDS)
+                if not more:
+                    break
+                changed.update(more)
+            if more is None:
+                # The queue overflowed mid-burst; the changes seen so far are incomplete
+                self._handle_full_rescan()
+                continue
+            self._handle_changes(changed)
+        self.backend.close()
+
+    def _handle_changes(self, changed):
+        events = []
+        # Parents first, so new subtrees are scanned once
+        for path in sorted(changed, key=len):
+            if path != self.index.book_path and not path.startswith(self.index.book_path + os.sep):
+                continue
+            events.extend(self.index.rescan(path))
+        if events:
+            self.broker.publish(events)
+            if self.on_change:
+                self.on_change(events)
+
+    def _handle_full_rescan(self):
+        self.index.build()
+        events = [{'event': 'resync', 'folder': self.index.folder_key(self.index.book_path)}]
+        self.broker.publish(events)
+        if self.on_change:
+            self.on_change(events)
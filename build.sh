@@ -5,22 +5,33 @@ echo "Building book structure for static deployment..."
 # Generate the book structure JSON
 python3 generate_book_structure.py
 
-# Generate the character data JSON
-python3 -c "
-import json
-exec(open('section_characters.py').read())
-with open('section_characters.json', 'w', encoding='utf-8') as f:
-    json.dump(section_characters, f, indent=2, ensure_ascii=False)
-print('Generated section_characters.json')
-"
+# Generate the character data JSON (and per-speaker stats) from the dialogue
+python3 section_characters.py
+
+# Build the full-text search index used by /api/search (incremental)
+python3 search_index.py
+
+# Index line offsets so /api/text can serve utterance ranges (incremental)
+python3 text_offsets.py
+
+# Fingerprint assets (asset-map.json) so browsers can cache them for good
+python3 asset_fingerprints.py
+
+# Write .gz/.br siblings so server.py can serve precompressed assets
+python3 compress_assets.py
 
 echo "Build complete!"
 echo "Files ready for deployment:"
 echo "- index.html"
 echo "- script.js"
 echo "- styles.css"
-echo "- book-structure.json"
+echo "- book-structure.json (and book-structure-bookN.json for further books)"
+echo "- books.json"
+echo "- book-manifests.json"
 echo "- section_characters.json"
-echo "- book1/ (entire directory)"
+echo "- section_stats.json"
+echo "- asset-map.json"
+echo "- vercel.json"
+echo "- book1/, book2/, ... (entire directories)"
 echo ""
 echo "Make sure to deploy all these files to Vercel."
\ No newline at end of file
@@ -1,28 +1,237 @@
+#!/usr/bin/env python3
+"""
+Find and remove duplicate audio takes in the book directory.
+
+Duplicates are found by content, not by name: files are grouped by size,
+then by a hash of their first and last 64 KiB, and only files that still
+collide are hashed in full. Hashing runs on a thread pool, and every hash
+is cached in .audio_hash_cache.json keyed by path, size and mtime, so
+repeat runs only read new or changed files.
+
+The default is a dry run that only reports the duplicates. With --delete
+every duplicate except one keeper per group is removed, the affected
+audio_manifest.json files are rewritten, and the removals are recorded
+in the deletion history. The keeper is the file book-structure.json
+references, otherwise the shortest name, otherwise the oldest file.
+
+Usage:
+    python3 clean-old.py [--book-path BOOK_PATH] [--jobs N] [--delete] [--json]
+"""
+
 import os
-import subprocess
-import sys
+import json
+import hashlib
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional
+
+from book_scanner import book_to_structure, scan_book
+from deletion_journal import DeletionJournal
+from update_audio_manifest import write_json_atomic
+
+HASH_CACHE_FILE = '.audio_hash_cache.json'
+PARTIAL_BYTES = 64 * 1024
+CHUNK_BYTES = 1024 * 1024
+
+class HashCache:
+    """Persistent partial/full hashes keyed by path, validated by size and mtime."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._dirty = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def lookup(self, file: Dict, kind: str) -> Optional[str]:
+        entry = self.entries.get(file['path'])
+        if entry and entry['size'] == file['size'] and entry['mtime_ns'] == file['mtime_ns']:
+            return entry.get(kind)
+        return None
+
+    def store(self, file: Dict, kind: str, digest: str):
+        entry = self.entries.get(file['path'])
+        if not entry or entry['size'] != file['size'] or entry['mtime_ns'] != file['mtime_ns']:
+            entry = {'size': file['size'], 'mtime_ns': file['mtime_ns']}
+            self.entries[file['path']] = entry
+        entry[kind] = digest
+        self._dirty = True
+
+    def save(self, live_paths):
+        for path in set(self.entries) - set(live_paths):
+            del self.entries[path]
+            self._dirty = True
+        if not self._dirty:
+            return
+        write_json_atomic(Path(self.path), self.entries)
+        self._dirty = False
+
+def partial_hash(path: str, size: int) -> str:
+    """Hash the first and last PARTIAL_BYTES of a file."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_BYTES))
+        if size > 2 * PARTIAL_BYTES:
+            f.seek(-PARTIAL_BYTES, os.SEEK_END)
+            digest.update(f.read(PARTIAL_BYTES))
+    return digest.hexdigest()
+
+def full_hash(path: str, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
+def refine(groups: List[List[Dict]], kind: str, hasher, cache: HashCache, jobs: int) -> List[List[Dict]]:
+    """Split candidate groups by a hash, keeping only groups that still collide."""
+    todo = [file for group in groups for file in group if cache.lookup(file, kind) is None]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        digests = executor.map(lambda file: hasher(file['full_path'], file['size']), todo)
+        for file, digest in zip(todo, digests):
+            cache.store(file, kind, digest)
 
-def clean_files(root_path: str, pattern = "main"):
-    for dirpath, _, filenames in os.walk(root_path):
-        counterparts = {f for f in filenames if f.endswith(".mp3") and f"{pattern}_1" in f}
+    refined = []
+    for group in groups:
+        by_digest = defaultdict(list)
+        for file in group:
+            by_digest[cache.lookup(file, kind)].append(file)
+        refined.extend(files for files in by_digest.values() if len(files) > 1)
+    return refined
 
-        if not counterparts:
+def find_duplicates(book, cache: HashCache, jobs: int = 4) -> List[List[Dict]]:
+    """Return groups of byte-identical audio files (each group has 2+ files)."""
+    by_size = defaultdict(list)
+    for folder in book.folders:
+        for name in folder.audio_files:
+            full_path = os.path.join(folder.path, name)
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            by_size[st.st_size].append({
+                'path': f"{folder.rel_path}/{name}",
+                'full_path': full_path,
+                'folder': folder.path,
+                'name': name,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+            })
+
+    candidates = [group for size, group in by_size.items() if size > 0 and len(group) > 1]
+    candidates = refine(candidates, 'partial', partial_hash, cache, jobs)
+    duplicates = refine(candidates, 'full', full_hash, cache, jobs)
+
+    live_paths = [file['path'] for group in by_size.values() for file in group]
+    cache.save(live_paths)
+    return duplicates
+
+def choose_keeper(group: List[Dict], referenced: set) -> Dict:
+    return min(group, key=lambda file: (file['path'] not in referenced, len(file['name']),
+                                        file['mtime_ns'], file['path']))
+
+def remove_duplicates(plan: List[Dict], journal: Optional[DeletionJournal],
+                      verbose: bool = True) -> List[str]:
+    """Delete the planned files and drop them from their folders' manifests."""
+    log = print if verbose else (lambda *_: None)
+    removed = []
+    by_folder = defaultdict(list)
+    for file in plan:
+        try:
+            os.remove(file['full_path'])
+        except OSError as e:
+            print(f"Warning: Could not delete {file['path']}: {e}")
+            continue
+        log(f"Deleted duplicate: {file['path']}")
+        removed.append(file['path'])
+        by_folder[file['folder']].append(file['name'])
+
+    for folder, names in by_folder.items():
+        manifest_path = Path(folder) / 'audio_manifest.json'
+        if not manifest_path.exists():
             continue
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            write_json_atomic(manifest_path, [name for name in manifest if name not in names])
+            log(f"Updated {manifest_path}")
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not update {manifest_path}: {e}")
+
+    if journal is not None and removed:
+        journal.record_many(removed, "duplicate")
+        journal.close()
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Find duplicate audio files by content',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('--book-path', type=Path, default=Path('book1'),
+                        help='Path to the book directory (default: ./book1)')
+    parser.add_argument('--jobs', '-j', type=int, default=4,
+                        help='Hashing threads (default: 4)')
+    parser.add_argument('--delete', action='store_true',
+                        help='Remove duplicates instead of only reporting them')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the report as JSON')
+    args = parser.parse_args()
+
+    book_path = args.book_path.resolve()
+    site_root = str(book_path.parent)
+    book = scan_book(str(book_path), site_root)
+    if book is None:
+        print(f"Error: Book path {book_path} does not exist")
+        return 1
+
+    structure = book_to_structure(book)
+    referenced = {chapter['audioFile'] for chapter in structure['chapters']}
+    referenced |= {section['audioFile'] for chapter in structure['chapters'] for section in chapter['sections']}
+
+    cache = HashCache(os.path.join(site_root, HASH_CACHE_FILE))
+    groups = find_duplicates(book, cache, max(args.jobs, 1))
+
+    report = []
+    plan = []
+    for group in sorted(groups, key=lambda g: min(file['path'] for file in g)):
+        keeper = choose_keeper(group, referenced)
+        extra = sorted((file for file in group if file is not keeper), key=lambda file: file['path'])
+        plan.extend(extra)
+        report.append({
+            'size': keeper['size'],
+            'sha256': cache.lookup(keeper, 'full'),
+            'keep': keeper['path'],
+            'remove': [file['path'] for file in extra],
+        })
 
-        for filename in filenames:
-            if filename.endswith(".mp3") and pattern in filename and f"{pattern}_1" not in filename:
-                # Generate the expected name of the counterpart file
-                expected_counterpart = filename.replace(f"{pattern}", f"{pattern}_1", 1)
+    removed = []
+    if args.delete and plan:
+        journal = DeletionJournal(os.path.join(site_root, 'deleted_files_history.json'))
+        removed = remove_duplicates(plan, journal, verbose=not args.json)
 
-                # Delete the candidate if its counterpart exists
-                if expected_counterpart in counterparts:
-                    file_to_delete = os.path.join(dirpath, filename)
-                    print(f"Deleting: {file_to_delete}")
-                    os.remove(file_to_delete)
+    if args.json:
+        print(json.dumps({'dry_run': not args.delete, 'groups': report, 'removed': removed},
+                         indent=2, ensure_ascii=False))
+        return 0
 
+    for entry in report:
+        print(f"Keep   {entry['keep']} ({entry['size']} bytes)")
+        for path in entry['remove']:
+            print(f"  dup  {path}")
+    wasted = sum(file['size'] for file in plan)
+    print(f"{len(report)} duplicate groups, {len(plan)} redundant files, {wasted / 1e6:.1f} MB")
+    if args.delete:
+        print(f"Removed {len(removed)} duplicate files")
+    elif plan:
+        print("Dry run: pass --delete to remove the duplicates")
+    return 0
 
 if __name__ == '__main__':
-    target_directory = 'book1'
-    # clean_files(target_directory)
\ No newline at end of file
+    exit(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Precompress static text assets for the Economics Book Website
+
+Writes a .gz sibling (and a .br sibling when the brotli package is
+installed) next to every text asset, so server.py can pick an encoding per
+request from Accept-Encoding without compressing on the fly. Siblings that
+are already newer than their source are left alone, and assets that do not
+get smaller are skipped.
+
+Usage:
+    python3 compress_assets.py [--root ROOT] [--no-brotli] [--force]
+"""
+
+import os
+import gzip
+import argparse
+from pathlib import Path
+from typing import Iterator, List
+
+from book_scanner import DEFAULT_BOOK, discover_books, structure_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Top-level assets served by the viewer
+ROOT_ASSETS = ['index.html', 'script.js', 'styles.css',
+               'book-structure.json', 'book-manifests.json', 'section_characters.json',
+               'section_stats.json', 'asset-map.json', 'books.json']
+
+# Text assets inside the book directories
+TEXT_EXTENSIONS = {'.txt', '.json'}
+
+# Files smaller than this are not worth a second request path
+MIN_SIZE = 256
+
+def iter_text_assets(root: Path) -> Iterator[Path]:
+    """Yield every text asset that should get precompressed siblings."""
+    for name in ROOT_ASSETS:
+        path = root / name
+        if path.is_file():
+            yield path
+
+    for book in discover_books(str(root)):
+        path = root / structure_file(book)
+        if book != DEFAULT_BOOK and path.is_file():
+            yield path
+        for dirpath, _, filenames in os.walk(root / book):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() in TEXT_EXTENSIONS:
+                    yield Path(dirpath) / filename
+
+def is_fresh(source: Path, sibling: Path) -> bool:
+    """Check whether a compressed sibling is at least as new as its source."""
+    try:
+        return sibling.stat().st_mtime_ns >= source.stat().st_mtime_ns
+    except OSError:
+        return False
+
+def write_sibling(source: Path, suffix: str, data: bytes, compressed: bytes) -> bool:
+    """Write a compressed sibling atomically, or remove a useless one."""
+    sibling = source.with_name(source.name + suffix)
+    if len(compressed) >= len(data):
+        if sibling.exists():
+            sibling.unlink()
+        return False
+
+    tmp_path = sibling.with_name(sibling.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp_path, sibling)
+    # Keep the sibling's mtime in step with the source
+    stat = source.stat()
+    os.utime(sibling, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    return True
+
+def compress_asset(source: Path, use_brotli: bool = True, force: bool = False) -> List[str]:
+    """Write the compressed siblings of one asset.
+
+    Returns:
+        The suffixes ('.gz', '.br') that were (re)written
+    """
+    written = []
+    encoders = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if use_brotli and brotli is not None:
+        encoders.append(('.br', lambda data: brotli.compress(data, quality=11)))
+
+    data = None
+    for suffix, encode in encoders:
+        sibling = source.with_name(source.name + suffix)
+        if not force and is_fresh(source, sibling):
+            continue
+        if data is None:
+            data = source.read_bytes()
+        if len(data) < MIN_SIZE:
+            if sibling.exists():
+                sibling.unlink()
+            continue
+        if write_sibling(source, suffix, data, encode(data)):
+            written.append(suffix)
+    return written
+
+def compress_assets(root: Path, use_brotli: bool = True, force: bool = False) -> dict:
+    """Precompress every text asset under root."""
+    stats = {'assets': 0, 'written': 0, 'unchanged': 0}
+    for source in iter_text_assets(root):
+        stats['assets'] += 1
+        written = compress_asset(source, use_brotli, force)
+        if written:
+            stats['written'] += len(written)
+        else:
+            stats['unchanged'] += 1
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write .gz/.br siblings for the static text assets',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument(
+        '--root',
+        type=Path,
+        default=Path(os.path.dirname(os.path.abspath(__file__))),
+        help='Site root directory (default: directory of this script)'
+    )
+    parser.add_argument(
+        '--no-brotli',
+        action='store_true',
+        help='Only write gzip siblings'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Rewrite siblings even when they are up to date'
+    )
+    args = parser.parse_args()
+
+    if not args.no_brotli and brotli is None:
+        print("brotli package not installed, writing gzip siblings only")
+
+    stats = compress_assets(args.root.resolve(), not args.no_brotli, args.force)
+    print(f"Compressed assets: {stats['assets']} checked, "
+          f"{stats['written']} siblings written, {stats['unchanged']} unchanged")
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
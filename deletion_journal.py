@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Append-only journal for the history of deleted audio files.
+
+Recording a deletion appends one JSON line to deleted_files_history.jsonl
+under an exclusive file lock, which is O(1) regardless of how long the
+history is and safe against concurrent writers (threads of the server or
+other processes). The journal is periodically compacted into
+deleted_files_history.json, in the same {path: {deleted_at, reason}}
+format the frontend already reads, and then truncated. A restored file
+is journaled as {"path": ..., "restored": true} and drops out of the
+history.
+
+On startup the compacted JSON is loaded once and the journal is replayed
+on top of it. A partially written last line (e.g. after a crash) is
+ignored.
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+# Compact after this many appends, or this many seconds after the first one
+COMPACT_EVERY = 50
+COMPACT_DELAY = 5.0
+
+class DeletionJournal:
+    """In-memory view of the deletion history backed by an append-only journal."""
+
+    def __init__(self, history_path, journal_path=None,
+                 compact_every=COMPACT_EVERY, compact_delay=COMPACT_DELAY):
+        self.history_path = history_path
+        self.journal_path = journal_path or os.path.splitext(history_path)[0] + '.jsonl'
+        self.compact_every = compact_every
+        self.compact_delay = compact_delay
+        self._history = {}
+        self._offset = 0
+        self._pending = 0
+        self._timer = None
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Load the compacted history and replay the journal on top of it."""
+        with self._lock:
+            self._history = {}
+            self._offset = 0
+            if os.path.exists(self.history_path):
+                try:
+                    with open(self.history_path, 'r', encoding='utf-8') as f:
+                        history = json.load(f)
+                    if isinstance(history, dict):
+                        self._history = history
+                except (json.JSONDecodeError, IOError) as e:
+                    print(f"Warning: Could not read deletion history: {e}")
+            with self._locked_journal(exclusive=False) as journal:
+                if journal is not None:
+                    self._pending = self._replay(journal)
+        # Entries left over from the last run go into the JSON file now
+        if self._pending:
+            self.compact()
+
+    def history(self):
+        """Return a copy of the current history dict."""
+        with self._lock:
+            return dict(self._history)
+
+    def is_deleted(self, file_path):
+        with self._lock:
+            return file_path in self._history
+
+    def record(self, file_path, reason="user_deleted"):
+        """Record a single deletion."""
+        self.record_many([file_path], reason)
+
+    def record_many(self, file_paths, reason="user_deleted"):
+        """Record several deletions with one journal append.
+
+        Returns:
+            The entries that changed, as _append() returns them
+        """
+        deleted_at = datetime.now().isoformat()
+        return self._append([{'path': path, 'deleted_at': deleted_at, 'reason': reason} for path in file_paths])
+
+    def apply(self, deleted, restored=()):
+        """Record deletions and restores from the viewer with one journal append.
+
+        Args:
+            deleted: {path: entry}; deleted_at and reason default to now and
+                     'user_deleted', other fields (e.g. name) are kept
+            restored: Paths to drop from the history
+
+        Returns:
+            The entries that changed, as _append() returns them
+        """
+        deleted_at = datetime.now().isoformat()
+        entries = [dict(entry, path=path, deleted_at=entry.get('deleted_at') or deleted_at,
+                        reason=entry.get('reason') or 'user_deleted')
+                   for path, entry in deleted.items()]
+        entries.extend({'path': path, 'restored': True} for path in restored)
+        return self._append(entries)
+
+    def _append(self, entries):
+        """Journal entries and apply them to the history.
+
+        Returns:
+            {path: entry, or None if restored} for every path that changed,
+            including lines from other processes replayed on the way
+        """
+        if not entries:
+            return {}
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries).encode('utf-8')
+
+        changed = set()
+        with self._lock:
+            with self._locked_journal(exclusive=True) as journal:
+                # Pick up lines appended by other processes first
+                self._pending += self._replay(journal, changed)
+                journal.seek(0, os.SEEK_END)
+                if journal.tell() > self._offset:
+                    # Terminate a torn line left by a crashed writer so it
+                    # cannot swallow this entry
+                    data = b'\n' + data
+                journal.write(data)
+                journal.flush()
+                os.fsync(journal.fileno())
+                self._offset = journal.tell()
+            for entry in entries:
+                changed.add(self._apply(entry))
+            self._pending += len(entries)
+
+            if self._pending >= self.compact_every:
+                self.compact()
+            elif self._timer is None and self.compact_delay is not None:
+                self._timer = threading.Timer(self.compact_delay, self.compact)
+                self._timer.daemon = True
+                self._timer.start()
+            return {path: dict(self._history[path]) if path in self._history else None
+                    for path in changed}
+
+    def compact(self):
+        """Fold the journal into the JSON history file and truncate it."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            with self._locked_journal(exclusive=True) as journal:
+                self._replay(journal)
+                if os.fstat(journal.fileno()).st_size == 0:
+                    self._pending = 0
+                    return
+                tmp_path = self.history_path + '.tmp'
+                try:
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump(self._history, f, indent=2, ensure_ascii=False)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.history_path)
+                except IOError as e:
+                    print(f"Warning: Could not save deletion history: {e}")
+                    return
+                journal.truncate(0)
+                self._offset = 0
+                self._pending = 0
+
+    def close(self):
+        """Compact any pending entries; call on shutdown."""
+        self.compact()
+
+    def _merge_history_file(self, changed=None):
+        """Take over the history another process's compaction wrote.
+
+        The file holds everything journaled before that compaction, ours
+        included, so it replaces the history; paths that dropped out were
+        restored there and are reported as changed too.
+        """
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return
+        if not isinstance(history, dict):
+            return
+        if changed is not None:
+            changed.update(path for path in self._history.keys() | history.keys()
+                           if self._history.get(path) != history.get(path))
+        self._history = history
+
+    def _apply(self, entry):
+        """Apply one journal entry and return its path."""
+        if entry.get('restored'):
+            self._history.pop(entry['path'], None)
+            return entry['path']
+        self._history[entry['path']] = {key: value for key, value in entry.items() if key != 'path'}
+        self._history[entry['path']].setdefault('reason', 'user_deleted')
+        return entry['path']
+
+    def _replay(self, journal, changed=None):
+        """Apply journal lines after the last known offset.
+
+        Args:
+            changed: Optional set that collects the paths of applied entries
+
+        Returns:
+            The number of entries applied
+        """
+        journal.seek(0, os.SEEK_END)
+        if journal.tell() < self._offset:
+            # Truncated by another process's compaction, which already
+            # folded everything into the JSON file
+            self._offset = 0
+            self._merge_history_file(changed)
+        journal.seek(self._offset)
+        applied = 0
+        for line in journal:
+            if not line.endswith(b'\n'):
+                break  # incomplete write; leave it for later
+            self._offset += len(line)
+            try:
+                path = self._apply(json.loads(line))
+                applied += 1
+            except (ValueError, KeyError, TypeError):
+                continue
+            if changed is not None:
+                changed.add(path)
+        return applied
+
+    def _locked_journal(self, exclusive):
+        return _LockedFile(self.journal_path, exclusive)
+
+class _LockedFile:
+    """Open the journal for reading and appending under an flock."""
+
+    def __init__(self, path, exclusive):
+        self.path = path
+        self.exclusive = exclusive
+        self.file = None
+
+    def __enter__(self):
+        if not self.exclusive and not os.path.exists(self.path):
+            return None
+        self.file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self.file
+
+    def __exit__(self, *exc_info):
+        if self.file is not None:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self.file.close()
+        return False
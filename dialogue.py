@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Helpers for the book's dialogue text files.
+
+Every section is written one utterance per line in "Speaker: text" form;
+chapter, synopsis and introduction files are plain prose. The helpers
+here split speakers from utterances, fold Spanish text for matching
+(lowercase, accents and ñ removed), and list the text documents of a
+scanned Book.
+"""
+
+import os
+import re
+import unicodedata
+from typing import Iterator, List, Optional, Tuple
+
+# A speaker label is a short name: at most this many words and characters
+MAX_SPEAKER_WORDS = 5
+MAX_SPEAKER_LENGTH = 40
+
+# Lowercase words that may appear inside a personal name
+NAME_PARTICLES = {'de', 'del', 'la', 'las', 'los', 'y', 'da', 'di', 'do', 'dos', 'van', 'von', 'der', 'le'}
+
+_SPEAKER_RE = re.compile(r"^\s*([^\W\d_][^:\n]*?)\s*:\s+(.*)$")
+_WORD_RE = re.compile(r"\w+")
+
+def split_speaker(line: str) -> Tuple[Optional[str], str]:
+    """Split a "Speaker: text" line into (speaker, text).
+
+    Lines that do not start with a plausible speaker label are returned
+    as (None, line).
+    """
+    match = _SPEAKER_RE.match(line)
+    if match:
+        speaker = match.group(1)
+        if len(speaker) <= MAX_SPEAKER_LENGTH and len(speaker.split()) <= MAX_SPEAKER_WORDS \
+                and not any(ch in speaker for ch in '.,;¿?¡!()"«»'):
+            return speaker, match.group(2)
+    return None, line.strip()
+
+def is_name_like(speaker: str) -> bool:
+    """Check whether a speaker label looks like a name ('Friedrich von Hayek').
+
+    Role labels such as 'Miembro de la audiencia' are not name-like, and
+    neither is a sentence that happens to end in a colon.
+    """
+    return all(word[0].isupper() or word in NAME_PARTICLES for word in speaker.split())
+
+def fold(text: str) -> str:
+    """Lowercase text and strip accents, so 'Economía' matches 'economia'."""
+    decomposed = unicodedata.normalize('NFD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """Split text into (folded_token, start, end) with offsets into text."""
+    return [(fold(match.group()), match.start(), match.end()) for match in _WORD_RE.finditer(text)]
+
+def section_id(rel_path: str) -> str:
+    """'book1/C1/S1' -> 'C1/S1', the id used by section_characters.json."""
+    return rel_path.split('/', 1)[1] if '/' in rel_path else rel_path
+
+def book_text_documents(book) -> Iterator[Tuple[str, str, str]]:
+    """Yield (rel_path, full_path, section_id) for every text document of a Book.
+
+    These are the introduction.txt, chapter.txt, main.txt and sinopsis.txt
+    files; title.txt and description.txt are metadata, not content.
+    """
+    for folder in book.folders:
+        rel_path = folder.text_file
+        name = rel_path.rsplit('/', 1)[1]
+        if name in folder.text_files:
+            yield rel_path, os.path.join(folder.path, name), section_id(folder.rel_path)
+
+def read_lines(path: str) -> List[str]:
+    """Read a text document as a list of NFC-normalised lines."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [unicodedata.normalize('NFC', line.rstrip('\r\n')) for line in f]
@@ -1,158 +1,158 @@
 #!/usr/bin/env python3
 """
-Generate a static book structure JSON file from the book1 directory.
+Generate static book structure JSON files from the book directories.
 Run this script to create book-structure.json for static hosting.
+
+Every bookN/ directory in the site root is scanned. The default book's
+structure is written to book-structure.json, which the viewer loads;
+other books go to book-structure-bookN.json. books.json lists every book
+with its title and structure file, and book-manifests.json bundles the
+manifests of all books.
+
+Each structure embeds duration and bitrate of every audio file under
+"audioIndex", read through the persistent index in .audio_index.json,
+and names the asset map with fingerprinted URLs under "assetMap" (see
+asset_fingerprints.py).
+
+Scan results are kept in .book_scan_cache.json, so a rebuild only lists
+the folders whose mtime changed and only re-reads titles and descriptions
+that changed. Pass --no-cache to scan everything from scratch. Output
+files are only rewritten when their content changes.
 """
 
 import os
+import sys
 import json
 
-def read_file_content(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except:
-        return None
+from book_scanner import (ScanCache, book_to_manifests, book_to_structure, discover_books,
+                          scan_book, structure_file)
+from asset_fingerprints import ASSET_MAP_FILE
+from mp3_metadata import INDEX_FILE as AUDIO_INDEX_FILE, AudioIndex, book_audio_files, public_metadata
 
-def find_audio_file(directory):
-    audio_extensions = ['.mp3', '.wav', '.ogg', '.m4a']
-    
-    try:
-        for file in os.listdir(directory):
-            for ext in audio_extensions:
-                if file.lower().endswith(ext):
-                    rel_path = os.path.relpath(os.path.join(directory, file), 
-                                             os.path.dirname(os.path.abspath(__file__)))
-                    return rel_path.replace('\\', '/')
-    except:
-        pass
-    return None
+BOOKS_FILE = 'books.json'
+MANIFESTS_FILE = 'book-manifests.json'
+SCAN_CACHE_FILE = '.book_scan_cache.json'
 
-def generate_book_structure():
+def scan(use_cache=True):
+    """Scan every book directory with one shared scan cache.
+
+    Returns:
+        The Books in numeric order (empty if there are none)
+    """
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    book_path = os.path.join(script_dir, 'book1')
-    
-    if not os.path.exists(book_path):
-        print(f"Error: book1 directory not found at {book_path}")
-        return None
+    names = discover_books(script_dir)
+    if not names:
+        print(f"Error: no book directories (book1, book2, ...) found in {script_dir}")
+        return []
     
-    book_structure = {
-        "title": "Economía Conversada",
-        "chapters": []
-    }
+    cache = ScanCache.load(os.path.join(script_dir, SCAN_CACHE_FILE)) if use_cache else None
+    books = []
+    for name in names:
+        book = scan_book(os.path.join(script_dir, name), script_dir, cache=cache)
+        if book is not None:
+            books.append(book)
     
-    # First, handle the Introduction if it exists
-    intro_path = os.path.join(book_path, 'Intro')
-    if os.path.exists(intro_path) and os.path.isdir(intro_path):
-        intro_title = read_file_content(os.path.join(intro_path, 'title.txt'))
-        if not intro_title:
-            intro_title = "Introducción"
-        
-        intro_data = {
-            "id": "Intro",
-            "title": intro_title,
-            "textFile": "book1/Intro/introduction.txt",
-            "audioFile": find_audio_file(intro_path),
-            "sections": []
-        }
-        book_structure["chapters"].append(intro_data)
-        print(f"Added Introduction: {intro_title}")
-    
-    # Get all chapter directories (C1, C2, etc.)
+    if cache is not None:
+        # Saved once, after every book was seen, so no book's entries are dropped
+        cache.save()
+        print(f"Scan cache: {cache.hits} folders unchanged, {cache.misses} rescanned")
+    return books
+
+def write_if_changed(path, data):
+    """Write bytes to path unless the file already holds exactly them.
+
+    Returns:
+        True if the file was written
+    """
     try:
-        chapter_dirs = [d for d in os.listdir(book_path) 
-                       if os.path.isdir(os.path.join(book_path, d)) and d.startswith('C')]
-        chapter_dirs.sort(key=lambda x: int(x[1:]) if x[1:].isdigit() else 0)
-    except:
-        print(f"Error: Could not read book1 directory")
-        return None
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
     
-    for chapter_dir in chapter_dirs:
-        chapter_path = os.path.join(book_path, chapter_dir)
-        
-        # Read chapter title
-        chapter_title = read_file_content(os.path.join(chapter_path, 'title.txt'))
-        if not chapter_title:
-            chapter_title = f"Capítulo {chapter_dir[1:]}"
-        
-        chapter_data = {
-            "id": chapter_dir,
-            "title": chapter_title,
-            "textFile": f"book1/{chapter_dir}/chapter.txt",
-            "audioFile": find_audio_file(chapter_path),
-            "sections": []
-        }
-        
-        # Get all section directories (S1, S2, etc.) and SINOPSIS
-        try:
-            section_dirs = [d for d in os.listdir(chapter_path)
-                           if os.path.isdir(os.path.join(chapter_path, d)) and 
-                           (d.startswith('S') or d == 'SINOPSIS')]
-            
-            # Sort sections: S1, S2, etc. first, then SINOPSIS last
-            def sort_sections(section):
-                if section.startswith('S') and section[1:].isdigit():
-                    return (0, int(section[1:]))  # Regular sections by number
-                elif section == 'SINOPSIS':
-                    return (1, 0)  # SINOPSIS comes last
-                else:
-                    return (2, 0)  # Other sections at the end
-            
-            section_dirs.sort(key=sort_sections)
-        except:
-            section_dirs = []
-        
-        for section_dir in section_dirs:
-            section_path = os.path.join(chapter_path, section_dir)
-            
-            # Handle SINOPSIS specially
-            if section_dir == 'SINOPSIS':
-                section_title = read_file_content(os.path.join(section_path, 'title.txt'))
-                if not section_title:
-                    section_title = "Sinopsis"
-                
-                section_data = {
-                    "id": section_dir,
-                    "title": section_title,
-                    "textFile": f"book1/{chapter_dir}/{section_dir}/sinopsis.txt",
-                    "audioFile": find_audio_file(section_path),
-                    "description": None  # SINOPSIS doesn't have description.txt
-                }
-            else:
-                # Regular sections (S1, S2, etc.)
-                section_title = read_file_content(os.path.join(section_path, 'title.txt'))
-                if not section_title:
-                    section_title = f"Sección {section_dir[1:]}"
-                
-                section_data = {
-                    "id": section_dir,
-                    "title": section_title,
-                    "textFile": f"book1/{chapter_dir}/{section_dir}/main.txt",
-                    "audioFile": find_audio_file(section_path),
-                    "description": read_file_content(os.path.join(section_path, 'description.txt'))
-                }
-            
-            chapter_data["sections"].append(section_data)
-        
-        book_structure["chapters"].append(chapter_data)
-        print(f"Processed {chapter_dir}: {chapter_title} with {len(chapter_data['sections'])} sections")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+def generate_book_structure(book):
+    print(f"{book.root.name}: {book.title}")
+    for chapter in book.chapters:
+        if chapter.is_intro:
+            print(f"Added Introduction: {chapter.display_title}")
+        else:
+            print(f"Processed {chapter.name}: {chapter.display_title} with {len(chapter.sections)} sections")
     
-    return book_structure
+    return book_to_structure(book)
+
+def generate_audio_index(index, book):
+    """Return metadata for every audio file, parsing only new or changed ones."""
+    parsed = index.parsed
+    files = index.update(book_audio_files(book), prune=False)
+    print(f"Audio index: {len(files)} files, {index.parsed - parsed} parsed")
+    return {path: public_metadata(entry) for path, entry in sorted(files.items())}
+
+def generate_manifest_bundle(books):
+    """Collect every folder's audio and text manifest into one dict.
+
+    This is the static counterpart of server.py's /api/manifests, so the
+    viewer can load all manifests in a single request on static hosting.
+    Folder keys start with the book directory, so books never collide.
+    """
+    manifests = {}
+    for book in books:
+        manifests.update(book_to_manifests(book))
+    return manifests
+
+def write_json(path, data, compact=False):
+    """Serialize data and write it unless unchanged; returns True if written."""
+    if compact:
+        text = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    else:
+        text = json.dumps(data, indent=2, ensure_ascii=False)
+    return write_if_changed(path, text.encode('utf-8'))
 
 if __name__ == "__main__":
     print("Generating book structure...")
-    book_structure = generate_book_structure()
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    # One scan of every book feeds the structures and the manifest bundle
+    books = scan(use_cache='--no-cache' not in sys.argv[1:])
     
-    if book_structure:
-        output_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book-structure.json')
+    if books:
+        audio_index = AudioIndex.load(os.path.join(script_dir, AUDIO_INDEX_FILE))
+        listing = []
+        for book in books:
+            book_structure = generate_book_structure(book)
+            book_structure["audioIndex"] = generate_audio_index(audio_index, book)
+            book_structure["assetMap"] = ASSET_MAP_FILE
+            
+            name = structure_file(book.root.name)
+            output_file = os.path.join(script_dir, name)
+            if write_json(output_file, book_structure):
+                print(f"Book structure saved to: {output_file}")
+            else:
+                print(f"Book structure unchanged: {output_file}")
+            total_sections = sum(len(chapter['sections']) for chapter in book_structure['chapters'])
+            print(f"Found {len(book_structure['chapters'])} chapters, {total_sections} sections")
+            listing.append({"id": book.root.name, "title": book.title, "structure": name})
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(book_structure, f, indent=2, ensure_ascii=False)
+        # Drop entries of audio files that no longer exist in any book
+        audio_index.update(pair for book in books for pair in book_audio_files(book))
+        audio_index.save()
         
-        print(f"Book structure saved to: {output_file}")
-        print(f"Found {len(book_structure['chapters'])} chapters")
+        books_file = os.path.join(script_dir, BOOKS_FILE)
+        if write_json(books_file, {"books": listing}):
+            print(f"Book list saved to: {books_file} ({len(listing)} books)")
+        else:
+            print(f"Book list unchanged: {books_file}")
         
-        total_sections = sum(len(chapter['sections']) for chapter in book_structure['chapters'])
-        print(f"Total sections: {total_sections}")
+        manifests = generate_manifest_bundle(books)
+        manifests_file = os.path.join(script_dir, MANIFESTS_FILE)
+        if write_json(manifests_file, manifests, compact=True):
+            print(f"Manifest bundle saved to: {manifests_file} ({len(manifests)} folders)")
+        else:
+            print(f"Manifest bundle unchanged: {manifests_file}")
     else:
-        print("Failed to generate book structure")
\ No newline at end of file
+        print("Failed to generate book structure")
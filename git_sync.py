@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Batch changes to the shared review data into one git commit per interval.
+
+Committing every reviewer action on its own produces hundreds of commits
+per review session, each of which triggers a redeploy. With --git-sync,
+server.py instead queues the JSON merge patch of every change to the
+review files (see shared_data.py) and a background thread commits them
+together to a separate git checkout:
+
+- Each change is appended to .git_sync_queue.jsonl as one JSON line and
+  fsynced before the request returns, so nothing is lost if the server
+  crashes; a partially written last line is ignored.
+- Once the oldest queued change is --git-sync-interval seconds old, or
+  --git-sync-max-changes changes are queued, the checkout is reset to
+  the remote branch, the queued patches are applied to each file in
+  order, and the result is committed once and pushed.
+- Only after the push (or the commit, without a remote) are the changes
+  removed from the queue. The commit message records the last queue
+  sequence number ("Sync-Seq: N"), so changes that were committed just
+  before a crash are not committed twice.
+- A failed fetch, commit or push is retried with exponential backoff.
+  Because every attempt starts again from the remote branch, a push
+  rejected by someone else's commit simply succeeds on the next try.
+
+The checkout must be a clone used only for syncing (local changes in it
+are discarded), not the site root itself. A local bare repository works
+as the remote for testing:
+
+    git init --bare /tmp/review.git && git clone /tmp/review.git /tmp/review
+    python3 server.py --git-sync /tmp/review
+
+Usage (while the server is stopped):
+    python3 git_sync.py --repo DIR status    # show queued changes
+    python3 git_sync.py --repo DIR flush     # commit queued changes now
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+from typing import Dict, List, Optional
+
+from shared_data import merge_patch
+
+QUEUE_FILE = '.git_sync_queue.jsonl'
+
+DEFAULT_INTERVAL = 60.0
+DEFAULT_MAX_CHANGES = 100
+DEFAULT_REMOTE = 'origin'
+
+# Retries after a failure wait RETRY_BASE_DELAY, doubled each time up to RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 5.0
+RETRY_MAX_DELAY = 300.0
+
+GIT_TIMEOUT = 60
+AUTHOR_NAME = 'Review Sync'
+AUTHOR_EMAIL = 'review-sync@localhost'
+
+SEQ_TRAILER = 'Sync-Seq'
+SEQ_RE = re.compile(rf'^{SEQ_TRAILER}: (\d+)$', re.MULTILINE)
+
+class GitError(Exception):
+    """Raised when a git command fails or times out."""
+
+class SyncQueue:
+    """Crash-safe on-disk queue of merge patches, one JSON line per change.
+
+    Entries are {"seq", "file", "patch", "time"}. Dropping committed
+    entries rewrites the file atomically, starting with a
+    {"committed": N} line so that sequence numbers keep increasing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: List[Dict] = []
+        self._next_seq = 1
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        with self._lock:
+            self._entries = []
+            committed = 0
+            torn = False
+            try:
+                with open(self.path, 'rb') as f:
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            torn = True
+                            break  # incomplete write
+                        try:
+                            entry = json.loads(line)
+                            if 'committed' in entry:
+                                committed = max(committed, int(entry['committed']))
+                            else:
+                                self._entries.append({'seq': int(entry['seq']), 'file': entry['file'],
+                                                      'patch': entry['patch'], 'time': entry.get('time', 0)})
+                        except (ValueError, KeyError, TypeError):
+                            continue
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Warning: Could not read git sync queue: {e}")
+            self._entries = [entry for entry in self._entries if entry['seq'] > committed]
+            self._next_seq = max([committed] + [entry['seq'] for entry in self._entries]) + 1
+            if torn:
+                self._rewrite(committed)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def oldest_time(self) -> Optional[float]:
+        with self._lock:
+            return self._entries[0]['time'] if self._entries else None
+
+    def pending(self) -> List[Dict]:
+        with self._lock:
+            return list(self._entries)
+
+    def append(self, file: str, patch: Dict) -> int:
+        """Durably queue one change.
+
+        Returns:
+            Its sequence number
+        """
+        with self._lock:
+            entry = {'seq': self._next_seq, 'file': file, 'patch': patch, 'time': time.time()}
+            data = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries.append(entry)
+            self._next_seq += 1
+            return entry['seq']
+
+    def drop_through(self, seq: int):
+        """Remove every entry up to and including seq."""
+        with self._lock:
+            if seq < self._next_seq and (not self._entries or self._entries[0]['seq'] > seq):
+                return
+            self._entries = [entry for entry in self._entries if entry['seq'] > seq]
+            self._next_seq = max(self._next_seq, seq + 1)
+            self._rewrite(self._next_seq - 1 if not self._entries else self._entries[0]['seq'] - 1)
+
+    def _rewrite(self, committed: int):
+        lines = [json.dumps({'committed': committed})]
+        lines.extend(json.dumps(entry, ensure_ascii=False) for entry in self._entries)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+class GitSync:
+    """Commits queued review data changes to a git checkout in batches."""
+
+    def __init__(self, repo: str, queue: SyncQueue, remote: Optional[str] = DEFAULT_REMOTE,
+                 interval: float = DEFAULT_INTERVAL, max_changes: int = DEFAULT_MAX_CHANGES):
+        self.repo = os.path.abspath(repo)
+        self.queue = queue
+        self.interval = interval
+        self.max_changes = max_changes
+        self.commits = 0
+        self.failures = 0
+        self._retry_at: Optional[float] = None
+        self._stopping = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+
+        if not os.path.isdir(os.path.join(self.repo, '.git')):
+            raise GitError(f"{self.repo} is not a git checkout")
+        self.branch = self._git('symbolic-ref', '--short', 'HEAD').strip()
+        remotes = self._git('remote').split()
+        self.remote = remote if remote in remotes else None
+        # Keep sequence numbers above the last commit's if the queue file was removed
+        if not len(self.queue):
+            self.queue.drop_through(self._committed_seq())
+
+    def _git(self, *args, check: bool = True) -> str:
+        env = dict(os.environ, GIT_TERMINAL_PROMPT='0',
+                   GIT_AUTHOR_NAME=AUTHOR_NAME, GIT_AUTHOR_EMAIL=AUTHOR_EMAIL,
+                   GIT_COMMITTER_NAME=AUTHOR_NAME, GIT_COMMITTER_EMAIL=AUTHOR_EMAIL)
+        try:
+            proc = subprocess.run(['git', '-C', self.repo, *args], capture_output=True,
+                                  text=True, timeout=GIT_TIMEOUT, env=env)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise GitError(f"git {args[0]}: {e}")
+        if check and proc.returncode != 0:
+            output = (proc.stderr.strip() or proc.stdout.strip()).splitlines()
+            raise GitError(f"git {args[0]} failed: {output[0] if output else proc.returncode}")
+        return proc.stdout
+
+    def enqueue(self, file: str, patch: Dict):
+        """Queue a change to one review file; used as SharedStore.on_change."""
+        try:
+            self.queue.append(file, patch)
+        except OSError as e:
+            print(f"Warning: Could not queue change to {file} for git sync: {e}")
+            return
+        with self._cond:
+            self._cond.notify()
+
+    def flush(self) -> int:
+        """Commit and push every queued change now.
+
+        Returns:
+            The number of changes committed
+        """
+        with self._flush_lock:
+            entries = self.queue.pending()
+            if not entries:
+                return 0
+            if self.remote:
+                self._reset_to_remote()
+
+            # Changes committed just before a crash are already in the history
+            committed = self._committed_seq()
+            if committed >= entries[0]['seq']:
+                self.queue.drop_through(committed)
+                entries = [entry for entry in entries if entry['seq'] > committed]
+                if not entries:
+                    return 0
+
+            last_seq = entries[-1]['seq']
+            changed = self._apply(entries)
+            if changed:
+                self._git('add', '--', *changed)
+                summary = f"Sync review data: {len(entries)} change{'s' if len(entries) != 1 else ''} " \
+                          f"to {', '.join(changed)}"
+                self._git('commit', '-q', '-m', summary, '-m', f"{SEQ_TRAILER}: {last_seq}")
+                if self.remote:
+                    self._git('push', '-q', self.remote, f'HEAD:refs/heads/{self.branch}')
+                self.commits += 1
+            self.queue.drop_through(last_seq)
+            return len(entries)
+
+    def _reset_to_remote(self):
+        """Start from the remote branch, discarding unpushed commits."""
+        self._git('fetch', '-q', self.remote)
+        ref = f'refs/remotes/{self.remote}/{self.branch}'
+        if self._git('rev-parse', '--verify', '-q', ref, check=False).strip():
+            self._git('reset', '-q', '--hard', ref)
+
+    def _committed_seq(self) -> int:
+        message = self._git('log', '-1', '--format=%B', f'--grep=^{SEQ_TRAILER}: ', check=False)
+        match = SEQ_RE.search(message)
+        return int(match.group(1)) if match else 0
+
+    def _apply(self, entries: List[Dict]) -> List[str]:
+        """Apply the patches to the files in the checkout.
+
+        Returns:
+            The files whose content changed
+        """
+        patches: Dict[str, List[Dict]] = {}
+        for entry in entries:
+            patches.setdefault(entry['file'], []).append(entry['patch'])
+
+        changed = []
+        for file, file_patches in patches.items():
+            path = os.path.join(self.repo, file)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    original = json.load(f)
+            except FileNotFoundError:
+                original = {}
+            except (OSError, ValueError) as e:
+                raise GitError(f"Could not read {file} in {self.repo}: {e}")
+            data = json.loads(json.dumps(original))
+            for patch in file_patches:
+                data = merge_patch(data, patch)
+            if data == original and os.path.exists(path):
+                continue
+            tmp_path = path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                raise GitError(f"Could not write {file} in {self.repo}: {e}")
+            changed.append(file)
+        return changed
+
+    def _delay(self) -> Optional[float]:
+        """Seconds until the next flush is due, or None with nothing queued."""
+        oldest = self.queue.oldest_time()
+        if oldest is None:
+            return None
+        if self._retry_at is not None:
+            return self._retry_at - time.time()
+        if len(self.queue) >= self.max_changes:
+            return 0
+        return oldest + self.interval - time.time()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    delay = self._delay()
+                    if delay is not None and delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopping:
+                    return
+            self._flush_with_retry()
+
+    def _flush_with_retry(self):
+        try:
+            count = self.flush()
+        except GitError as e:
+            self.failures += 1
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (self.failures - 1))
+            self._retry_at = time.time() + delay
+            print(f"Warning: Git sync failed ({e}), retrying in {delay:g}s")
+            return
+        self.failures = 0
+        self._retry_at = None
+        if count:
+            print(f"Git sync: committed {count} change{'s' if count != 1 else ''} to {self.repo}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='git-sync', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the thread and make a last attempt to commit queued changes."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._retry_at is None:
+            self._flush_with_retry()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Commit queued review data changes to a git checkout',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('command', choices=['status', 'flush'])
+    parser.add_argument('--repo', required=True, help='Git checkout to commit to')
+    parser.add_argument('--remote', default=DEFAULT_REMOTE,
+                        help=f'Remote to push to, if the checkout has it (default: {DEFAULT_REMOTE})')
+    parser.add_argument('--queue', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), QUEUE_FILE),
+                        help=f'Queue file (default: {QUEUE_FILE} next to this script)')
+    args = parser.parse_args()
+
+    queue = SyncQueue(args.queue)
+    if args.command == 'status':
+        entries = queue.pending()
+        files: Dict[str, int] = {}
+        for entry in entries:
+            files[entry['file']] = files.get(entry['file'], 0) + 1
+        print(f"{len(entries)} queued changes")
+        for file, count in sorted(files.items()):
+            print(f"  {file}: {count}")
+        return 0
+
+    try:
+        sync = GitSync(args.repo, queue, args.remote)
+        count = sync.flush()
+    except GitError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Committed {count} change{'s' if count != 1 else ''}" + (f" and pushed to {sync.remote}" if sync.remote and count else ""))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Audio metadata index for the book's audio files (standard library only).
+
+For MP3 files the ID3v2 tag is skipped, the first MPEG frame header is
+decoded and, when present, the Xing/Info or VBRI header gives the frame
+count directly. Files without one are measured by streaming every frame
+header, which is exact for both CBR and VBR. WAV files are read with the
+wave module. Each entry records duration, bitrate, sample rate and
+channel mode.
+
+Results are kept in a persistent index (.audio_index.json) keyed by path
+and validated by size and mtime, so repeat runs only parse new or changed
+files.
+
+Usage:
+    python3 mp3_metadata.py [--book-path BOOK_PATH] [--index FILE] [FILE ...]
+"""
+
+import os
+import sys
+import json
+import mmap
+import wave
+import struct
+import argparse
+import threading
+from typing import Dict, Iterable, Optional
+
+INDEX_FILE = '.audio_index.json'
+
+# Bitrates in kbit/s, indexed by [table][bitrate index]
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Sample rates in Hz, by MPEG version
+_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+CHANNEL_MODES = ['stereo', 'joint_stereo', 'dual_channel', 'mono']
+
+# Frames must follow each other for this many headers before a sync is trusted
+_SYNC_CONFIRMATIONS = 3
+
+class FrameHeader:
+    """A decoded 4-byte MPEG audio frame header."""
+    __slots__ = ('version', 'layer', 'bitrate', 'sample_rate', 'padding',
+                 'channel_mode', 'length', 'samples')
+
+    def __init__(self, version, layer, bitrate, sample_rate, padding, channel_mode):
+        self.version = version
+        self.layer = layer
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.padding = padding
+        self.channel_mode = channel_mode
+        if layer == 1:
+            self.samples = 384
+            self.length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+        else:
+            self.samples = 576 if layer == 3 and version != 1 else 1152
+            self.length = self.samples // 8 * bitrate * 1000 // sample_rate + padding
+
+def parse_frame_header(data, offset=0) -> Optional[FrameHeader]:
+    """Decode the frame header at offset, or return None if it is not one."""
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version_bits = (b1 >> 3) & 0x3
+    layer_bits = (b1 >> 1) & 0x3
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x3
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        # Reserved values, or free-format bitrate which we do not measure
+        return None
+    version = {0: 2.5, 2: 2, 3: 1}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 0x1
+    channel_mode = CHANNEL_MODES[b3 >> 6]
+    return FrameHeader(version, layer, bitrate, sample_rate, padding, channel_mode)
+
+def id3v2_size(data) -> int:
+    """Return the size of a leading ID3v2 tag (0 if there is none)."""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+def find_first_frame(data, start, end) -> Optional[int]:
+    """Find the first frame sync that is followed by further valid frames."""
+    offset = start
+    while True:
+        offset = data.find(b'\xff', offset, end - 3)
+        if offset < 0:
+            return None
+        header = parse_frame_header(data, offset)
+        if header is not None:
+            probe, confirmed = offset, 0
+            while confirmed < _SYNC_CONFIRMATIONS:
+                probe += header.length
+                if probe >= end:
+                    break
+                header = parse_frame_header(data, probe)
+                if header is None:
+                    break
+                confirmed += 1
+            if confirmed == _SYNC_CONFIRMATIONS or probe >= end:
+                return offset
+        offset += 1
+
+def read_vbr_header(data, offset, header: FrameHeader):
+    """Read the frame count and byte count from a Xing/Info or VBRI header.
+
+    Returns:
+        (kind, frames, bytes) or None if the first frame carries neither
+    """
+    if header.version == 1:
+        side_info = 17 if header.channel_mode == 'mono' else 32
+    else:
+        side_info = 9 if header.channel_mode == 'mono' else 17
+    xing = offset + 4 + side_info
+    tag = bytes(data[xing:xing + 4])
+    if tag in (b'Xing', b'Info') and xing + 8 <= len(data):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        pos = xing + 8
+        frames = total_bytes = None
+        if flags & 0x1 and pos + 4 <= len(data):
+            frames = struct.unpack('>I', data[pos:pos + 4])[0]
+            pos += 4
+        if flags & 0x2 and pos + 4 <= len(data):
+            total_bytes = struct.unpack('>I', data[pos:pos + 4])[0]
+        if frames:
+            return ('xing' if tag == b'Xing' else 'info'), frames, total_bytes
+
+    vbri = offset + 4 + 32
+    if bytes(data[vbri:vbri + 4]) == b'VBRI' and vbri + 18 <= len(data):
+        total_bytes, frames = struct.unpack('>II', data[vbri + 10:vbri + 18])
+        if frames:
+            return 'vbri', frames, total_bytes
+    return None
+
+def parse_mp3(path) -> Dict:
+    """Compute duration, bitrate, sample rate and channel mode of an MP3 file."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            raise ValueError('empty file')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = id3v2_size(data)
+            end = size - 128 if size >= 128 and data[size - 128:size - 125] == b'TAG' else size
+            first = find_first_frame(data, start, end)
+            if first is None:
+                raise ValueError('no MPEG frame found')
+            header = parse_frame_header(data, first)
+            result = {
+                'format': 'mp3',
+                'mpeg_version': header.version,
+                'layer': header.layer,
+                'sample_rate': header.sample_rate,
+                'channel_mode': header.channel_mode,
+            }
+
+            vbr = read_vbr_header(data, first, header)
+            if vbr is not None:
+                kind, frames, total_bytes = vbr
+                duration = frames * header.samples / header.sample_rate
+                audio_bytes = total_bytes or (end - first)
+                result.update({
+                    'source': kind,
+                    'frames': frames,
+                    'duration': round(duration, 3),
+                    'bitrate': round(audio_bytes * 8 / duration / 1000) if duration else header.bitrate,
+                    'vbr': kind != 'info',
+                })
+                return result
+
+            # No VBR header: walk every frame
+            frames = samples = audio_bytes = 0
+            bitrates = set()
+            offset = first
+            while offset < end:
+                frame = parse_frame_header(data, offset)
+                if frame is None or offset + frame.length > end:
+                    break
+                frames += 1
+                samples += frame.samples
+                audio_bytes += frame.length
+                bitrates.add(frame.bitrate)
+                offset += frame.length
+
+            duration = samples / header.sample_rate
+            result.update({
+                'source': 'frames',
+                'frames': frames,
+                'duration': round(duration, 3),
+                'bitrate': round(audio_bytes * 8 / duration / 1000) if duration else header.bitrate,
+                'vbr': len(bitrates) > 1,
+            })
+            return result
+
+def parse_wav(path) -> Dict:
+    with wave.open(path, 'rb') as w:
+        frames, rate, channels = w.getnframes(), w.getframerate(), w.getnchannels()
+        duration = frames / rate if rate else 0
+        return {
+            'format': 'wav',
+            'sample_rate': rate,
+            'channel_mode': 'mono' if channels == 1 else 'stereo' if channels == 2 else f'{channels}ch',
+            'duration': round(duration, 3),
+            'bitrate': round(rate * channels * w.getsampwidth() * 8 / 1000),
+            'vbr': False,
+        }
+
+def read_audio_metadata(path) -> Dict:
+    """Read metadata for any supported audio file; errors are reported inline."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.mp3':
+            return parse_mp3(path)
+        if ext == '.wav':
+            return parse_wav(path)
+        return {'format': ext.lstrip('.'), 'error': 'unsupported format'}
+    except (OSError, ValueError, EOFError, wave.Error) as e:
+        return {'format': ext.lstrip('.'), 'error': str(e)}
+
+class AudioIndex:
+    """Persistent metadata index keyed by site-relative path.
+
+    An entry is reused while the file's size and mtime are unchanged.
+    """
+    VERSION = 1
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.parsed = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> 'AudioIndex':
+        index = cls(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == cls.VERSION:
+                index.entries = data.get('files', {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return index
+
+    def get(self, rel_path: str, full_path: str) -> Optional[Dict]:
+        """Return metadata for one file, parsing it only if it changed."""
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            with self._lock:
+                if self.entries.pop(rel_path, None) is not None:
+                    self._dirty = True
+            return None
+        with self._lock:
+            entry = self.entries.get(rel_path)
+            if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+                return entry
+        entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        entry.update(read_audio_metadata(full_path))
+        with self._lock:
+            self.entries[rel_path] = entry
+            self.parsed += 1
+            self._dirty = True
+        return entry
+
+    def update(self, files: Iterable, prune: bool = True, within: str = '') -> Dict[str, Dict]:
+        """Bring the index up to date for (rel_path, full_path) pairs.
+
+        Args:
+            prune: Drop entries for files that are not in `files`
+            within: Only prune entries under this rel_path prefix (e.g. 'book2/')
+
+        Returns:
+            The metadata of every file that still exists, by rel_path
+        """
+        result = {}
+        for rel_path, full_path in files:
+            entry = self.get(rel_path, full_path)
+            if entry is not None:
+                result[rel_path] = entry
+        if prune:
+            with self._lock:
+                for rel_path in set(self.entries) - set(result):
+                    if not rel_path.startswith(within):
+                        continue
+                    del self.entries[rel_path]
+                    self._dirty = True
+        return result
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'files': self.entries}, f,
+                          separators=(',', ':'), ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+def book_audio_files(book) -> Iterable:
+    """Yield (rel_path, full_path) for every audio file of a scanned Book."""
+    for folder in book.folders:
+        for name in folder.audio_files:
+            yield f"{folder.rel_path}/{name}", os.path.join(folder.path, name)
+
+def public_metadata(entry: Dict) -> Dict:
+    """Strip the cache validators from an index entry."""
+    return {key: value for key, value in entry.items() if key != 'mtime_ns'}
+
+def main():
+    from book_scanner import scan_book
+
+    parser = argparse.ArgumentParser(
+        description='Index duration and bitrate of the book audio files',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('files', nargs='*', help='Audio files to inspect instead of the whole book')
+    parser.add_argument('--book-path', default='book1', help='Path to the book directory (default: ./book1)')
+    parser.add_argument('--index', default=INDEX_FILE, help=f'Index file (default: {INDEX_FILE})')
+    args = parser.parse_args()
+
+    if args.files:
+        for path in args.files:
+            print(json.dumps({'path': path, **read_audio_metadata(path)}, ensure_ascii=False))
+        return 0
+
+    book = scan_book(args.book_path, read_texts=False)
+    if book is None:
+        print(f"Error: Book path {args.book_path} does not exist")
+        return 1
+    index = AudioIndex.load(args.index)
+    # The index is shared by every book; only this book's entries may go
+    files = index.update(book_audio_files(book), within=book.root.rel_path + '/')
+    index.save()
+
+    errors = {path: entry['error'] for path, entry in files.items() if 'error' in entry}
+    total = sum(entry.get('duration', 0) for entry in files.values())
+    print(f"Indexed {len(files)} audio files ({index.parsed} parsed, "
+          f"{len(files) - index.parsed} cached), total duration {total / 60:.1f} min")
+    for path, error in sorted(errors.items()):
+        print(f"  {path}: {error}")
+    return 0 if not errors else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
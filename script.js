@@ -87,6 +87,164 @@ class GitHubAPI {
     }
 }
 
+class SharedDataAPI {
+    // Shared review data served by server.py from memory at /api/shared-data/<type>.
+    // Changes are sent as JSON merge patches with If-Match, so concurrent reviewers
+    // only conflict on the entries they both touched. Without the server (static
+    // hosting) the GitHub proxy is used instead.
+    constructor(fallback) {
+        this.fallback = fallback;
+        this.local = null; // null until the first request tells us
+        this.detecting = null; // That first request, which the others wait for
+        this.etags = {};
+        this.bases = {}; // Last document acknowledged by the server, per type
+    }
+
+    dataType(path) {
+        return path.replace('.json', '');
+    }
+
+    static isObject(value) {
+        return value !== null && typeof value === 'object' && !Array.isArray(value);
+    }
+
+    static clone(value) {
+        return value === undefined ? undefined : JSON.parse(JSON.stringify(value));
+    }
+
+    // Merge patch (RFC 7396) that turns base into content
+    static diff(base, content) {
+        if (!SharedDataAPI.isObject(base) || !SharedDataAPI.isObject(content)) {
+            return SharedDataAPI.clone(content);
+        }
+        const patch = {};
+        for (const key of Object.keys(content)) {
+            if (!(key in base)) {
+                patch[key] = SharedDataAPI.clone(content[key]);
+            } else if (JSON.stringify(base[key]) !== JSON.stringify(content[key])) {
+                patch[key] = SharedDataAPI.diff(base[key], content[key]);
+            }
+        }
+        for (const key of Object.keys(base)) {
+            if (!(key in content)) {
+                patch[key] = null;
+            }
+        }
+        return patch;
+    }
+
+    static applyPatch(target, patch) {
+        if (!SharedDataAPI.isObject(patch)) {
+            return SharedDataAPI.clone(patch);
+        }
+        const result = SharedDataAPI.isObject(target) ? target : {};
+        for (const [key, value] of Object.entries(patch)) {
+            if (value === null) {
+                delete result[key];
+            } else {
+                result[key] = SharedDataAPI.applyPatch(result[key], value);
+            }
+        }
+        return result;
+    }
+
+    async fetchLocal(type) {
+        const response = await fetch(`/api/shared-data/${type}`, { cache: 'no-cache' });
+        if (!response.ok) {
+            throw new Error(`shared data ${type} returned ${response.status}`);
+        }
+        const data = await response.json();
+        this.etags[type] = response.headers.get('ETag');
+        this.bases[type] = SharedDataAPI.clone(data);
+        return data;
+    }
+
+    // Find out once whether server.py's API is there. Requests made in
+    // parallel all wait for the same answer, so a failure of one of them
+    // cannot send the others to the wrong backend.
+    detect(type) {
+        this.detecting ??= this.fetchLocal(type).then(data => {
+            this.local = true;
+            return data;
+        }, error => {
+            console.log('Shared data API not available, using GitHub:', error.message);
+            this.local = false;
+            return undefined;
+        });
+        return this.detecting;
+    }
+
+    async getFileContent(path) {
+        const type = this.dataType(path);
+        if (this.local === null) {
+            const first = !this.detecting;
+            const data = await this.detect(type);
+            if (first && this.local) {
+                return data;
+            }
+        }
+        if (this.local) {
+            // Let a failed load fail: an empty document here would be saved
+            // back over the real one with the next change
+            return this.fetchLocal(type);
+        }
+        return this.fallback.getFileContent(path);
+    }
+
+    async updateFile(path, content, message) {
+        if (this.local === null) {
+            await this.detect(this.dataType(path));
+        }
+        if (!this.local) {
+            return this.fallback.updateFile(path, content, message);
+        }
+        const type = this.dataType(path);
+        try {
+            const patch = SharedDataAPI.diff(this.bases[type] || {}, content);
+            if (Object.keys(patch).length === 0) {
+                return true;
+            }
+            for (let attempt = 0; attempt < 3; attempt++) {
+                const headers = { 'Content-Type': 'application/merge-patch+json' };
+                if (this.etags[type]) {
+                    headers['If-Match'] = this.etags[type];
+                }
+                const response = await fetch(`/api/shared-data/${type}`, {
+                    method: 'PATCH',
+                    headers: headers,
+                    body: JSON.stringify(patch)
+                });
+                if (response.ok) {
+                    this.etags[type] = response.headers.get('ETag');
+                    this.bases[type] = SharedDataAPI.applyPatch(this.bases[type] || {}, SharedDataAPI.clone(patch));
+                    return true;
+                }
+                if (response.status !== 412) {
+                    console.error(`Failed to save ${type}:`, response.status, await response.text());
+                    return false;
+                }
+                // Someone else saved first: take their entries and resend ours on top
+                const latest = await this.fetchLocal(type);
+                for (const key of Object.keys(content)) {
+                    if (!(key in latest) && !(key in patch)) {
+                        delete content[key];
+                    }
+                }
+                for (const [key, value] of Object.entries(latest)) {
+                    if (!(key in patch)) {
+                        content[key] = value;
+                    }
+                }
+            }
+            console.error(`Failed to save ${type}: too many concurrent changes`);
+            return false;
+        } catch (error) {
+            console.error(`Failed to save ${type}:`, error);
+            return false;
+        }
+    }
+}
+
 class ChapterViewer {
     constructor() {
         try {
@@ -95,7 +253,8 @@ class ChapterViewer {
             this.currentSection = null;
             this.audioManifestData = {}; // Cache for audio manifest data
             this.characterData = {}; // Cache for character data
-            this.githubApi = new GitHubAPI();
+            this.assetMap = {}; // Fingerprinted asset URLs from asset-map.json
+            this.sharedDataApi = new SharedDataAPI(new GitHubAPI());
             this.deletedFiles = {};
             this.completedFiles = {};
             this.fileComments = {};
@@ -104,6 +263,8 @@ class ChapterViewer {
             this.todoV2Status = {}; // Independent tracking for Todo V2
             this.propertyAssignments = {}; // Audio file to property assignments
             this.textManifestData = {}; // Cache for text manifest data
+            this.structureState = null; // Keyed book state from /api/book-structure?since=
+            this.structureVersion = null;
             console.log('ChapterViewer constructor completed, starting init...');
             this.init().catch(error => {
                 console.error('Init failed:', error);
@@ -119,6 +280,7 @@ class ChapterViewer {
         try {
             console.log('Starting init process...');
             
+            await this.loadAssetMap();
             await this.loadBookStructure();
             console.log('Book structure loaded:', this.bookStructure);
             
@@ -155,6 +317,8 @@ class ChapterViewer {
             await this.loadCharacterData();
             console.log('Character data loaded');
             
+            this.subscribeToBookEvents();
+            
             console.log('Initialization complete!');
         } catch (error) {
             console.error('Init process failed:', error);
@@ -175,13 +339,37 @@ class ChapterViewer {
         }
     }
 
+    async loadAssetMap() {
+        // Fingerprinted URLs ('path?v=<hash>') written by asset_fingerprints.py.
+        // A URL changes whenever its content does, so the browser may cache it for good
+        try {
+            const response = await fetch('asset-map.json', { cache: 'no-cache' });
+            if (response.ok) {
+                this.assetMap = (await response.json()).assets || {};
+                console.log('Loaded asset map with', Object.keys(this.assetMap).length, 'assets');
+            }
+        } catch (error) {
+            console.log('Asset map not available, using plain URLs:', error);
+        }
+    }
+
+    assetUrl(path) {
+        return this.assetMap[path] || path;
+    }
+
+    fetchAsset(path) {
+        // Fingerprinted URLs come straight from the cache; anything else is revalidated
+        const url = this.assetUrl(path);
+        return url !== path ? fetch(url) : fetch(path, { cache: 'no-cache' });
+    }
+
     async loadBookStructure() {
         console.log('Loading book structure...');
         
         try {
             // Try to load the static book structure first
             console.log('Attempting to load book-structure.json...');
-            const response = await fetch(`book-structure.json?v=${Date.now()}`);
+            const response = await this.fetchAsset('book-structure.json');
             console.log('book-structure.json response status:', response.status);
             
             if (response.ok) {
@@ -465,7 +653,7 @@ class ChapterViewer {
             });
             
             // Load chapter text
-            const response = await fetch(chapter.textFile);
+            const response = await this.fetchAsset(chapter.textFile);
             if (!response.ok) {
                 throw new Error(`Could not load ${chapter.textFile}`);
             }
@@ -514,7 +702,7 @@ class ChapterViewer {
             });
             
             // Load section text
-            const response = await fetch(section.textFile);
+            const response = await this.fetchAsset(section.textFile);
             if (!response.ok) {
                 throw new Error(`Could not load ${section.textFile}`);
             }
@@ -959,11 +1147,11 @@ class ChapterViewer {
                 const audio = document.createElement('audio');
                 audio.controls = true;
                 audio.preload = 'metadata';
-                audio.src = audioFile.path;
+                audio.src = this.assetUrl(audioFile.path);
                 
                 // Add source with correct type
                 const source = document.createElement('source');
-                source.src = audioFile.path;
+                source.src = this.assetUrl(audioFile.path);
                 
                 if (audioFile.path.toLowerCase().endsWith('.mp3')) {
                     source.type = 'audio/mpeg';
@@ -1555,11 +1743,14 @@ class ChapterViewer {
         console.log('Force refreshing To-Do table...');
         
         // Clear cached data
-        this.audioManifestData = {};
         this.characterData = {};
         
-        // Reload all data
-        await this.loadAllAudioManifests();
+        // Reload all data; server.py only sends what changed since the last refresh
+        if (!await this.refreshBookStructure()) {
+            this.audioManifestData = {};
+            this.manifestBundlePromise = null;
+            await this.loadAllAudioManifests();
+        }
         await this.loadCharacterData();
         
         // Re-render the To-Do view
@@ -1611,7 +1802,7 @@ class ChapterViewer {
 
     async saveCompletedFiles() {
         try {
-            const success = await this.githubApi.updateFile('completed_files.json', this.completedFiles, 'Update completed files');
+            const success = await this.sharedDataApi.updateFile('completed_files.json', this.completedFiles, 'Update completed files');
             if (!success) {
                 console.error('Failed to save completed files to GitHub - data not shared!');
             }
@@ -1622,7 +1813,7 @@ class ChapterViewer {
 
     async saveFileComments() {
         try {
-            const success = await this.githubApi.updateFile('file_comments.json', this.fileComments, 'Update file comments');
+            const success = await this.sharedDataApi.updateFile('file_comments.json', this.fileComments, 'Update file comments');
             if (!success) {
                 console.error('Failed to save file comments to GitHub - data not shared!');
             }
@@ -1633,7 +1824,7 @@ class ChapterViewer {
 
     async saveNotCompletedFiles() {
         try {
-            const success = await this.githubApi.updateFile('not_completed_files.json', this.notCompletedFiles, 'Update not completed files');
+            const success = await this.sharedDataApi.updateFile('not_completed_files.json', this.notCompletedFiles, 'Update not completed files');
             if (!success) {
                 console.error('Failed to save not completed files to GitHub - data not shared!');
             }
@@ -1644,7 +1835,7 @@ class ChapterViewer {
 
     async saveConfirmedFiles() {
         try {
-            const success = await this.githubApi.updateFile('confirmed_files.json', this.confirmedFiles, 'Update confirmed files');
+            const success = await this.sharedDataApi.updateFile('confirmed_files.json', this.confirmedFiles, 'Update confirmed files');
             if (!success) {
                 console.error('Failed to save confirmed files to GitHub - data not shared!');
             }
@@ -2344,7 +2535,7 @@ class ChapterViewer {
 
     async saveDeletedFiles() {
         try {
-            const success = await this.githubApi.updateFile('deleted_files_history.json', this.deletedFiles, 'Update deleted files');
+            const success = await this.sharedDataApi.updateFile('deleted_files_history.json', this.deletedFiles, 'Update deleted files');
             if (!success) {
                 console.error('Failed to save deleted files to GitHub - data not shared!');
             }
@@ -3244,7 +3435,7 @@ class ChapterViewer {
 
     async saveTodoV2Status() {
         try {
-            const success = await this.githubApi.updateFile('todo_v2_status.json', this.todoV2Status, 'Update Todo V2 status');
+            const success = await this.sharedDataApi.updateFile('todo_v2_status.json', this.todoV2Status, 'Update Todo V2 status');
             if (!success) {
                 console.error('Failed to save Todo V2 status to GitHub - data not shared!');
             }
@@ -3255,7 +3446,7 @@ class ChapterViewer {
 
     async savePropertyAssignments() {
         try {
-            const success = await this.githubApi.updateFile('property_assignments.json', this.propertyAssignments, 'Update property assignments');
+            const success = await this.sharedDataApi.updateFile('property_assignments.json', this.propertyAssignments, 'Update property assignments');
             if (!success) {
                 console.error('Failed to save property assignments to GitHub - data not shared!');
             }
@@ -3518,6 +3709,88 @@ class ChapterViewer {
         `;
     }
 
+    async loadManifestBundle() {
+        // One request for every folder's manifests: /api/manifests from server.py,
+        // or the book-manifests.json written by generate_book_structure.py
+        if (!this.manifestBundlePromise) {
+            this.manifestBundlePromise = (async () => {
+                for (const url of ['/api/manifests', 'book-manifests.json']) {
+                    try {
+                        const resp = url.startsWith('/api/')
+                            ? await fetch(url, { cache: 'no-cache' })
+                            : await this.fetchAsset(url);
+                        if (resp.ok) {
+                            const bundle = await resp.json();
+                            console.log(`Loaded manifest bundle from ${url}: ${Object.keys(bundle).length} folders`);
+                            return bundle;
+                        }
+                    } catch (error) {
+                        console.log(`Manifest bundle not available at ${url}:`, error);
+                    }
+                }
+                return null;
+            })();
+        }
+        return this.manifestBundlePromise;
+    }
+
+    async refreshBookStructure() {
+        // /api/book-structure?since=N returns a merge patch of the chapters, sections and
+        // audio files changed since version N, or the full state when N is unknown.
+        // Static hosting has no such endpoint; the caller then reloads everything
+        try {
+            const since = this.structureVersion === null ? 0 : this.structureVersion;
+            const response = await fetch(`/api/book-structure?since=${since}`, { cache: 'no-cache' });
+            if (!response.ok) {
+                return false;
+            }
+            const data = await response.json();
+            if ('patch' in data) {
+                this.structureState = SharedDataAPI.applyPatch(this.structureState, data.patch);
+                console.log(`Book structure updated from version ${data.since} to ${data.version}`);
+            } else if (data.state) {
+                this.structureState = data.state;
+                console.log(`Loaded book structure version ${data.version}`);
+            } else {
+                return false;
+            }
+            this.structureVersion = data.version;
+            this.applyStructureState();
+            return true;
+        } catch (error) {
+            console.log('Book structure versions not available:', error);
+            return false;
+        }
+    }
+
+    applyStructureState() {
+        // Rebuild bookStructure and the audio manifests from the keyed state;
+        // null fields are left out of the state
+        const state = this.structureState;
+        this.bookStructure = {
+            ...this.bookStructure,
+            title: state.title === undefined ? null : state.title,
+            chapters: state.chapterOrder.map(chapterId => {
+                const { sectionOrder, sections, ...chapter } = state.chapters[chapterId];
+                return {
+                    id: chapterId, title: null, textFile: null, audioFile: null, ...chapter,
+                    sections: sectionOrder.map(sectionId => ({
+                        id: sectionId, title: null, textFile: null, audioFile: null, description: null,
+                        ...sections[sectionId]
+                    }))
+                };
+            })
+        };
+
+        this.audioManifestData = {};
+        for (const [folder, files] of Object.entries(state.audio)) {
+            const key = this.manifestKeyForFolder(folder);
+            if (key) {
+                this.audioManifestData[key] = Object.keys(files).sort().filter(fn => !this.isFileDeleted(folder + fn));
+            }
+        }
+    }
+
     async loadAllAudioManifests() {
         console.log('Loading all audio manifests...');
         const startTime = performance.now();
@@ -3527,6 +3800,18 @@ class ChapterViewer {
             return;
         }
 
+        const bundle = await this.loadManifestBundle();
+        if (bundle) {
+            for (const [folder, manifests] of Object.entries(bundle)) {
+                const key = this.manifestKeyForFolder(folder);
+                if (key) {
+                    this.audioManifestData[key] = manifests.audio.filter(fn => !this.isFileDeleted(folder + fn));
+                }
+            }
+            console.log(`Audio manifest data loaded from bundle in ${Math.round(performance.now() - startTime)}ms`);
+            return;
+        }
+
         // Build list of all paths to load in parallel
         const loadTasks = [];
         
@@ -3603,6 +3888,18 @@ class ChapterViewer {
             return;
         }
 
+        const bundle = await this.loadManifestBundle();
+        if (bundle) {
+            for (const [folder, manifests] of Object.entries(bundle)) {
+                const key = this.manifestKeyForFolder(folder);
+                if (key) {
+                    this.textManifestData[key] = manifests.text;
+                }
+            }
+            console.log(`Text manifest data loaded from bundle in ${Math.round(performance.now() - startTime)}ms`);
+            return;
+        }
+
         // Build list of all paths to load in parallel
         const loadTasks = [];
         
@@ -3694,11 +3991,63 @@ class ChapterViewer {
         return [];
     }
 
+    manifestKeyForFolder(folder) {
+        // 'book1/C1/S1/' -> 'C1-S1', 'book1/C1/' -> 'C1'
+        const parts = folder.replace(/\/$/, '').split('/').slice(1);
+        return parts.length ? parts.join('-') : null;
+    }
+
+    subscribeToBookEvents() {
+        // Live updates from server.py's watcher; static hosting has no /api/events
+        if (typeof EventSource === 'undefined' || this.bookEvents) {
+            return;
+        }
+
+        const source = new EventSource('/api/events');
+        this.bookEvents = source;
+
+        const applyChange = (event) => {
+            const change = JSON.parse(event.data);
+            const key = this.manifestKeyForFolder(change.folder);
+            if (!key) return;
+
+            if (change.event === 'folder_added') {
+                this.audioManifestData[key] = change.audio.filter(fn => !this.isFileDeleted(change.folder + fn));
+                this.textManifestData[key] = change.text.filter(fn => fn.toLowerCase() !== 'title.txt');
+            } else if (change.event === 'folder_removed') {
+                delete this.audioManifestData[key];
+                delete this.textManifestData[key];
+            } else {
+                const store = change.event.startsWith('audio') ? this.audioManifestData : this.textManifestData;
+                const files = (store[key] || []).filter(fn => fn !== change.file);
+                if (change.event.endsWith('_added') && !(store === this.audioManifestData && this.isFileDeleted(change.folder + change.file))) {
+                    files.push(change.file);
+                    files.sort();
+                }
+                store[key] = files;
+            }
+            console.log(`Book change: ${change.event} ${change.folder}${change.file || ''}`);
+        };
+
+        ['audio_added', 'audio_removed', 'text_added', 'text_removed', 'folder_added', 'folder_removed']
+            .forEach(type => source.addEventListener(type, applyChange));
+
+        source.addEventListener('resync', () => this.forceRefreshTodo());
+
+        source.onerror = () => {
+            // A 404/503 closes the stream for good; fall back to manual refresh
+            if (source.readyState === EventSource.CLOSED) {
+                console.log('Book event stream unavailable, live updates disabled');
+                this.bookEvents = null;
+            }
+        };
+    }
+
     async loadCharacterData() {
         console.log('Loading character data...');
         
         try {
-            const response = await fetch('section_characters.json', { cache: 'no-cache' });
+            const response = await this.fetchAsset('section_characters.json');
             if (response.ok) {
                 this.characterData = await response.json();
                 console.log('Character data loaded:', Object.keys(this.characterData).length, 'sections');
@@ -3713,34 +4062,34 @@ class ChapterViewer {
     }
 
     async loadSharedData() {
-        console.log('Loading shared data from GitHub Issues...');
+        console.log('Loading shared data...');
         try {
             const [deleted, completed, comments, notCompleted, confirmed, todoV2, propertyAssignments] = await Promise.all([
-                this.githubApi.getFileContent('deleted_files_history.json').catch(e => {
+                this.sharedDataApi.getFileContent('deleted_files_history.json').catch(e => {
                     console.warn('Failed to load deleted files:', e);
                     return {};
                 }),
-                this.githubApi.getFileContent('completed_files.json').catch(e => {
+                this.sharedDataApi.getFileContent('completed_files.json').catch(e => {
                     console.warn('Failed to load completed files:', e);
                     return {};
                 }),
-                this.githubApi.getFileContent('file_comments.json').catch(e => {
+                this.sharedDataApi.getFileContent('file_comments.json').catch(e => {
                     console.warn('Failed to load file comments:', e);
                     return {};
                 }),
-                this.githubApi.getFileContent('not_completed_files.json').catch(e => {
+                this.sharedDataApi.getFileContent('not_completed_files.json').catch(e => {
                     console.warn('Failed to load not completed files:', e);
                     return {};
                 }),
-                this.githubApi.getFileContent('confirmed_files.json').catch(e => {
+                this.sharedDataApi.getFileContent('confirmed_files.json').catch(e => {
                     console.warn('Failed to load confirmed files:', e);
                     return {};
                 }),
-                this.githubApi.getFileContent('todo_v2_status.json').catch(e => {
+                this.sharedDataApi.getFileContent('todo_v2_status.json').catch(e => {
                     console.warn('Failed to load Todo V2 status:', e);
                     return {};
                 }),
-                this.githubApi.getFileContent('property_assignments.json').catch(e => {
+                this.sharedDataApi.getFileContent('property_assignments.json').catch(e => {
                     console.warn('Failed to load property assignments:', e);
                     return {};
                 })
@@ -3754,7 +4103,7 @@ class ChapterViewer {
             this.todoV2Status = todoV2 || {};
             this.propertyAssignments = propertyAssignments || {};
 
-            console.log('Shared data loaded from GitHub Issues:', {
+            console.log('Shared data loaded:', {
                 deletedCount: Object.keys(this.deletedFiles).length,
                 completedCount: Object.keys(this.completedFiles).length,
                 commentsCount: Object.keys(this.fileComments).length,
@@ -3764,7 +4113,7 @@ class ChapterViewer {
                 propertyAssignmentsCount: Object.keys(this.propertyAssignments).length
             });
         } catch (error) {
-            console.warn('Error loading shared data from GitHub:', error);
+            console.warn('Error loading shared data:', error);
             this.deletedFiles = {};
             this.completedFiles = {};
             this.fileComments = {};
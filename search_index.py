@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Full-text search index for the book's dialogue.
+
+Every text document (introduction.txt, chapter.txt, main.txt and
+sinopsis.txt) is split into utterances, one per line, with the speaker
+taken from the "Speaker: text" prefix. Utterances are tokenized with
+accent folding, so 'economia' finds 'Economía', and every token's position
+is recorded in an inverted index: term -> document -> positions.
+
+Queries match whole utterances: every term must occur in the same line,
+"quoted phrases" must occur as consecutive tokens, and results can be
+limited to one speaker or section. Each hit carries the line number and
+a snippet with highlight offsets.
+
+The index is persisted to .search_index.json per document, keyed by path
+and validated by size and mtime, so an update only re-tokenizes the files
+that changed since the last run. It holds postings only (term positions,
+line starts and the lines of each speaker word), not the text: the lines
+of the returned hits are read from disk through the line offset index of
+text_offsets.py.
+
+Usage:
+    python3 search_index.py [--book-path BOOK_PATH] [--index FILE]
+                            [--query QUERY] [--speaker NAME] [--section ID]
+
+Without --book-path every bookN/ directory in the current directory is
+indexed; with it, only that book's documents are updated and searched.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+import unicodedata
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Set
+
+from book_scanner import BOOK_DIR_RE
+from dialogue import book_text_documents, fold, read_lines, split_speaker, tokenize
+from text_offsets import TextOffsetIndex, read_lines_range
+
+INDEX_FILE = '.search_index.json'
+
+DEFAULT_LIMIT = 50
+SNIPPET_CHARS = 200
+
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+def parse_query(query: str) -> List[List[str]]:
+    """Split a query into phrases of folded tokens.
+
+    A bare word is a one-token phrase; a word joined by punctuation
+    (e.g. costo-beneficio) or a "quoted phrase" must match consecutively.
+    """
+    phrases = []
+    for quoted, word in _QUERY_RE.findall(query):
+        tokens = [token for token, _, _ in tokenize(quoted or word)]
+        if tokens:
+            phrases.append(tokens)
+    return phrases
+
+def index_document(lines: List[str]) -> Dict:
+    """Tokenize a document into line starts, term positions and speaker lines."""
+    starts = []
+    terms: Dict[str, List[int]] = {}
+    speakers: Dict[str, List[int]] = {}
+    position = 0
+    for number, line in enumerate(lines):
+        speaker, text = split_speaker(line)
+        starts.append(position)
+        if speaker:
+            for word in set(fold(speaker).split()):
+                speakers.setdefault(word, []).append(number)
+        for token, _, _ in tokenize(text):
+            terms.setdefault(token, []).append(position)
+            position += 1
+    return {'starts': starts, 'terms': terms, 'speakers': speakers}
+
+def _book_number(rel_path: str) -> int:
+    match = BOOK_DIR_RE.match(rel_path.split('/', 1)[0])
+    return int(match.group(1)) if match else 0
+
+def make_snippet(text: str, phrases: List[List[str]]) -> Dict:
+    """Cut a snippet around the first match and mark every phrase occurrence."""
+    words = tokenize(text)
+    spans = []
+    for i in range(len(words)):
+        for phrase in phrases:
+            if [token for token, _, _ in words[i:i + len(phrase)]] == phrase:
+                spans.append((words[i][1], words[i + len(phrase) - 1][2]))
+                break
+    begin = 0
+    if len(text) > SNIPPET_CHARS and spans:
+        begin = max(0, min(spans[0][0] - SNIPPET_CHARS // 4, len(text) - SNIPPET_CHARS))
+        # Don't start in the middle of a word
+        space = text.rfind(' ', 0, begin + 1)
+        begin = space + 1 if space > begin - 20 else begin
+    end = min(len(text), begin + SNIPPET_CHARS)
+    return {
+        'snippet': ('…' if begin else '') + text[begin:end] + ('…' if end < len(text) else ''),
+        'highlights': [[start - begin + (1 if begin else 0), stop - begin + (1 if begin else 0)]
+                       for start, stop in spans if start >= begin and stop <= end],
+    }
+
+class SearchIndex:
+    """Persistent inverted index over the book's text documents.
+
+    Documents are keyed by their path relative to root, which is where
+    the text of hits is read from.
+    """
+    VERSION = 2
+
+    def __init__(self, path: Optional[str] = None, root: str = '.',
+                 offsets: Optional[TextOffsetIndex] = None):
+        self.path = path
+        self.root = root
+        self.offsets = offsets if offsets is not None else TextOffsetIndex()
+        self.docs: Dict[str, Dict] = {}
+        self.order: List[str] = []
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        self.indexed = 0
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls, path: str, root: str = '.',
+             offsets: Optional[TextOffsetIndex] = None) -> 'SearchIndex':
+        index = cls(path, root, offsets)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == cls.VERSION:
+                index.order = data.get('order', [])
+                for rel_path, doc in data.get('docs', {}).items():
+                    index._add(rel_path, doc)
+        except (OSError, ValueError, AttributeError):
+            pass
+        return index
+
+    def _add(self, rel_path: str, doc: Dict):
+        self.docs[rel_path] = doc
+        for term, positions in doc['terms'].items():
+            self.postings.setdefault(term, {})[rel_path] = positions
+
+    def _remove(self, rel_path: str):
+        doc = self.docs.pop(rel_path, None)
+        if doc is None:
+            return
+        for term in doc['terms']:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(rel_path, None)
+                if not docs:
+                    del self.postings[term]
+        self._dirty = True
+
+    def update_file(self, rel_path: str, full_path: str, section: str) -> bool:
+        """Re-index one document if its size or mtime changed.
+
+        Returns:
+            False if the file no longer exists (its entry is dropped)
+        """
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            with self._lock:
+                self._remove(rel_path)
+            return False
+        with self._lock:
+            doc = self.docs.get(rel_path)
+            if doc and doc['size'] == st.st_size and doc['mtime_ns'] == st.st_mtime_ns:
+                return True
+        try:
+            doc = index_document(read_lines(full_path))
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Warning: Could not index {rel_path}: {e}")
+            return False
+        doc.update({'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'section': section})
+        with self._lock:
+            self._remove(rel_path)
+            self._add(rel_path, doc)
+            self.indexed += 1
+            self._dirty = True
+        return True
+
+    def update(self, documents: Iterable, prune: bool = True, within: str = ''):
+        """Bring the index up to date for (rel_path, full_path, section) triples.
+
+        The order of `documents` is the order results are returned in.
+
+        Args:
+            within: Only documents under this rel_path prefix (e.g. 'book2/')
+                    are pruned and reordered; the other books keep theirs
+        """
+        order = []
+        for rel_path, full_path, section in documents:
+            if self.update_file(rel_path, full_path, section):
+                order.append(rel_path)
+        with self._lock:
+            if prune:
+                for rel_path in set(self.docs) - set(order):
+                    if rel_path.startswith(within):
+                        self._remove(rel_path)
+            if within:
+                others = [rel_path for rel_path in self.order
+                          if not rel_path.startswith(within) and rel_path in self.docs]
+                # Stable, so each book keeps its reading order
+                order = sorted(others + order, key=_book_number)
+            if order != self.order:
+                self.order = order
+                self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'order': self.order, 'docs': self.docs}, f,
+                          separators=(',', ':'), ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def _matching_lines(self, rel_path: str, doc: Dict, phrase: List[str]) -> Set[int]:
+        """Return the lines of a document that contain the phrase."""
+        starts = doc['starts']
+        first = self.postings[phrase[0]][rel_path]
+        rest = [set(self.postings[token][rel_path]) for token in phrase[1:]]
+        lines = set()
+        for position in first:
+            if all(position + i + 1 in positions for i, positions in enumerate(rest)):
+                line = bisect_right(starts, position) - 1
+                # A phrase must not run across two utterances
+                if bisect_right(starts, position + len(phrase) - 1) - 1 == line:
+                    lines.add(line)
+        return lines
+
+    def search(self, query: str, speaker: Optional[str] = None, section: Optional[str] = None,
+               limit: int = DEFAULT_LIMIT, offset: int = 0, book: Optional[str] = None) -> Dict:
+        """Find the utterances that match every term and phrase of a query.
+
+        Args:
+            speaker: Only utterances whose speaker contains these words
+                     (accent-insensitive, e.g. 'socrates' or 'nash')
+            section: Only this section or chapter ('C1/S1', 'C1', 'Intro')
+            book: Only this book ('book2'); by default every indexed book
+
+        Returns:
+            {'total': N, 'hits': [...]} with hits in reading order
+        """
+        phrases = parse_query(query)
+        speaker_words = set(fold(speaker).split()) if speaker else None
+        tokens = {token for phrase in phrases for token in phrase}
+        page = []
+        total = 0
+        if not phrases:
+            return {'total': 0, 'hits': []}
+
+        with self._lock:
+            if any(token not in self.postings for token in tokens):
+                return {'total': 0, 'hits': []}
+            candidates = set.intersection(*(set(self.postings[token]) for token in tokens))
+            for rel_path in self.order:
+                if rel_path not in candidates or (book and not rel_path.startswith(book + '/')):
+                    continue
+                doc = self.docs[rel_path]
+                if section and doc['section'] != section and not doc['section'].startswith(section + '/'):
+                    continue
+                lines = set.intersection(*(self._matching_lines(rel_path, doc, phrase) for phrase in phrases))
+                if speaker_words:
+                    lines.intersection_update(*(doc['speakers'].get(word, ()) for word in speaker_words))
+                for line in sorted(lines):
+                    total += 1
+                    if offset < total <= offset + limit:
+                        page.append((rel_path, doc['section'], line))
+
+        hits = []
+        for rel_path, section, line in page:
+            line_speaker, text = split_speaker(self._read_line(rel_path, line))
+            hit = {'file': rel_path, 'section': section, 'line': line + 1, 'speaker': line_speaker}
+            hit.update(make_snippet(text, phrases))
+            hits.append(hit)
+        return {'total': total, 'hits': hits}
+
+    def _read_line(self, rel_path: str, line: int) -> str:
+        """Read one line of a document, or '' if it is gone."""
+        full_path = os.path.join(self.root, rel_path)
+        entry = self.offsets.get(rel_path, full_path)
+        if entry is None or line >= len(entry['offsets']) - 1:
+            return ''
+        try:
+            text = read_lines_range(full_path, entry, line, line)[0]
+        except OSError:
+            return ''
+        return unicodedata.normalize('NFC', text)
+
+def main():
+    from book_scanner import discover_books, scan_book
+
+    parser = argparse.ArgumentParser(
+        description='Build the full-text search index of the book dialogue',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('--book-path',
+                        help='Path to one book directory (default: every bookN/ directory in the current directory)')
+    parser.add_argument('--index', default=INDEX_FILE, help=f'Index file (default: {INDEX_FILE})')
+    parser.add_argument('--query', '-q', help='Search the index after updating it')
+    parser.add_argument('--speaker', help='Only match utterances by this speaker')
+    parser.add_argument('--section', help='Only match this section or chapter (e.g. C1/S1)')
+    parser.add_argument('--limit', type=int, default=20, help='Hits to print (default: 20)')
+    args = parser.parse_args()
+
+    book_paths = [args.book_path] if args.book_path else discover_books('.')
+    if not book_paths:
+        print("Error: No book directories (book1, book2, ...) found")
+        return 1
+    books = []
+    for book_path in book_paths:
+        book = scan_book(book_path, read_texts=False)
+        if book is None:
+            print(f"Error: Book path {book_path} does not exist")
+            return 1
+        books.append(book)
+    root = os.path.dirname(os.path.abspath(book_paths[0]))
+    index = SearchIndex.load(args.index, root=root)
+    # The index file is shared by every book; one book leaves the others alone
+    within = books[0].root.rel_path + '/' if args.book_path else ''
+    index.update((document for book in books for document in book_text_documents(book)), within=within)
+    index.save()
+    print(f"Indexed {len(index.docs)} documents ({index.indexed} tokenized, "
+          f"{len(index.docs) - index.indexed} cached), {len(index.postings)} terms")
+
+    if args.query:
+        result = index.search(args.query, args.speaker, args.section, args.limit,
+                              book=books[0].root.rel_path if args.book_path else None)
+        print(f"{result['total']} matches for {args.query!r}")
+        for hit in result['hits']:
+            who = f"{hit['speaker']}: " if hit['speaker'] else ''
+            print(f"  {hit['file']}:{hit['line']}  {who}{hit['snippet']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,187 @@
-section_characters = {'C1/S5': ['Glaucón', 'Sócrates'], 'C1/S2': ['Glaucón', 'Sócrates'], 'C1/S3': ['Sócrates', 'Glaucón'], 'C1/S4': ['Sócrates', 'Glaucón'], 'C1/S1': ['Sócrates', 'Glaucón'], 'C1/S6': ['Glaucón', 'Sócrates'], 'C1/S7': ['Teofrasto', 'Aristóteles'], 'C6/S5': ['Presentadora', 'Yuval Noah Harari'], 'C6/S2': ['Moderador', 'Elinor Ostrom'], 'C6/S3': ['Glaucón', 'Sócrates'], 'C6/S4': ['Glaucón', 'Sócrates'], 'C6/S1': ['Entrevistadora', 'Rafael Di Tella'], 'C3/S5': ['Glaucón', 'Sócrates'], 'C3/S2': ['Glaucón', 'Sócrates'], 'C3/S3': ['Glaucón', 'Sócrates'], 'C3/S4': ['Entrevistadora', 'John Nash'], 'C3/S10': ['Entrevistadora', 'Thomas Philippon'], 'C3/S8': ['Glaucón', 'Sócrates'], 'C3/S1': ['Glaucón', 'Sócrates'], 'C3/S6': ['Glaucón', 'Sócrates'], 'C3/S7': ['Glaucón', 'Sócrates'], 'C3/S9': ['Entrevistador', 'Jean Tirole'], 'C4/S5': ['Sócrates', 'Glaucón'], 'C4/S2': ['Entrevistador', 'George Akerlof'], 'C4/S3': ['Entrevistador', 'Ronald Coase'], 'C4/S4': ['Sócrates', 'Glaucón'], 'C4/S10': ['Glaucón', 'Sócrates'], 'C4/S11': ['Presentadora', 'Ernesto Schargrodsky', 'Entrevistadora'], 'C4/S8': ['Entrevistador', 'Gary Becker'], 'C4/S1': ['Glaucón', 'Sócrates'], 'C4/S6': ['Moderadora', 'Joseph Stiglitz'], 'C4/S7': ['Entrevistador', 'Frédéric Bastiat'], 'C4/S9': ['Sócrates', 'Glaucón'], 'C5/S5': ['Moderadora', 'Milton Friedman'], 'C5/S2': ['Entrevistador', 'Joseph Schumpeter'], 'C5/S3': ['Entrevistador', 'Karl Marx'], 'C5/S4': ['Glaucón', 'Sócrates'], 'C5/S1': ['Glaucón', 'Sócrates'], 'C2/S5': ['Glaucón', 'Sócrates'], 'C2/S2': ['Sócrates', 'Glaucón'], 'C2/S3': ['Glaucón', 'Sócrates'], 'C2/S4': ['Glaucón', 'Sócrates'], 'C2/S8': ['Glaucón', 'Sócrates'], 'C2/S1': ['Sócrates', 'Glaucón'], 'C2/S6': ['Glaucón', 'Sócrates'], 'C2/S7': ['Entrevistador', 'Adam Smith']}
\ No newline at end of file
+#!/usr/bin/env python3
+"""
+Generate section_characters.json from the section dialogue.
+
+Every section's main.txt is read line by line (never loaded whole) and
+the speaker of each "Name: text" line is collected, in order of first
+appearance. Unprefixed lines continue the previous speaker's utterance.
+A label that does not look like a name (e.g. "Miembro de la audiencia")
+is only accepted if it occurs at least MIN_LABEL_LINES times in the whole
+book; otherwise it is a sentence that happens to end in a colon and its
+words are credited to the speaker it interrupted.
+Besides the character list per section, used by the viewer, the parser
+records per-speaker line and word counts in section_stats.json.
+
+Sections are parsed in parallel worker processes, and the results are
+cached in .section_characters_cache.json by path, size and mtime, so
+only files that changed since the last run are parsed again.
+
+Usage:
+    python3 section_characters.py [--book-path BOOK_PATH] [--jobs N] [--force]
+"""
+
+import os
+import sys
+import json
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Tuple
+
+from book_scanner import scan_book
+from dialogue import is_name_like, section_id, split_speaker
+from update_audio_manifest import write_json_atomic
+
+CHARACTERS_FILE = 'section_characters.json'
+STATS_FILE = 'section_stats.json'
+CACHE_FILE = '.section_characters_cache.json'
+CACHE_VERSION = 1
+
+# Below this many changed files a process pool costs more than it saves
+MIN_PARALLEL_FILES = 8
+
+# Lines a non-name label needs across the book to count as a speaker
+MIN_LABEL_LINES = 2
+
+def parse_dialogue(path: str) -> Dict:
+    """Stream one main.txt and count lines and words per speaker.
+
+    Returns:
+        {'speakers': {name: {'lines', 'words', 'first_line', 'after'}}, 'lines', 'words'}
+        with speakers in order of first appearance; 'after' is the speaker
+        active before the first line of each label
+    """
+    speakers: Dict[str, Dict] = {}
+    current = current_name = None
+    lines = words = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            speaker, text = split_speaker(line)
+            if speaker is not None:
+                current = speakers.get(speaker)
+                if current is None:
+                    current = speakers[speaker] = {'lines': 0, 'words': 0, 'first_line': number,
+                                                   'after': current_name}
+                current_name = speaker
+                current['lines'] += 1
+            count = len(text.split())
+            if current is not None:
+                current['words'] += count
+            lines += 1
+            words += count
+    return {'speakers': speakers, 'lines': lines, 'words': words}
+
+def load_cache(path: str) -> Dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == CACHE_VERSION:
+            return cache.get('sections', {})
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {}
+
+def collect_sections(book_path: str, cache: Dict, jobs: int = 1,
+                     force: bool = False) -> Tuple[Dict, int]:
+    """Parse every section's main.txt, reusing cached results of unchanged files.
+
+    Returns:
+        (stats by section id in reading order, number of files parsed)
+    """
+    book = scan_book(book_path, read_texts=False)
+    if book is None:
+        raise FileNotFoundError(book_path)
+
+    sections = {}
+    stale = {}
+    for chapter in book.chapters:
+        for section in chapter.sections:
+            if section.is_sinopsis or 'main.txt' not in section.text_files:
+                continue
+            path = os.path.join(section.path, 'main.txt')
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key = section_id(section.rel_path)
+            entry = cache.get(key)
+            if not force and entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+                sections[key] = entry
+            else:
+                sections[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+                stale[key] = path
+
+    if jobs > 1 and len(stale) >= MIN_PARALLEL_FILES:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed = dict(zip(stale, executor.map(parse_dialogue, stale.values())))
+    else:
+        parsed = {key: parse_dialogue(path) for key, path in stale.items()}
+    for key, result in parsed.items():
+        sections[key].update(result)
+    return sections, len(parsed)
+
+def resolve_speakers(sections: Dict) -> Dict[str, Dict]:
+    """Drop labels that are not speakers and return the speakers per section."""
+    label_lines = Counter()
+    for entry in sections.values():
+        for label, counts in entry['speakers'].items():
+            label_lines[label] += counts['lines']
+
+    result = {}
+    for key, entry in sections.items():
+        speakers = {label: dict(counts) for label, counts in entry['speakers'].items()}
+        for label, counts in list(speakers.items()):
+            if is_name_like(label) or label_lines[label] >= MIN_LABEL_LINES:
+                continue
+            del speakers[label]
+            target = speakers.get(counts['after'])
+            if target is not None:
+                target['words'] += counts['words']
+        for counts in speakers.values():
+            del counts['after']
+        result[key] = speakers
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate section_characters.json and section_stats.json',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('--book-path', type=Path, default=Path('book1'),
+                        help='Path to the book directory (default: ./book1)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Parser processes (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true',
+                        help='Reparse every file, ignoring the cache')
+    args = parser.parse_args()
+
+    book_path = args.book_path.resolve()
+    root = book_path.parent
+    cache_path = root / CACHE_FILE
+    try:
+        sections, parsed = collect_sections(str(book_path), load_cache(str(cache_path)),
+                                            max(args.jobs, 1), args.force)
+    except FileNotFoundError:
+        print(f"Error: Book path {book_path} does not exist")
+        return 1
+
+    characters = {}
+    stats = {}
+    for key, speakers in resolve_speakers(sections).items():
+        characters[key] = list(speakers)
+        stats[key] = {'lines': sections[key]['lines'], 'words': sections[key]['words'],
+                      'speakers': speakers}
+    for path, data in ((root / CHARACTERS_FILE, characters), (root / STATS_FILE, stats)):
+        write_json_atomic(path, data, indent=2)
+    write_json_atomic(cache_path, {'version': CACHE_VERSION, 'sections': sections})
+
+    print(f"Generated {CHARACTERS_FILE} and {STATS_FILE}: {len(sections)} sections "
+          f"({parsed} parsed, {len(sections) - parsed} cached)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
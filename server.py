@@ -2,65 +2,987 @@
 """
 Simple HTTP server for testing the chapter viewer locally.
 Run this script and then open http://localhost:8000 in your browser.
+
+Usage:
+    python3 server.py [--port PORT] [--production] [--workers N]
+                      [--max-connections N] [--keep-alive-timeout SECONDS]
+                      [--no-watch] [--poll] [--response-cache-size N]
+                      [--profile-dir DIR] [--profile-threshold-ms MS]
+
+By default the server is single-threaded and speaks HTTP/1.0, which is
+enough for local testing. --production serves requests from a bounded
+worker pool with persistent HTTP/1.1 connections, so a long audio
+download no longer blocks every other request.
+
+Every bookN/ directory in the site root is served. /api/books lists them
+and /api/book-structure/<book> returns one book's structure, built on
+first request and kept in a bounded LRU cache of API responses
+(--response-cache-size), so adding books costs nothing at startup.
+/api/book-structure without a book returns book1.
+
+Unless --no-watch is given, background watchers keep an index of every
+book current and publish changes on /api/events?book=<book> (book1 by
+default; production mode only). /api/manifests and /api/audio-index
+cover every book, or one with ?book=<book>.
+
+/api/book-structure?since=N returns only what changed in a book since
+version N, as a JSON merge patch; see structure_delta.py.
+
+/api/search?q=... searches the dialogue text of every book (or one with
+?book=); see search_index.py.
+/api/text?file=...&from=N&to=M returns a range of utterances of one text
+file without reading the rest of it; see text_offsets.py.
+
+/api/shared-data/<type> serves the shared review data (completed files,
+comments, ...) from memory and applies JSON merge patches sent with
+PATCH, checking If-Match; see shared_data.py. With --git-sync, the
+changes are also committed to a git checkout in batches; see git_sync.py.
+
+At startup the indexes behind these routes are built in the background
+while the server already accepts connections; requests that arrive
+earlier are answered from a snapshot of the last run's responses or wait
+briefly. See warmup.py.
+
+/api/metrics reports request latencies, bytes sent, in-flight requests,
+response cache hit ratios and scan durations in the Prometheus text
+format. --profile-dir saves cProfile stats of slow requests for
+inspection with pstats or snakeviz.
 """
 
 import http.server
 import socketserver
 import os
 import json
+import argparse
+import cProfile
+import gzip
+import hashlib
+import queue
+import shutil
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import urllib.parse
-from datetime import datetime
+from bisect import bisect_left
+from pathlib import Path
+from email.utils import formatdate, parsedate_to_datetime
+
+from book_scanner import BOOK_DIR_RE, DEFAULT_BOOK, book_title, book_to_manifests, book_to_structure, discover_books, \
+    is_book_path, scan_book
+from deletion_journal import DeletionJournal
+from shared_data import VersionConflict, load_stores
+from git_sync import DEFAULT_INTERVAL as GIT_SYNC_INTERVAL, DEFAULT_MAX_CHANGES as GIT_SYNC_MAX_CHANGES, \
+    QUEUE_FILE as GIT_SYNC_QUEUE_FILE, GitError, GitSync, SyncQueue
+from update_audio_manifest import write_json_atomic
+from mp3_metadata import INDEX_FILE as AUDIO_INDEX_FILE, AudioIndex, book_audio_files, public_metadata
+from book_watcher import BookIndex, BookWatcher, EventBroker, format_sse
+from dialogue import book_text_documents, split_speaker
+from search_index import INDEX_FILE as SEARCH_INDEX_FILE, DEFAULT_LIMIT as SEARCH_DEFAULT_LIMIT, SearchIndex
+from text_offsets import INDEX_FILE as TEXT_OFFSETS_FILE, TextOffsetIndex, read_lines_range
+from server_metrics import Metrics
+from structure_delta import StructureHistory, structure_state
+from warmup import DEFAULT_TIMEOUT as WARMUP_TIMEOUT, RETRY_AFTER_SECONDS, SNAPSHOT_FILE, Warmup, \
+    load_snapshot, save_snapshot
+from asset_fingerprints import ASSET_MAP_FILE, HASH_CACHE_FILE as ASSET_HASH_CACHE_FILE, IMMUTABLE_CACHE_CONTROL, AssetHashes, \
+    iter_root_assets
 
 PORT = 8000
+DEFAULT_WORKERS = 16
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_KEEP_ALIVE_TIMEOUT = 15
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_AFTER_SECONDS = 30
 DELETION_HISTORY_FILE = 'deleted_files_history.json'
+DELETION_JOURNAL_FILE = 'deleted_files_history.jsonl'
+SITE_ROOT = os.path.dirname(os.path.abspath(__file__))
+BOOK_DIR = os.path.join(SITE_ROOT, DEFAULT_BOOK)
+DELETABLE_AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.m4a', '.flac')
+MAX_JSON_BODY = 1024 * 1024
+# Serialized API responses kept in memory; least recently used are evicted
+DEFAULT_RESPONSE_CACHE_SIZE = 32
+SEARCH_MAX_LIMIT = 500
+# Text files are re-stat'ed for /api/search at most this often
+SEARCH_REFRESH_SECONDS = 1.0
+# Files edited in place change no directory mtime, so the asset map is
+# rebuilt at least this often even when no book's tree changed
+ASSET_MAP_REFRESH_SECONDS = 10.0
+# Utterances returned by /api/text when 'to' is omitted, and at most
+TEXT_DEFAULT_RANGE = 50
+TEXT_MAX_RANGE = 500
+
+# Serializes read-modify-write cycles on audio_manifest.json files
+_manifest_lock = threading.Lock()
+
+# Deletion history: O(1) journal appends, compacted into DELETION_HISTORY_FILE
+deletion_journal = DeletionJournal(os.path.join(SITE_ROOT, DELETION_HISTORY_FILE),
+                                   os.path.join(SITE_ROOT, DELETION_JOURNAL_FILE))
+
+# Shared review data by type, held in memory; the deletion history store
+# writes through deletion_journal
+shared_data = load_stores(SITE_ROOT, deletion_journal)
+deletion_history = shared_data['deleted_files_history']
+
+# Duration/bitrate metadata of every audio file, persisted between runs
+audio_index = AudioIndex.load(os.path.join(SITE_ROOT, AUDIO_INDEX_FILE))
+
+# Inverted index of the dialogue text, persisted between runs; reading it
+# takes a while, so it is loaded on first use (or by warm-up)
+search_index = None
+_search_refreshed_at = 0.0
+_search_refresh_lock = threading.Lock()
+
+# Byte offsets of every line of the text files, for ranged reads by /api/text
+text_offsets = TextOffsetIndex.load(os.path.join(SITE_ROOT, TEXT_OFFSETS_FILE))
+
+# Live index of each book, kept current by one background watcher per book
+# that publishes to the shared event_broker; see start_watchers()
+book_watchers = {}
+_book_watchers_lock = threading.Lock()
+_watch_use_inotify = None  # None until start_watchers() is called
+event_broker = EventBroker()
+
+def start_watchers(use_inotify=True):
+    """Index every book and start watching it for changes.
 
-def load_deletion_history():
-    """Load the history of deleted files."""
-    if not os.path.exists(DELETION_HISTORY_FILE):
-        return {}
+    Books added later are indexed and watched on first use.
+    """
+    global _watch_use_inotify
+    _watch_use_inotify = use_inotify
+    for book_id in discover_books(SITE_ROOT):
+        watched_index(book_id)
+    return list(book_watchers.values())
+
+def watched_index(book_id):
+    """Return the live BookIndex of a book, or None unless watching."""
+    if _watch_use_inotify is None:
+        return None
+    with _book_watchers_lock:
+        watcher = book_watchers.get(book_id)
+        if watcher is None:
+            index = BookIndex(os.path.join(SITE_ROOT, book_id), SITE_ROOT)
+            index.build()
+            watcher = BookWatcher(index, event_broker, use_inotify=_watch_use_inotify)
+            watcher.start()
+            book_watchers[book_id] = watcher
+        return watcher.index
+
+# Content hashes for fingerprinted asset URLs ('path?v=<hash>')
+asset_hashes = AssetHashes.load(os.path.join(SITE_ROOT, ASSET_HASH_CACHE_FILE))
+
+# Request, cache and scan metrics served at /api/metrics
+metrics = Metrics(prefix='bookserver_')
+metrics.counter('requests_total', 'Requests handled, by route, method and status')
+metrics.histogram('request_duration_seconds', 'Time from request line to response sent, by route')
+metrics.counter('response_bytes_total', 'Response body bytes sent, by route')
+metrics.gauge('requests_in_flight', 'Requests currently being handled')
+metrics.counter('response_cache_requests_total', 'Cached API response lookups, by cache and result')
+metrics.counter('response_cache_evictions_total', 'Cached API responses evicted to stay within --response-cache-size')
+metrics.histogram('scan_duration_seconds', 'Filesystem scans of the books, by kind')
+metrics.counter('profiles_written_total', 'cProfile dumps written for slow requests')
+metrics.gauge('warmup_step_seconds', 'Duration of each startup warm-up step')
+metrics.counter('warmup_requests_total', 'Requests made during warm-up, by how they were answered')
+metrics.gauge('start_time_seconds', 'Unix time the server process started')
+metrics.set('start_time_seconds', round(time.time(), 3))
+
+# Exact paths of the API routes; everything else is labelled by route_label()
+API_ROUTES = {'/', '/index.html', '/' + ASSET_MAP_FILE, '/api/books', '/api/book-structure', '/api/manifests',
+              '/api/audio-index', '/api/events', '/api/search', '/api/text', '/api/metrics', '/api/delete-audio/batch'}
+
+def route_label(path):
+    """Map a request path to a low-cardinality route label for metrics."""
+    path = urllib.parse.urlparse(path).path
+    if path in API_ROUTES:
+        return path
+    if path.startswith('/api/delete-audio/'):
+        return '/api/delete-audio'
+    if path.startswith('/api/book-structure/'):
+        return '/api/book-structure/<book>'
+    if path.startswith('/api/shared-data/'):
+        return '/api/shared-data/<type>'
+    if path.startswith('/api/'):
+        return '/api/other'
+    return 'static'
+
+# Encodings that may be served from precompressed siblings, in order of preference
+PRECOMPRESSED_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Process-wide LRU cache of serialized API responses, by name. Each entry
+# holds the key it was built for, 'representations' mapping a content coding
+# (None for identity) to (body, etag), and 'last_modified'.
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+response_cache_size = DEFAULT_RESPONSE_CACHE_SIZE
+
+# Startup warm-up; None (no warm-up, e.g. when imported) counts as finished
+warmup = None
+warmup_timeout = WARMUP_TIMEOUT
+# Responses of the last run by cache name, served while warm-up runs
+_response_snapshot = {}
+# A stale asset map would point at old fingerprints, so it is never snapshotted
+UNSNAPSHOTTED_RESPONSES = {'asset-map'}
+
+def book_directory_signature(book_path=BOOK_DIR):
+    """Return the mtimes of every directory under book_path.
+
+    Adding, removing or renaming an entry changes the mtime of its parent
+    directory, so this is enough to detect structural changes without
+    reading any file.
+    """
+    signature = []
+    with metrics.timer('scan_duration_seconds', kind='signature'):
+        for dirpath, _, _ in os.walk(book_path):
+            try:
+                signature.append((dirpath, os.stat(dirpath).st_mtime_ns))
+            except OSError:
+                continue
+    return tuple(signature)
+
+def build_representations(payload):
+    """Serialize a JSON payload once, compactly, plus its gzip encoding.
+
+    Each representation gets its own strong ETag, as required for
+    different content codings of the same resource.
+    """
+    return body_representations(json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode())
+
+def body_representations(body):
+    """Build the representations of an already serialized JSON body."""
+    digest = hashlib.sha1(body).hexdigest()
+    return {
+        None: (body, f'"{digest}"'),
+        'gzip': (gzip.compress(body, mtime=0), f'"{digest}-gzip"'),
+    }
+
+def get_cached_response(name, cache_key, build_payload, last_modified):
+    """Return (representations, last_modified) for a cached JSON response.
+
+    build_payload is only called when cache_key differs from the key the
+    cached entry was built for. Once more than response_cache_size entries
+    are held, the least recently used ones are evicted.
+    """
+    with _response_cache_lock:
+        entry = _response_cache.get(name)
+        hit = entry is not None and entry['key'] == cache_key
+        # Per-book entries share one label to keep the metric's cardinality fixed
+        label = name.split('/', 1)[0]
+        metrics.inc('response_cache_requests_total', cache=label, result='hit' if hit else 'miss')
+        if not hit:
+            entry = {
+                'key': cache_key,
+                'representations': build_representations(build_payload()),
+                'last_modified': last_modified,
+            }
+            _response_cache[name] = entry
+        _response_cache.move_to_end(name)
+        while len(_response_cache) > response_cache_size:
+            _response_cache.popitem(last=False)
+            metrics.inc('response_cache_evictions_total')
+        return entry['representations'], entry['last_modified']
+
+def restore_response_snapshot(path):
+    """Load the responses saved at the last shutdown.
+
+    Every entry can be served while warm-up runs; entries with a cache key
+    are also put back into the response cache, where they are hits as long
+    as the key still matches.
+    """
+    for name, entry in load_snapshot(path).items():
+        representations = body_representations(entry['body'])
+        _response_snapshot[name] = (representations, entry['last_modified'])
+        if entry['key'] is not None:
+            with _response_cache_lock:
+                _response_cache[name] = {
+                    'key': entry['key'],
+                    'representations': representations,
+                    'last_modified': entry['last_modified'],
+                }
+                while len(_response_cache) > response_cache_size:
+                    _response_cache.popitem(last=False)
+    return len(_response_snapshot)
+
+def has_watch_key(key):
+    """Whether a cache key is, or contains, a watcher version."""
+    if not isinstance(key, tuple):
+        return False
+    return key[:1] == ('watch',) or any(has_watch_key(part) for part in key)
+
+def save_response_snapshot(path):
+    """Save the response cache for restore_response_snapshot().
+
+    Snapshot entries that were not rebuilt in this run (e.g. when it was
+    stopped during warm-up) are kept, without their cache key.
+    """
+    entries = {name: {'key': None, 'last_modified': last_modified, 'body': representations[None][0]}
+               for name, (representations, last_modified) in _response_snapshot.items()}
+    with _response_cache_lock:
+        entries.update({name: {
+            # Watcher versions restart at 0, so such keys must not match next time
+            'key': None if has_watch_key(entry['key']) else entry['key'],
+            'last_modified': entry['last_modified'],
+            'body': entry['representations'][None][0],
+        } for name, entry in _response_cache.items() if name not in UNSNAPSHOTTED_RESPONSES})
+    save_snapshot(path, entries)
+
+# Versions and recent changes of each book's structure, by book id
+_structure_histories = {}
+_structure_histories_lock = threading.Lock()
+
+def structure_history(book_id):
+    with _structure_histories_lock:
+        if book_id not in _structure_histories:
+            _structure_histories[book_id] = StructureHistory()
+        return _structure_histories[book_id]
+
+def signature_last_modified(signature):
+    """Format the newest directory mtime of a signature as an HTTP date."""
+    newest = max((mtime for _, mtime in signature), default=0)
+    return formatdate(newest / 1e9, usegmt=True)
+
+def book_cache_key(book_id=DEFAULT_BOOK):
+    """Return (cache_key, last_modified) for responses built from a book's tree.
+
+    While the watcher runs, its index version changes whenever the tree
+    does, so validating a cached response costs nothing. Otherwise the
+    key is the directory signature, which takes a walk of the tree.
+    """
+    index = watched_index(book_id)
+    if index is not None:
+        return ('watch', book_id, index.version), formatdate(index.updated_at, usegmt=True)
+    signature = book_directory_signature(os.path.join(SITE_ROOT, book_id))
+    return signature, signature_last_modified(signature)
+
+def get_cached_book_structure(book_id, build_structure):
+    """Return (representations, last_modified) for one book's structure.
+
+    build_structure(book_id) is only called when the book's cache key
+    differs from the one the cached body was built from.
+    """
+    key, last_modified = book_cache_key(book_id)
+    return get_cached_response(f'book-structure/{book_id}', key,
+                               lambda: build_structure(book_id), last_modified)
+
+def get_cached_books():
+    """Return (representations, last_modified) for /api/books.
+
+    Only the site root is listed and each book's title.txt read; no book
+    is scanned.
+    """
+    key = []
+    for name in discover_books(SITE_ROOT):
+        try:
+            mtime_ns = os.stat(os.path.join(SITE_ROOT, name, 'title.txt')).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        key.append((name, mtime_ns))
+    def build():
+        return {"books": [{
+            "id": name,
+            "title": book_title(os.path.join(SITE_ROOT, name)),
+            "structure": f"/api/book-structure/{name}",
+        } for name, _ in key]}
+    newest = max((mtime for _, mtime in key if mtime), default=0)
+    return get_cached_response('books', tuple(key), build,
+                               formatdate(max(newest / 1e9, os.stat(SITE_ROOT).st_mtime), usegmt=True))
+
+def get_cached_book_response(name, book_id, build):
+    """Return (representations, last_modified) for a response built per book.
+
+    build(book_id) returns a dict keyed by site-relative path. With a
+    book_id the response covers that book; with None it merges every
+    book, like the bundles generate_book_structure.py writes.
+    """
+    if book_id is not None:
+        key, last_modified = book_cache_key(book_id)
+        return get_cached_response(f'{name}/{book_id}', key, lambda: build(book_id), last_modified)
+    books = discover_books(SITE_ROOT)
+    keys = [book_cache_key(book) for book in books]
+    def build_all():
+        payload = {}
+        for book in books:
+            payload.update(build(book))
+        return payload
+    last_modified = max((last_modified for _, last_modified in keys),
+                        key=parsedate_to_datetime, default=formatdate(0, usegmt=True))
+    return get_cached_response(name, tuple(key for key, _ in keys), build_all, last_modified)
+
+def build_manifests(book_id):
+    """Return a book's manifests; the watcher's index is served as is."""
+    index = watched_index(book_id)
+    if index is None:
+        index = BookIndex(os.path.join(SITE_ROOT, book_id), SITE_ROOT)
+        with metrics.timer('scan_duration_seconds', kind='manifests'):
+            index.build()
+    return index.manifests()
+
+def get_cached_manifests(book_id=None):
+    """Return (representations, last_modified) for the manifest bundle of one or every book."""
+    return get_cached_book_response('manifests', book_id, build_manifests)
+
+def build_audio_index(book_id):
+    """Refresh a book's audio metadata; only new or changed files are parsed."""
+    with metrics.timer('scan_duration_seconds', kind='audio_index'):
+        book = scan_book(os.path.join(SITE_ROOT, book_id), SITE_ROOT, read_texts=False)
+        if book is None:
+            return {}
+        # The index file is shared by every book; only this book's entries may go
+        files = audio_index.update(book_audio_files(book), within=book_id + '/')
+        audio_index.save()
+    return {path: public_metadata(entry) for path, entry in files.items()}
+
+def get_cached_audio_index(book_id=None):
+    """Return (representations, last_modified) for /api/audio-index of one or every book."""
+    return get_cached_book_response('audio-index', book_id, build_audio_index)
+
+def refresh_search_index():
+    """Re-index text files that changed since the last check.
+
+    Editing a file in place does not change any directory mtime, so every
+    text file is stat'ed, but no more than once per SEARCH_REFRESH_SECONDS.
+    """
+    global _search_refreshed_at, search_index
+    with _search_refresh_lock:
+        if search_index is None:
+            search_index = SearchIndex.load(os.path.join(SITE_ROOT, SEARCH_INDEX_FILE), SITE_ROOT, text_offsets)
+        if time.monotonic() - _search_refreshed_at < SEARCH_REFRESH_SECONDS:
+            return
+        with metrics.timer('scan_duration_seconds', kind='search_index'):
+            documents = []
+            for book_id in discover_books(SITE_ROOT):
+                book = scan_book(os.path.join(SITE_ROOT, book_id), SITE_ROOT, read_texts=False)
+                if book is not None:
+                    documents.extend(book_text_documents(book))
+            search_index.update(documents)
+            search_index.save()
+        _search_refreshed_at = time.monotonic()
+
+def build_asset_map():
+    """Return the current asset map; only new or changed files are hashed."""
+    with metrics.timer('scan_duration_seconds', kind='asset_map'):
+        assets = asset_hashes.asset_map(SITE_ROOT)
+        asset_hashes.save()
+    return {'version': 1, 'assets': assets}
+
+def get_cached_asset_map():
+    """Return (representations, last_modified) for asset-map.json.
+
+    The map is rebuilt when a book's tree or a top-level asset changed, and
+    at least every ASSET_MAP_REFRESH_SECONDS; a hit hashes and walks nothing.
+    """
+    books = discover_books(SITE_ROOT)
+    key = [book_cache_key(book_id)[0] for book_id in books]
+    for rel_path, full_path in iter_root_assets(SITE_ROOT, books):
+        try:
+            st = os.stat(full_path)
+            key.append((rel_path, st.st_size, st.st_mtime_ns))
+        except OSError:
+            continue
+    key.append(int(time.monotonic() // ASSET_MAP_REFRESH_SECONDS))
+    return get_cached_response('asset-map', tuple(key), build_asset_map, formatdate(time.time(), usegmt=True))
+
+def build_book_structure(book_id=DEFAULT_BOOK):
+    """Scan one book and return its structure as served by /api/book-structure."""
+    with metrics.timer('scan_duration_seconds', kind='book_structure'):
+        book = scan_book(os.path.join(SITE_ROOT, book_id), SITE_ROOT)
+    if book is None:
+        return {"error": f"{book_id} directory not found"}
+    structure = book_to_structure(book)
+    structure["assetMap"] = ASSET_MAP_FILE
+    structure["version"] = structure_history(book_id).record(structure_state(structure, book_to_manifests(book)))
+    return structure
+
+def book_structure_changes(book_id, since):
+    """Return the payload of /api/book-structure?since=N and its Last-Modified.
+
+    The payload holds a merge patch from version since to the current
+    one, or the full state when since is not in the history.
+    """
+    # Rebuilds (and records) the structure if the directory changed
+    get_cached_book_structure(book_id, build_book_structure)
+    history = structure_history(book_id)
+    if history.state is None:
+        # The cached structure came from the warm-up snapshot of an earlier run
+        build_book_structure(book_id)
+    version, patch, state = history.changes_since(since)
+    payload = {"id": book_id, "version": version}
+    if patch is not None:
+        payload.update(since=since, patch=patch)
+    else:
+        payload["state"] = state
+    return payload, formatdate(history.updated_at, usegmt=True)
+
+def render_index_html():
+    """Return index.html with script.js and styles.css fingerprinted."""
+    with open(os.path.join(SITE_ROOT, 'index.html'), 'rb') as f:
+        html = f.read()
+    for attribute, name in (('src', 'script.js'), ('href', 'styles.css')):
+        digest = asset_hashes.get(name, os.path.join(SITE_ROOT, name))
+        if digest is not None:
+            html = html.replace(f'{attribute}="{name}"'.encode(),
+                                f'{attribute}="{name}?v={digest}"'.encode())
+    return html
+
+def negotiate_encoding(accept_encoding, available):
+    """Pick the best content coding from available for an Accept-Encoding value.
+
+    available is ordered by server preference. Returns None for identity.
+    """
+    if not accept_encoding:
+        return None
     
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            weights[coding] = q
+    
+    best, best_q = None, 0.0
+    for coding in available:
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def etag_matches(if_none_match, etag):
+    """Check an If-None-Match header value against a strong ETag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+def not_modified_since(if_modified_since, last_modified):
+    """Check an If-Modified-Since header value against Last-Modified."""
+    if not if_modified_since:
+        return False
     try:
-        with open(DELETION_HISTORY_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"Warning: Could not read deletion history: {e}")
-        return {}
-
-def save_deletion_history(history):
-    """Save the history of deleted files."""
-    try:
-        with open(DELETION_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
-    except IOError as e:
-        print(f"Warning: Could not save deletion history: {e}")
-
-def record_deletion(history, file_path, reason="user_deleted"):
-    """Record a file deletion in the history."""
-    history[file_path] = {
-        'deleted_at': datetime.now().isoformat(),
-        'reason': reason
-    }
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+def resolve_deletable_audio(file_path):
+    """Check that a site-relative path names an existing audio file in a book.
+
+    Returns:
+        (full_path, None) if the file may be deleted, otherwise
+        (None, (status, error payload))
+    """
+    normalized = os.path.normpath(file_path).replace('\\', '/')
+    # Security check: ensure file is an audio file and within a book directory
+    if (normalized != file_path or not is_book_path(file_path) or
+            not file_path.lower().endswith(DELETABLE_AUDIO_EXTENSIONS)):
+        return None, (403, {"error": "Access denied"})
+    
+    full_path = os.path.join(SITE_ROOT, file_path)
+    if not os.path.isfile(full_path):
+        return None, (404, {"error": "File not found"})
+    return full_path, None
+
+def resolve_book_param(params):
+    """Check an optional ?book= parameter against the books in the site root.
+
+    Returns:
+        (book_id, None), with None for a missing parameter, otherwise
+        (None, (status, error payload))
+    """
+    book_id = params.get('book', [None])[0]
+    if book_id is None:
+        return None, None
+    if not is_book_path(f'{book_id}/') or book_id not in discover_books(SITE_ROOT):
+        return None, (404, {"error": f"Unknown book: {book_id}"})
+    return book_id, None
+
+def resolve_book_text(file_path):
+    """Check that a site-relative path names an existing text file in a book.
+
+    Returns:
+        (full_path, None), otherwise (None, (status, error payload))
+    """
+    normalized = os.path.normpath(file_path).replace('\\', '/')
+    if normalized != file_path or not is_book_path(file_path) or not file_path.endswith('.txt'):
+        return None, (403, {"error": "Access denied"})
+    
+    full_path = os.path.join(SITE_ROOT, file_path)
+    if not os.path.isfile(full_path):
+        return None, (404, {"error": "File not found"})
+    return full_path, None
+
+def remove_from_audio_manifest(dir_path, filenames):
+    """Drop filenames from a folder's audio_manifest.json with one rewrite."""
+    manifest_path = os.path.join(dir_path, 'audio_manifest.json')
+    with _manifest_lock:
+        if not os.path.exists(manifest_path):
+            return
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            
+            remaining = [name for name in manifest if name not in set(filenames)]
+            if len(remaining) != len(manifest):
+                write_json_atomic(Path(manifest_path), remaining)
+        except Exception as e:
+            print(f"Warning: Could not update manifest: {e}")
+
+def parse_byte_ranges(range_header, size):
+    """Parse a Range header into a sorted list of inclusive (start, end) pairs.
+
+    Returns None when the header should be ignored (wrong unit or bad
+    syntax) and an empty list when no range is satisfiable for a file of
+    the given size. Overlapping and adjacent ranges are merged.
+    """
+    unit, _, specs = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+    
+    ranges = []
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        first, sep, last = spec.partition('-')
+        first, last = first.strip(), last.strip()
+        if not sep or not (first.isdigit() or last.isdigit()):
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            if not first.isdigit() or (last and not last.isdigit()):
+                return None
+            start = int(first)
+            end = int(last) if last else size - 1
+            if end < start and last:
+                return None
+            end = min(end, size - 1)
+        if start < size:
+            ranges.append((start, end))
+    
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
 
 class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # Set from --profile-dir / --profile-threshold-ms: requests slower than
+    # the threshold have their cProfile stats written to profile_dir
+    profile_dir = None
+    profile_threshold = 0.5
+    
+    def parse_request(self):
+        # The request line has been read: start timing here so that idle
+        # keep-alive time is not counted
+        self._started = time.perf_counter()
+        self._status = None
+        self._body_bytes = 0
+        self._profiler = None
+        metrics.inc('requests_in_flight')
+        if self.profile_dir:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return super().parse_request()
+    
+    def handle_one_request(self):
+        self._started = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._started is not None:
+                self.record_request()
+    
+    def record_request(self):
+        """Record metrics (and a profile, if slow enough) for the request just handled."""
+        elapsed = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+        metrics.inc('requests_in_flight', -1)
+        route = route_label(self.path) if self.command else 'invalid'
+        metrics.inc('requests_total', route=route, method=self.command or '-', status=self._status or '-')
+        if route != '/api/events':
+            # Event streams stay open for as long as the client listens
+            metrics.observe('request_duration_seconds', elapsed, route=route)
+        if self.command != 'HEAD' and self._status not in (204, 304):
+            metrics.inc('response_bytes_total', self._body_bytes, route=route)
+        if self._profiler is not None and elapsed >= self.profile_threshold:
+            self.write_profile(route, elapsed)
+    
+    def write_profile(self, route, elapsed):
+        name = '{}-{}-{}-{}ms-{}.prof'.format(
+            time.strftime('%Y%m%d-%H%M%S'), self.command,
+            route.strip('/').replace('/', '_') or 'root', int(elapsed * 1000), uuid.uuid4().hex[:6])
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            self._profiler.dump_stats(os.path.join(self.profile_dir, name))
+            metrics.inc('profiles_written_total')
+        except OSError as e:
+            print(f"Warning: Could not write profile {name}: {e}")
+    
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+    
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length':
+            self._body_bytes = int(value)
+        super().send_header(keyword, value)
+    
     def end_headers(self):
         # Add CORS headers to allow local file access
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PATCH, DELETE, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match, If-Modified-Since, If-Match, Range, If-Range')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, Last-Modified, Accept-Ranges, Content-Range, Content-Length')
         super().end_headers()
     
+    def send_json(self, status, payload, headers=None):
+        """Send a JSON response with an explicit Content-Length.
+
+        Every response needs a length so that persistent HTTP/1.1
+        connections know where the body ends.
+        """
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for keyword, value in (headers or {}).items():
+            self.send_header(keyword, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
     def do_OPTIONS(self):
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
+    def static_cache_control(self, path):
+        """Return the Cache-Control value for a static file, if any.
+
+        A fingerprinted URL ('?v=<hash>') is immutable as long as the hash
+        matches the file; a stale or unknown fingerprint gets the default
+        heuristic caching.
+        """
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        fingerprint = query.get('v', [None])[0]
+        if not fingerprint:
+            return None
+        rel_path = os.path.relpath(path, SITE_ROOT).replace(os.sep, '/')
+        if rel_path.startswith('..'):
+            return None
+        if asset_hashes.get(rel_path, path) == fingerprint:
+            return IMMUTABLE_CACHE_CONTROL
+        return None
+    
+    def send_head(self):
+        """Serve regular files with Range support; defer everything else.
+
+        Directories, redirects and listings keep the stock behaviour. For
+        files, a satisfiable Range on a GET yields 206 Partial Content
+        (multipart/byteranges when several ranges are requested) and the
+        selected ranges are left in self.byte_ranges for copyfile.
+        """
+        self.byte_ranges = None
+        self.multipart_boundary = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or path.endswith('/'):
+            return super().send_head()
+        
+        encoding, body_path, has_variants = self.select_precompressed(path)
+        try:
+            f = open(body_path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        
+        try:
+            fs = os.fstat(f.fileno())
+            size = fs.st_size
+            ctype = self.guess_type(path)
+            last_modified = self.date_time_string(fs.st_mtime)
+            cache_control = self.static_cache_control(path)
+            
+            if ('If-None-Match' not in self.headers and
+                    not_modified_since(self.headers.get('If-Modified-Since'), last_modified)):
+                self.send_response(304)
+                self.send_header('Last-Modified', last_modified)
+                if cache_control:
+                    self.send_header('Cache-Control', cache_control)
+                self.end_headers()
+                f.close()
+                return None
+            
+            ranges = None
+            range_header = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            if range_header and self.command == 'GET' and (not if_range or if_range.strip() == last_modified):
+                ranges = parse_byte_ranges(range_header, size)
+            
+            if ranges is not None and not ranges:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                f.close()
+                return None
+            
+            if not ranges:
+                self.send_response(200)
+                self.send_header('Content-type', ctype)
+                self.send_header('Content-Length', str(size))
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                self.send_response(206)
+                self.send_header('Content-type', ctype)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                self.send_header('Content-Length', str(end - start + 1))
+            else:
+                boundary = uuid.uuid4().hex
+                parts = []
+                content_length = 0
+                for start, end in ranges:
+                    part_header = (f'\r\n--{boundary}\r\n'
+                                   f'Content-Type: {ctype}\r\n'
+                                   f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode()
+                    parts.append((part_header, start, end))
+                    content_length += len(part_header) + end - start + 1
+                content_length += len(f'\r\n--{boundary}--\r\n')
+                self.multipart_boundary = boundary
+                ranges = parts
+                self.send_response(206)
+                self.send_header('Content-type', f'multipart/byteranges; boundary={boundary}')
+                self.send_header('Content-Length', str(content_length))
+            
+            self.byte_ranges = ranges
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            if has_variants:
+                self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Last-Modified', last_modified)
+            if cache_control:
+                self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            return f
+        except:
+            f.close()
+            raise
+    
+    def select_precompressed(self, path):
+        """Choose between a file and its precompressed .br/.gz siblings.
+
+        Siblings are written by compress_assets.py; one is only used when it
+        is at least as new as the original and the client accepts its
+        coding. Returns (encoding, path to send, whether siblings exist).
+        """
+        try:
+            source_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, path, False
+        
+        available = {}
+        for coding, suffix in PRECOMPRESSED_ENCODINGS:
+            try:
+                if os.stat(path + suffix).st_mtime_ns >= source_mtime:
+                    available[coding] = path + suffix
+            except OSError:
+                continue
+        if not available:
+            return None, path, False
+        
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding'), list(available))
+        return encoding, available.get(encoding, path), True
+    
+    def copyfile(self, source, outputfile):
+        """Copy the file (or the requested byte ranges) to the client.
+
+        Real files are sent with socket.sendfile, which uses os.sendfile
+        when the platform has it and falls back to send() otherwise.
+        """
+        try:
+            source.fileno()
+        except (AttributeError, OSError, ValueError):
+            # In-memory bodies such as directory listings
+            shutil.copyfileobj(source, outputfile)
+            return
+        
+        ranges = getattr(self, 'byte_ranges', None)
+        if not ranges:
+            self.connection.sendfile(source)
+        elif self.multipart_boundary is None:
+            start, end = ranges[0]
+            self.connection.sendfile(source, start, end - start + 1)
+        else:
+            for part_header, start, end in ranges:
+                outputfile.write(part_header)
+                self.connection.sendfile(source, start, end - start + 1)
+            outputfile.write(f'\r\n--{self.multipart_boundary}--\r\n'.encode())
+    
     def do_GET(self):
         parsed_path = urllib.parse.urlparse(self.path)
         
-        if parsed_path.path == '/api/book-structure':
-            self.handle_book_structure()
+        if parsed_path.path == '/api/books':
+            self.handle_books()
+        elif parsed_path.path == '/api/book-structure':
+            self.handle_book_structure(DEFAULT_BOOK, urllib.parse.parse_qs(parsed_path.query))
+        elif parsed_path.path.startswith('/api/book-structure/'):
+            self.handle_book_structure(parsed_path.path[len('/api/book-structure/'):],
+                                       urllib.parse.parse_qs(parsed_path.query))
+        elif parsed_path.path.startswith('/api/shared-data/'):
+            self.handle_shared_data_get(parsed_path.path[len('/api/shared-data/'):])
+        elif parsed_path.path == '/api/manifests':
+            self.handle_manifests(urllib.parse.parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/audio-index':
+            self.handle_audio_index(urllib.parse.parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/events':
+            self.handle_events(urllib.parse.parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/search':
+            self.handle_search(urllib.parse.parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/text':
+            self.handle_text(urllib.parse.parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/metrics':
+            self.handle_metrics()
+        elif parsed_path.path == '/' + ASSET_MAP_FILE:
+            self.handle_asset_map()
+        elif parsed_path.path in ('/', '/index.html'):
+            self.handle_index()
         else:
             super().do_GET()
     
+    def do_POST(self):
+        parsed_path = urllib.parse.urlparse(self.path)
+        
+        if parsed_path.path == '/api/delete-audio/batch':
+            self.handle_delete_audio_batch()
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+    
+    def do_PATCH(self):
+        parsed_path = urllib.parse.urlparse(self.path)
+        
+        if parsed_path.path.startswith('/api/shared-data/'):
+            self.handle_shared_data_patch(parsed_path.path[len('/api/shared-data/'):])
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+    
     def do_DELETE(self):
         parsed_path = urllib.parse.urlparse(self.path)
         
@@ -68,123 +990,404 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             self.handle_delete_audio()
         else:
             self.send_response(404)
+            self.send_header('Content-Length', '0')
             self.end_headers()
     
-    def handle_book_structure(self):
+    def send_cached_json(self, representations, last_modified):
+        """Send a cached JSON response, honouring conditional GET.
+
+        The representation is picked from Accept-Encoding, and a request
+        whose validators still match gets 304 Not Modified.
+        """
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding'),
+                                      [coding for coding in representations if coding])
+        body, etag = representations[encoding]
+        
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            not_modified = etag_matches(if_none_match, etag)
+        else:
+            not_modified = not_modified_since(self.headers.get('If-Modified-Since'), last_modified)
+        
+        if not_modified:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def answer_during_warmup(self, name, use_snapshot=True):
+        """Answer a request for a cached response made before warm-up finished.
+
+        The response comes from the snapshot if it has one; otherwise the
+        request waits up to warmup_timeout and then gets 503.
+
+        Returns:
+            True if the request was answered, False to build it as usual
+        """
+        if warmup is None or warmup.ready(name):
+            return False
+        snapshot = _response_snapshot.get(name) if use_snapshot else None
+        if snapshot is not None:
+            metrics.inc('warmup_requests_total', result='snapshot')
+            self.send_cached_json(*snapshot)
+            return True
+        if warmup.wait(name, warmup_timeout):
+            metrics.inc('warmup_requests_total', result='waited')
+            return False
+        self.send_warming_up()
+        return True
+    
+    def send_warming_up(self):
+        metrics.inc('warmup_requests_total', result='unavailable')
+        body = json.dumps({"error": "Server is warming up"}).encode()
+        self.send_response(503)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Retry-After', str(RETRY_AFTER_SECONDS))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def handle_books(self):
+        if self.answer_during_warmup('books'):
+            return
         try:
-            book_structure = self.scan_book_directory()
-            
-            self.send_response(200)
+            self.send_cached_json(*get_cached_books())
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+    
+    def handle_book_structure(self, book_id, params=None):
+        if not BOOK_DIR_RE.match(book_id) or not os.path.isdir(os.path.join(SITE_ROOT, book_id)):
+            self.send_json(404, {"error": f"Unknown book: {book_id}"})
+            return
+        since = (params or {}).get('since', [None])[0]
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                self.send_json(400, {"error": "since must be an integer version"})
+                return
+        # The snapshot only holds full documents
+        if self.answer_during_warmup(f'book-structure/{book_id}', use_snapshot=since is None):
+            return
+        try:
+            if since is not None:
+                payload, last_modified = book_structure_changes(book_id, since)
+                self.send_cached_json(build_representations(payload), last_modified)
+                return
+            self.send_cached_json(*get_cached_book_structure(book_id, self.scan_book_directory))
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+    
+    def handle_manifests(self, params):
+        """Answer /api/manifests[?book=...]; every book's folders without a book."""
+        book_id, error = resolve_book_param(params)
+        if error:
+            self.send_json(*error)
+            return
+        if self.answer_during_warmup('manifests' if book_id is None else f'manifests/{book_id}'):
+            return
+        try:
+            self.send_cached_json(*get_cached_manifests(book_id))
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+    
+    def handle_audio_index(self, params):
+        """Answer /api/audio-index[?book=...]; every book's audio files without a book."""
+        book_id, error = resolve_book_param(params)
+        if error:
+            self.send_json(*error)
+            return
+        if self.answer_during_warmup('audio-index' if book_id is None else f'audio-index/{book_id}'):
+            return
+        try:
+            self.send_cached_json(*get_cached_audio_index(book_id))
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+    
+    def handle_shared_data_get(self, data_type):
+        store = shared_data.get(data_type)
+        if store is None:
+            self.send_json(404, {"error": f"Unknown shared data type: {data_type}"})
+            return
+        self.send_cached_json(store.representations(), formatdate(store.updated_at, usegmt=True))
+    
+    def handle_shared_data_patch(self, data_type):
+        """Apply a JSON merge patch to a shared document.
+
+        With If-Match the patch is only applied if the document is still at
+        that version; otherwise 412 is returned with the current ETag and
+        the client rebases its change. The new ETag is returned either way.
+        """
+        store = shared_data.get(data_type)
+        if store is None:
+            self.send_json(404, {"error": f"Unknown shared data type: {data_type}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = 0
+        if length <= 0 or length > MAX_JSON_BODY:
+            self.send_json(400, {"error": "Missing or oversized request body"})
+            return
+        try:
+            patch = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.send_json(400, {"error": "Request body is not valid JSON"})
+            return
+        if not isinstance(patch, dict):
+            self.send_json(400, {"error": "Expected a JSON merge patch object"})
+            return
+        
+        try:
+            version = store.patch(patch, self.headers.get('If-Match'))
+        except VersionConflict as e:
+            body = json.dumps({"error": "Precondition failed", "version": e.version}).encode()
+            self.send_response(412)
             self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', store.etag(e.version))
             self.end_headers()
-            self.wfile.write(json.dumps(book_structure, indent=2).encode())
+            self.wfile.write(body)
+            return
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
+            self.send_json(500, {"error": str(e)})
+            return
+        
+        body = json.dumps({"success": True, "version": version}).encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', store.etag(version))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def handle_asset_map(self):
+        """Serve asset-map.json computed from the files as they are now.
+
+        The map must never point at a stale fingerprint, so instead of the
+        file written by the build it is rebuilt per request (a stat per
+        asset; only changed files are hashed) and revalidated by ETag.
+        """
+        if self.answer_during_warmup('asset-map'):
+            return
+        try:
+            self.send_cached_json(*get_cached_asset_map())
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+    
+    def handle_index(self):
+        """Serve index.html with fingerprinted script and stylesheet URLs."""
+        try:
+            body = render_index_html()
+        except OSError:
+            super().do_GET()
+            return
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if etag_matches(self.headers.get('If-None-Match', ''), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
             self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            return
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
     
-    def scan_book_directory(self):
-        book_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book1')
-        
-        if not os.path.exists(book_path):
-            return {"error": "book1 directory not found"}
+    def handle_metrics(self):
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def handle_search(self, params):
+        """Answer /api/search?q=...&speaker=...&section=...&book=...&limit=...&offset=..."""
+        query = params.get('q', [''])[0].strip()
+        if not query:
+            self.send_json(400, {"error": "Missing q parameter"})
+            return
+        book_id, error = resolve_book_param(params)
+        if error:
+            self.send_json(*error)
+            return
+        try:
+            limit = min(int(params.get('limit', [SEARCH_DEFAULT_LIMIT])[0]), SEARCH_MAX_LIMIT)
+            offset = int(params.get('offset', ['0'])[0])
+        except ValueError:
+            self.send_json(400, {"error": "limit and offset must be integers"})
+            return
+        if limit < 0 or offset < 0:
+            self.send_json(400, {"error": "limit and offset must not be negative"})
+            return
         
-        book_structure = {
-            "title": "Economía Conversada",
-            "chapters": []
-        }
+        try:
+            # Until warm-up has refreshed it, the index loaded from disk is used as is
+            if warmup is None or warmup.wait('search', warmup_timeout):
+                refresh_search_index()
+            elif search_index is None:
+                self.send_warming_up()
+                return
+            started = time.perf_counter()
+            result = search_index.search(query, params.get('speaker', [None])[0],
+                                         params.get('section', [None])[0], limit, offset, book_id)
+            result['query'] = query
+            result['took_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            self.send_json(200, result)
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+    
+    def handle_text(self, params):
+        """Answer /api/text?file=...&from=N&to=M[&by=line] with a range of utterances.
+
+        from/to are 1-based and inclusive; they count utterances (non-blank
+        lines) or, with by=line, line numbers as reported by /api/search.
+        Only the bytes of the requested lines are read from disk.
+        """
+        file_path = params.get('file', [''])[0]
+        by = params.get('by', ['utterance'])[0]
+        if by not in ('utterance', 'line'):
+            self.send_json(400, {"error": "by must be 'utterance' or 'line'"})
+            return
+        try:
+            first = int(params.get('from', ['1'])[0])
+            last = int(params.get('to', [str(first + TEXT_DEFAULT_RANGE - 1)])[0])
+        except ValueError:
+            self.send_json(400, {"error": "from and to must be integers"})
+            return
+        if first < 1 or last < first:
+            self.send_json(400, {"error": "Invalid range"})
+            return
+        if last - first + 1 > TEXT_MAX_RANGE:
+            self.send_json(400, {"error": f"At most {TEXT_MAX_RANGE} utterances per request"})
+            return
         
-        # Get all chapter directories (C1, C2, etc.)
-        chapter_dirs = [d for d in os.listdir(book_path) 
-                       if os.path.isdir(os.path.join(book_path, d)) and d.startswith('C')]
-        chapter_dirs.sort(key=lambda x: int(x[1:]) if x[1:].isdigit() else 0)
+        full_path, error = resolve_book_text(file_path)
+        if error:
+            self.send_json(*error)
+            return
         
-        for chapter_dir in chapter_dirs:
-            chapter_path = os.path.join(book_path, chapter_dir)
-            
-            # Read chapter title
-            chapter_title = self.read_file_content(os.path.join(chapter_path, 'title.txt'))
-            if not chapter_title:
-                chapter_title = f"Capítulo {chapter_dir[1:]}"
-            
-            chapter_data = {
-                "id": chapter_dir,
-                "title": chapter_title,
-                "textFile": f"book1/{chapter_dir}/chapter.txt",
-                "audioFile": self.find_audio_file(chapter_path),
-                "sections": []
-            }
-            
-            # Get all section directories (S1, S2, etc.) and SINOPSIS
-            section_dirs = [d for d in os.listdir(chapter_path)
-                           if os.path.isdir(os.path.join(chapter_path, d)) and 
-                           (d.startswith('S') or d == 'SINOPSIS')]
-            
-            # Sort sections: S1, S2, etc. first, then SINOPSIS last
-            def sort_sections(section):
-                if section.startswith('S') and section[1:].isdigit():
-                    return (0, int(section[1:]))  # Regular sections by number
-                elif section == 'SINOPSIS':
-                    return (1, 0)  # SINOPSIS comes last
-                else:
-                    return (2, 0)  # Other sections at the end
-            
-            section_dirs.sort(key=sort_sections)
-            
-            for section_dir in section_dirs:
-                section_path = os.path.join(chapter_path, section_dir)
-                
-                # Handle SINOPSIS specially
-                if section_dir == 'SINOPSIS':
-                    section_title = self.read_file_content(os.path.join(section_path, 'title.txt'))
-                    if not section_title:
-                        section_title = "Sinopsis"
-                    
-                    section_data = {
-                        "id": section_dir,
-                        "title": section_title,
-                        "textFile": f"book1/{chapter_dir}/{section_dir}/sinopsis.txt",
-                        "audioFile": self.find_audio_file(section_path),
-                        "description": None  # SINOPSIS doesn't have description.txt
-                    }
-                else:
-                    # Regular sections (S1, S2, etc.)
-                    section_title = self.read_file_content(os.path.join(section_path, 'title.txt'))
-                    if not section_title:
-                        section_title = f"Sección {section_dir[1:]}"
-                    
-                    section_data = {
-                        "id": section_dir,
-                        "title": section_title,
-                        "textFile": f"book1/{chapter_dir}/{section_dir}/main.txt",
-                        "audioFile": self.find_audio_file(section_path),
-                        "description": self.read_file_content(os.path.join(section_path, 'description.txt'))
-                    }
-                
-                chapter_data["sections"].append(section_data)
+        try:
+            entry = text_offsets.get(file_path, full_path)
+            if entry is None:
+                self.send_json(404, {"error": "File not found"})
+                return
+            utterances = entry['utterances']
+            if by == 'line':
+                total = len(entry['offsets']) - 1
+                selected = [line for line in utterances if first - 1 <= line <= last - 1]
+                numbers = {line: bisect_left(utterances, line) + 1 for line in selected}
+            else:
+                total = len(utterances)
+                selected = utterances[first - 1:last]
+                numbers = {line: first + i for i, line in enumerate(selected)}
+            last = min(last, total)
             
-            book_structure["chapters"].append(chapter_data)
-        
-        return book_structure
+            items = []
+            if selected:
+                lines = read_lines_range(full_path, entry, selected[0], selected[-1])
+                for line in selected:
+                    speaker, text = split_speaker(lines[line - selected[0]])
+                    items.append({"utterance": numbers[line], "line": line + 1,
+                                  "speaker": speaker, "text": text})
+            self.send_json(200, {
+                "file": file_path,
+                "by": by,
+                "from": first,
+                "to": last,
+                "total": total,
+                "items": items,
+                "next": last + 1 if last < total else None,
+            })
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
     
-    def read_file_content(self, file_path):
+    def handle_events(self, params):
+        """Stream one book's index changes to the client as Server-Sent Events.
+
+        ?book= picks the book (book1 by default). The stream holds its
+        connection (and, in production mode, a worker) open until the
+        client goes away, so it is refused by the single-threaded server,
+        and beyond the server's max_streams.
+        """
+        book_id, error = resolve_book_param(params)
+        if error:
+            self.send_json(*error)
+            return
+        book_id = book_id or DEFAULT_BOOK
+        if watched_index(book_id) is None or not getattr(self.server, 'supports_streaming', False):
+            self.send_json(503, {"error": "Event stream requires the watcher and --production mode"})
+            return
+        if not self.server.acquire_stream():
+            self.send_json(503, {"error": "Too many open event streams"},
+                           headers={'Retry-After': str(SSE_RETRY_AFTER_SECONDS)})
+            return
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read().strip()
-        except:
-            return None
+            self.stream_events(book_id)
+        finally:
+            self.server.release_stream()
     
-    def find_audio_file(self, directory):
-        audio_extensions = ['.mp3', '.wav', '.ogg', '.m4a']
+    def stream_events(self, book_id):
+        try:
+            last_event_id = int(self.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            last_event_id = None
         
-        for file in os.listdir(directory):
-            for ext in audio_extensions:
-                if file.lower().endswith(ext):
-                    rel_path = os.path.relpath(os.path.join(directory, file), 
-                                             os.path.dirname(os.path.abspath(__file__)))
-                    return rel_path.replace('\\', '/')
-        return None
+        subscriber = event_broker.subscribe(last_event_id)
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            backend_name = book_watchers[book_id].backend_name
+            self.wfile.write(f'retry: 5000\n: watching {book_id} with {backend_name}\n\n'.encode())
+            
+            while True:
+                try:
+                    item = subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    self.wfile.write(b': ping\n\n')
+                    continue
+                if item is None:
+                    break
+                # The broker carries the events of every book
+                if not item[1]['folder'].startswith(book_id + '/'):
+                    continue
+                self.wfile.write(format_sse(*item))
+        except (BrokenPipeError, ConnectionResetError, TimeoutError):
+            pass
+        finally:
+            event_broker.unsubscribe(subscriber)
+    
+    def scan_book_directory(self, book_id=DEFAULT_BOOK):
+        return build_book_structure(book_id)
     
     def handle_delete_audio(self):
         try:
@@ -192,77 +1395,293 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             # URL format: /api/delete-audio/book1/C1/S1/filename.mp3
             url_parts = self.path.split('/')
             if len(url_parts) < 6:
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Invalid file path"}).encode())
+                self.send_json(400, {"error": "Invalid file path"})
                 return
             
             # Reconstruct the file path
             file_path = '/'.join(url_parts[3:])  # Skip '', 'api', 'delete-audio'
-            full_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_path)
-            
-            if not os.path.exists(full_path):
-                self.send_response(404)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "File not found"}).encode())
-                return
-            
-            # Security check: ensure file is an audio file and within book1 directory
-            if not file_path.startswith('book1/') or not any(file_path.lower().endswith(ext) for ext in ['.mp3', '.wav', '.ogg', '.m4a', '.flac']):
-                self.send_response(403)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Access denied"}).encode())
+            full_path, error = resolve_deletable_audio(file_path)
+            if error:
+                self.send_json(*error)
                 return
             
             # Record deletion in history before deleting the file
-            deletion_history = load_deletion_history()
-            record_deletion(deletion_history, file_path, "user_deleted")
-            save_deletion_history(deletion_history)
+            deletion_history.record_many([file_path], "user_deleted")
             
             # Delete the file
             os.remove(full_path)
             
             # Update the audio manifest
-            dir_path = os.path.dirname(full_path)
-            manifest_path = os.path.join(dir_path, 'audio_manifest.json')
             filename = os.path.basename(full_path)
-            
-            if os.path.exists(manifest_path):
-                try:
-                    with open(manifest_path, 'r', encoding='utf-8') as f:
-                        manifest = json.load(f)
-                    
-                    if filename in manifest:
-                        manifest.remove(filename)
-                        
-                        with open(manifest_path, 'w', encoding='utf-8') as f:
-                            json.dump(manifest, f, indent=0, ensure_ascii=False)
-                except Exception as e:
-                    print(f"Warning: Could not update manifest: {e}")
+            remove_from_audio_manifest(os.path.dirname(full_path), [filename])
             
             print(f"User deleted file: {file_path} (recorded in deletion history)")
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"success": True, "message": f"File {filename} deleted successfully"}).encode())
+            self.send_json(200, {"success": True, "message": f"File {filename} deleted successfully"})
             
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            self.send_json(500, {"error": str(e)})
+    
+    def handle_delete_audio_batch(self):
+        """Delete several audio files in one request.
+
+        The body is {"paths": ["book1/C1/S1/a.mp3", ...]}. Each path gets
+        the same checks as a single deletion; files are grouped by folder
+        so each audio_manifest.json is rewritten once, and the deletion
+        history gets a single journal append for the whole batch.
+        """
+        try:
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                length = 0
+            if length <= 0 or length > MAX_JSON_BODY:
+                self.send_json(400, {"error": "Missing or oversized request body"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(length))
+            except ValueError:
+                self.send_json(400, {"error": "Request body is not valid JSON"})
+                return
+            paths = payload.get('paths') if isinstance(payload, dict) else payload
+            if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+                self.send_json(400, {"error": "Expected {\"paths\": [...]}"})
+                return
+            
+            results = {}
+            by_directory = {}
+            for file_path in dict.fromkeys(paths):
+                full_path, error = resolve_deletable_audio(file_path)
+                if error:
+                    results[file_path] = {"path": file_path, "success": False,
+                                          "status": error[0], "error": error[1]["error"]}
+                else:
+                    by_directory.setdefault(os.path.dirname(full_path), []).append((file_path, full_path))
+            
+            deleted = []
+            for dir_path, files in by_directory.items():
+                removed = []
+                for file_path, full_path in files:
+                    try:
+                        os.remove(full_path)
+                    except OSError as e:
+                        results[file_path] = {"path": file_path, "success": False,
+                                              "status": 500, "error": str(e)}
+                        continue
+                    removed.append(os.path.basename(full_path))
+                    deleted.append(file_path)
+                    results[file_path] = {"path": file_path, "success": True, "status": 200}
+                if removed:
+                    remove_from_audio_manifest(dir_path, removed)
+            
+            deletion_history.record_many(deleted, "user_deleted")
+            print(f"User deleted {len(deleted)} files in batch (recorded in deletion history)")
+            
+            self.send_json(200, {
+                "success": len(deleted) == len(results),
+                "deleted": len(deleted),
+                "failed": len(results) - len(deleted),
+                "results": [results[file_path] for file_path in dict.fromkeys(paths)],
+            })
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+class ThreadPoolHTTPServer(http.server.HTTPServer):
+    """HTTP server that handles each connection on a bounded worker pool.
+
+    At most max_connections sockets are open at once; once the limit is
+    reached the accept loop waits, leaving new clients in the listen
+    backlog. Connections beyond the number of workers are queued until a
+    worker frees up, so keep-alive connections are bounded by the handler's
+    idle timeout.
+
+    An event stream keeps its worker for as long as the client stays
+    connected, so at most half of the workers may hold one; the others
+    stay free for ordinary requests.
+    """
+    allow_reuse_address = True
+    supports_streaming = True
+    
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS,
+                 max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.request_queue_size = max(max_connections, 5)
+        super().__init__(server_address, handler_class)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-worker')
+        self._connection_slots = threading.BoundedSemaphore(max_connections)
+        self.max_streams = workers // 2
+        self._stream_slots = threading.BoundedSemaphore(self.max_streams) if self.max_streams else None
+    
+    def acquire_stream(self):
+        """Reserve a worker for an event stream; False if none may be spared."""
+        return self._stream_slots is not None and self._stream_slots.acquire(blocking=False)
+    
+    def release_stream(self):
+        self._stream_slots.release()
+    
+    def process_request(self, request, client_address):
+        self._connection_slots.acquire()
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # Executor already shut down
+            self._connection_slots.release()
+            self.shutdown_request(request)
+    
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._connection_slots.release()
+    
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def make_server(port=PORT, production=False, workers=DEFAULT_WORKERS,
+                max_connections=DEFAULT_MAX_CONNECTIONS,
+                keep_alive_timeout=DEFAULT_KEEP_ALIVE_TIMEOUT):
+    """Create the server for the requested serving mode.
+
+    Both modes use MyHTTPRequestHandler; production mode only switches it
+    to HTTP/1.1 with an idle timeout for persistent connections.
+    """
+    if not production:
+        return socketserver.TCPServer(("", port), MyHTTPRequestHandler)
+    
+    handler_class = type('KeepAliveHTTPRequestHandler', (MyHTTPRequestHandler,), {
+        'protocol_version': 'HTTP/1.1',
+        'timeout': keep_alive_timeout,
+    })
+    return ThreadPoolHTTPServer(("", port), handler_class, workers=workers,
+                                max_connections=max_connections)
+
+def stop_on_sigterm(signum, frame):
+    # Stop like Ctrl+C so that pending shared data is flushed
+    raise KeyboardInterrupt
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve the chapter viewer and its API')
+    parser.add_argument('--port', type=int, default=PORT,
+                        help=f'Port to listen on (default: {PORT})')
+    parser.add_argument('--production', action='store_true',
+                        help='Use a bounded worker pool with HTTP/1.1 keep-alive')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Worker threads in production mode (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help=f'Open connection limit in production mode (default: {DEFAULT_MAX_CONNECTIONS})')
+    parser.add_argument('--keep-alive-timeout', type=float, default=DEFAULT_KEEP_ALIVE_TIMEOUT,
+                        help=f'Idle seconds before a keep-alive connection is closed (default: {DEFAULT_KEEP_ALIVE_TIMEOUT})')
+    parser.add_argument('--no-watch', action='store_true',
+                        help='Do not watch book1/ for changes (disables /api/events)')
+    parser.add_argument('--poll', action='store_true',
+                        help='Watch book1/ by polling instead of inotify')
+    parser.add_argument('--response-cache-size', type=int, default=DEFAULT_RESPONSE_CACHE_SIZE,
+                        help=f'API responses (e.g. book structures) kept in memory (default: {DEFAULT_RESPONSE_CACHE_SIZE})')
+    parser.add_argument('--git-sync', metavar='REPO',
+                        help='Commit changes to the shared review data to this git checkout in batches')
+    parser.add_argument('--git-sync-interval', type=float, default=GIT_SYNC_INTERVAL,
+                        help=f'Seconds a change may wait before it is committed (default: {GIT_SYNC_INTERVAL:g})')
+    parser.add_argument('--git-sync-max-changes', type=int, default=GIT_SYNC_MAX_CHANGES,
+                        help=f'Queued changes that trigger a commit right away (default: {GIT_SYNC_MAX_CHANGES})')
+    parser.add_argument('--warmup-timeout', type=float, default=WARMUP_TIMEOUT,
+                        help=f'Seconds a request made during startup warm-up waits before it gets 503 '
+                             f'(default: {WARMUP_TIMEOUT:g})')
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help=f'Do not load or save {SNAPSHOT_FILE}, the responses served during warm-up')
+    parser.add_argument('--profile-dir',
+                        help='Profile every request with cProfile and save slow ones here')
+    parser.add_argument('--profile-threshold-ms', type=float, default=500,
+                        help='Minimum duration of a request to save its profile (default: 500)')
+    args = parser.parse_args()
+    if args.workers < 1 or args.max_connections < 1:
+        parser.error('--workers and --max-connections must be at least 1')
+    if args.response_cache_size < 1:
+        parser.error('--response-cache-size must be at least 1')
+    if args.warmup_timeout < 0:
+        parser.error('--warmup-timeout must not be negative')
+    if args.git_sync_interval < 0 or args.git_sync_max_changes < 1:
+        parser.error('--git-sync-interval must not be negative and --git-sync-max-changes must be at least 1')
+    if args.git_sync and os.path.realpath(args.git_sync) == os.path.realpath(SITE_ROOT):
+        parser.error('--git-sync needs a separate checkout, not the site root')
+    return args
 
 if __name__ == "__main__":
+    args = parse_args()
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    response_cache_size = args.response_cache_size
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    
+    git_sync = None
+    if args.git_sync:
+        try:
+            git_sync = GitSync(args.git_sync, SyncQueue(os.path.join(SITE_ROOT, GIT_SYNC_QUEUE_FILE)),
+                               interval=args.git_sync_interval, max_changes=args.git_sync_max_changes)
+        except GitError as e:
+            raise SystemExit(f"Error: {e}")
+        for store in shared_data.values():
+            store.on_change = git_sync.enqueue
+        git_sync.start()
+        print(f"Committing review data changes to {git_sync.repo} every {args.git_sync_interval:g}s"
+              + (f" and pushing to {git_sync.remote}" if git_sync.remote else ""))
+    
+    snapshot_path = os.path.join(SITE_ROOT, SNAPSHOT_FILE)
+    def warmup_step(name, build):
+        def step():
+            started = time.perf_counter()
+            try:
+                build()
+            finally:
+                metrics.set('warmup_step_seconds', round(time.perf_counter() - started, 6), step=name)
+        return name, step
+    
+    def watch():
+        watchers = start_watchers(use_inotify=not args.poll)
+        print(f"Watching {len(watchers)} books for changes "
+              f"({', '.join(sorted({watcher.backend_name for watcher in watchers}))})")
+    
+    # Ordered by when the viewer first needs them
+    steps = [warmup_step('asset-map', get_cached_asset_map)]
+    if not args.no_watch and discover_books(SITE_ROOT):
+        steps.append(warmup_step('watcher', watch))
+    steps.append(warmup_step('books', get_cached_books))
+    steps.extend(warmup_step(f'book-structure/{book_id}',
+                             lambda book_id=book_id: get_cached_book_structure(book_id, build_book_structure))
+                 for book_id in discover_books(SITE_ROOT))
+    steps.extend([warmup_step('manifests', get_cached_manifests),
+                  warmup_step('audio-index', get_cached_audio_index),
+                  warmup_step('search', refresh_search_index)])
+    warmup_timeout = args.warmup_timeout
+    warmup = Warmup(steps)
+    
+    if args.profile_dir:
+        MyHTTPRequestHandler.profile_dir = os.path.abspath(args.profile_dir)
+        MyHTTPRequestHandler.profile_threshold = args.profile_threshold_ms / 1000
+        print(f"Profiling requests slower than {args.profile_threshold_ms:g} ms into {args.profile_dir}")
     
-    with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
-        print(f"Serving at http://localhost:{PORT}")
+    with make_server(args.port, args.production, args.workers,
+                     args.max_connections, args.keep_alive_timeout) as httpd:
+        print(f"Serving at http://localhost:{args.port}")
+        if args.production:
+            print(f"Production mode: {args.workers} workers, "
+                  f"{args.max_connections} max connections, HTTP/1.1 keep-alive")
         print("Press Ctrl+C to stop the server")
+        # Connections made meanwhile wait in the listen backlog
+        if not args.no_snapshot:
+            restored = restore_response_snapshot(snapshot_path)
+            if restored:
+                print(f"Loaded {restored} responses from {SNAPSHOT_FILE}")
+        warmup.start()
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
-            print("\nServer stopped.")
\ No newline at end of file
+            print("\nServer stopped.")
+        finally:
+            for store in shared_data.values():
+                store.close()
+            if git_sync is not None:
+                git_sync.close()
+            if not args.no_snapshot:
+                save_response_snapshot(snapshot_path)
\ No newline at end of file
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+In-process metrics for server.py, exposed in the Prometheus text format.
+
+Counters, gauges and histograms are kept in one registry guarded by a
+single lock; every sample is a dict entry keyed by its sorted label
+values, so recording a sample is O(1) plus the histogram bucket search.
+render() produces the text served at /api/metrics.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Sequence, Tuple
+
+# Request and scan latencies, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metrics:
+    """A registry of named counters, gauges and histograms."""
+
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._kinds: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._samples: Dict[str, Dict[LabelKey, object]] = {}
+
+    def _register(self, kind: str, name: str, help_text: str):
+        self._kinds[name] = kind
+        self._help[name] = help_text
+        self._samples[name] = {}
+
+    def counter(self, name: str, help_text: str):
+        self._register('counter', name, help_text)
+
+    def gauge(self, name: str, help_text: str):
+        self._register('gauge', name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._register('histogram', name, help_text)
+        self._buckets[name] = tuple(sorted(buckets))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add to a counter or gauge."""
+        key = _label_key(labels)
+        with self._lock:
+            samples = self._samples[name]
+            samples[key] = samples.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._samples[name][_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one histogram observation."""
+        key = _label_key(labels)
+        buckets = self._buckets[name]
+        with self._lock:
+            sample = self._samples[name].get(key)
+            if sample is None:
+                # Per-bucket counts (not cumulative), then sum and count
+                sample = self._samples[name][key] = [0] * len(buckets) + [0.0, 0]
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                sample[index] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    def value(self, name: str, **labels):
+        with self._lock:
+            return self._samples[name].get(_label_key(labels), 0)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of a with block in a histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, kind in self._kinds.items():
+                full_name = self.prefix + name
+                lines.append(f'# HELP {full_name} {self._help[name]}')
+                lines.append(f'# TYPE {full_name} {kind}')
+                for key, sample in sorted(self._samples[name].items()):
+                    if kind != 'histogram':
+                        lines.append(f'{full_name}{_format_labels(key)} {_format_value(sample)}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self._buckets[name] + (float('inf'),), sample[:-2] + [None]):
+                        cumulative = sample[-1] if count is None else cumulative + count
+                        le = (('le', _format_value(bound)),)
+                        lines.append(f'{full_name}_bucket{_format_labels(key, le)} {cumulative}')
+                    lines.append(f'{full_name}_sum{_format_labels(key)} {_format_value(sample[-2])}')
+                    lines.append(f'{full_name}_count{_format_labels(key)} {sample[-1]}')
+        return '\n'.join(lines) + '\n'
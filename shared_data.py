@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+In-memory stores for the viewer's shared review data.
+
+completed_files.json, file_comments.json and the other shared documents
+are loaded once and served from memory by /api/shared-data/<type> in
+server.py. Writes are JSON merge patches (RFC 7396): only the entries a
+reviewer changed are sent, a null value removes an entry, and patches to
+different entries never overwrite each other.
+
+Every store has a version that increases with each applied patch. Its
+ETag is '"<epoch>-<version>"', where the epoch is random per process, so
+an ETag from before a restart never matches. A patch sent with If-Match
+is only applied if the store is still at that version; otherwise the
+client gets 412 and rebases its change on the current document.
+
+Changes are flushed to the JSON file atomically (temporary file, fsync,
+os.replace), at most once per FLUSH_DELAY seconds and on shutdown. The
+deletion history keeps its own journal (see deletion_journal.py), which
+DeletionHistoryStore writes through instead.
+"""
+
+import os
+import copy
+import gzip
+import json
+import time
+import uuid
+import threading
+from typing import Dict, Optional
+
+# Shared documents by type, as used in /api/shared-data/<type>
+SHARED_DATA_FILES = {
+    'completed_files': 'completed_files.json',
+    'not_completed_files': 'not_completed_files.json',
+    'file_comments': 'file_comments.json',
+    'confirmed_files': 'confirmed_files.json',
+    'todo_v2_status': 'todo_v2_status.json',
+    'property_assignments': 'property_assignments.json',
+    'deleted_files_history': 'deleted_files_history.json',
+}
+
+# Seconds between the first unflushed change and the write to disk
+FLUSH_DELAY = 1.0
+
+class VersionConflict(Exception):
+    """Raised when a patch's If-Match version is not the current one."""
+
+    def __init__(self, version: int):
+        super().__init__(f"Document is at version {version}")
+        self.version = version
+
+def merge_patch(target, patch):
+    """Apply a JSON merge patch (RFC 7396) and return the result.
+
+    Objects are merged recursively and a null member removes the key;
+    any other patch value replaces the target. target is modified in place
+    when both are objects.
+    """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    if not isinstance(target, dict):
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = merge_patch(target.get(key), value)
+    return target
+
+def merge_diff(source, target) -> Dict:
+    """Return the merge patch that turns source into target.
+
+    Both must be objects without null members, which a merge patch
+    cannot set.
+    """
+    patch = {}
+    for key in source:
+        if key not in target:
+            patch[key] = None
+    for key, value in target.items():
+        if key not in source:
+            patch[key] = copy.deepcopy(value)
+        elif isinstance(value, dict) and isinstance(source[key], dict):
+            changes = merge_diff(source[key], value)
+            if changes:
+                patch[key] = changes
+        elif value != source[key]:
+            patch[key] = copy.deepcopy(value)
+    return patch
+
+class SharedStore:
+    """One shared document held in memory and flushed to its JSON file."""
+
+    def __init__(self, path: str, flush_delay: Optional[float] = FLUSH_DELAY):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.flush_delay = flush_delay
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.updated_at = 0.0
+        self._data: Dict = {}
+        self._flushed_version = 0
+        self._representations = None
+        self._timer = None
+        # Called as on_change(name, patch) after each change, e.g. by git_sync
+        self.on_change = None
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        with self._lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._data = data
+                self.updated_at = os.path.getmtime(self.path)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read {self.path}: {e}")
+
+    def etag(self, version: Optional[int] = None) -> str:
+        return f'"{self.epoch}-{self.version if version is None else version}"'
+
+    def parse_etag(self, etag: str) -> Optional[int]:
+        """Return the version an ETag of this store names, or None."""
+        etag = etag.strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        epoch, _, version = etag.strip('"').partition('-')
+        version = version[:-len('-gzip')] if version.endswith('-gzip') else version
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def check_if_match(self, if_match: Optional[str]):
+        """Raise VersionConflict unless an If-Match header names the current version."""
+        if not if_match or if_match.strip() == '*':
+            return
+        versions = [self.parse_etag(tag) for tag in if_match.split(',')]
+        if self.version not in versions:
+            raise VersionConflict(self.version)
+
+    def representations(self) -> Dict:
+        """Return the serialized document as {coding: (body, etag)}, cached per version."""
+        with self._lock:
+            if self._representations is None or self._representations[0] != self.version:
+                body = json.dumps(self._data, separators=(',', ':'), ensure_ascii=False).encode()
+                etag = self.etag()
+                self._representations = (self.version, {
+                    None: (body, etag),
+                    'gzip': (gzip.compress(body, mtime=0), etag[:-1] + '-gzip"'),
+                })
+            return self._representations[1]
+
+    def patch(self, patch: Dict, if_match: Optional[str] = None) -> int:
+        """Apply a merge patch, checking If-Match first.
+
+        Returns:
+            The new version
+        """
+        with self._lock:
+            self.check_if_match(if_match)
+            applied = self._apply(patch)
+            self.version += 1
+            self.updated_at = time.time()
+            self._schedule_flush()
+            self._notify(applied)
+            return self.version
+
+    def _apply(self, patch: Dict) -> Dict:
+        """Apply a patch and return it as it should be replayed elsewhere."""
+        self._data = merge_patch(self._data, patch)
+        return patch
+
+    def _notify(self, patch: Dict):
+        # Called under the lock so listeners see changes in version order
+        if self.on_change is not None:
+            self.on_change(self.name, patch)
+
+    def _schedule_flush(self):
+        # Without a delay, changes are only written by flush() and close()
+        if self.flush_delay is not None and self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write the document if it changed since the last flush."""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if self.version == self._flushed_version:
+                    return
+                version = self.version
+                data = json.dumps(self._data, indent=2, ensure_ascii=False)
+            tmp_path = self.path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Warning: Could not save {self.path}: {e}")
+                return
+            self._flushed_version = version
+
+    def close(self):
+        """Flush pending changes; call on shutdown."""
+        self.flush()
+
+class DeletionHistoryStore(SharedStore):
+    """The deletion history, written through its DeletionJournal.
+
+    Every change is appended to the journal right away, so nothing is
+    left to flush. Top-level entries are replaced as a whole: a patch value
+    marks a file as deleted and null restores it.
+    """
+
+    def __init__(self, journal):
+        self.journal = journal
+        super().__init__(journal.history_path, flush_delay=None)
+
+    def load(self):
+        with self._lock:
+            self._data = self.journal.history()
+
+    def _apply(self, patch: Dict):
+        deleted = {path: value for path, value in patch.items() if isinstance(value, dict)}
+        restored = [path for path, value in patch.items() if value is None]
+        if len(deleted) + len(restored) != len(patch):
+            raise ValueError("Deletion history entries must be objects or null")
+        self._update(self.journal.apply(deleted, restored))
+        return {path: self._data.get(path) for path in patch}
+
+    def _update(self, changes: Dict):
+        # Only the entries the journal reports as changed, not a fresh copy
+        # of the whole history per deletion
+        for path, entry in changes.items():
+            if entry is None:
+                self._data.pop(path, None)
+            else:
+                self._data[path] = entry
+
+    def record_many(self, file_paths, reason="user_deleted") -> int:
+        """Record deletions made by the server itself."""
+        if not file_paths:
+            return self.version
+        with self._lock:
+            self._update(self.journal.record_many(file_paths, reason))
+            self.version += 1
+            self.updated_at = time.time()
+            self._notify({path: self._data.get(path) for path in file_paths})
+            return self.version
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.journal.close()
+
+def load_stores(root: str, journal) -> Dict[str, SharedStore]:
+    """Create the store of every shared document type under root."""
+    stores = {}
+    for data_type, name in SHARED_DATA_FILES.items():
+        if data_type == 'deleted_files_history':
+            stores[data_type] = DeletionHistoryStore(journal)
+        else:
+            stores[data_type] = SharedStore(os.path.join(root, name))
+    return stores
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Versioned book structures, for /api/book-structure?since=<version>.
+
+A client that already holds the structure and audio manifests of a book
+only needs what changed since then. server.py records every rebuilt
+structure of a book in a StructureHistory, which gives it a new version
+whenever something changed and keeps the last HISTORY_SIZE changes.
+
+Changes are expressed on a keyed form of the book, its "state":
+
+    {"title": ..., "chapterOrder": ["Intro", "C1", ...],
+     "chapters": {"C1": {"title": ..., "textFile": ..., "audioFile": ...,
+                         "sectionOrder": ["S1", ...],
+                         "sections": {"S1": {"title": ..., ...}}}},
+     "audio": {"book1/C1/S1/": {"C1S1-main_1.mp3": true, ...}}}
+
+Null fields are left out, so the difference between two states is a JSON
+merge patch (RFC 7396, see shared_data.py) that names only the added,
+removed or modified chapters, sections and audio files. Versions start
+at the process start time in milliseconds, so they keep increasing
+across restarts and a version from an earlier run is simply too old.
+"""
+
+import json
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from shared_data import merge_diff, merge_patch
+
+# Changes kept per book; clients further behind get the full state
+HISTORY_SIZE = 64
+
+def _without_nulls(entry: Dict, skip=()) -> Dict:
+    return {key: value for key, value in entry.items() if value is not None and key not in skip}
+
+def structure_state(structure: Dict, manifests: Dict) -> Dict:
+    """Key a book-structure document and its manifests by id."""
+    chapters = {}
+    for chapter in structure['chapters']:
+        entry = _without_nulls(chapter, skip=('id', 'sections'))
+        entry['sectionOrder'] = [section['id'] for section in chapter['sections']]
+        entry['sections'] = {section['id']: _without_nulls(section, skip=('id',))
+                             for section in chapter['sections']}
+        chapters[chapter['id']] = entry
+    state = {
+        'chapterOrder': [chapter['id'] for chapter in structure['chapters']],
+        'chapters': chapters,
+        'audio': {folder: {name: True for name in manifest['audio']}
+                  for folder, manifest in manifests.items()},
+    }
+    if structure.get('title') is not None:
+        state['title'] = structure['title']
+    return state
+
+class StructureHistory:
+    """The current state of one book and the changes that led to it.
+
+    Each change is kept as the reverse patch from its version to the one
+    before; a delta is computed by rolling a copy of the current state
+    back to the requested version and diffing it with the current one.
+    Deltas are cached until the next change.
+    """
+
+    def __init__(self, size: int = HISTORY_SIZE):
+        self.version = int(time.time() * 1000)
+        self.updated_at = time.time()
+        self.state: Optional[Dict] = None
+        self._reverse = deque(maxlen=size)
+        self._deltas: Dict[int, Dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, state: Dict) -> int:
+        """Make state the current one.
+
+        Returns:
+            The current version, increased only if state differs
+        """
+        with self._lock:
+            if self.state is None:
+                self.state = state
+                return self.version
+            if not merge_diff(self.state, state):
+                return self.version
+            self._reverse.append((self.version + 1, merge_diff(state, self.state)))
+            self.state = state
+            self.version += 1
+            self.updated_at = time.time()
+            self._deltas = {}
+            return self.version
+
+    def changes_since(self, since: int) -> Tuple[int, Optional[Dict], Optional[Dict]]:
+        """Return (version, patch, None), or (version, None, state) if since is unknown.
+
+        since is unknown when it is older than the kept history, newer than
+        the current version, or nothing has been recorded yet.
+        """
+        with self._lock:
+            if self.state is None or not self.version - len(self._reverse) <= since <= self.version:
+                return self.version, None, self.state
+            patch = self._deltas.get(since)
+            if patch is None:
+                state = json.loads(json.dumps(self.state))
+                for version, reverse in reversed(self._reverse):
+                    if version <= since:
+                        break
+                    state = merge_patch(state, reverse)
+                patch = self._deltas[since] = merge_diff(state, self.state)
+            return self.version, patch, None
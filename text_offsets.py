@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Line and utterance offset index for the book's text documents.
+
+For every text document the index records the byte offset at which each
+line starts and which lines are utterances (non-blank lines). With it a
+range of utterances can be read from disk with a single positioned read
+of just those bytes, which is what /api/text in server.py does, instead
+of reading and splitting the whole file.
+
+The index is built at generation time (build.sh) and persisted to
+.text_offsets.json, keyed by path and validated by size and mtime, so an
+update only rescans files that changed.
+
+Usage:
+    python3 text_offsets.py [--book-path BOOK_PATH] [--index FILE]
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+INDEX_FILE = '.text_offsets.json'
+
+def scan_offsets(path: str) -> Dict:
+    """Record the start offset of every line and the indices of non-blank lines.
+
+    Returns:
+        {'offsets': [...], 'utterances': [...]} where offsets has one entry
+        per line plus the end offset, so line i spans offsets[i]:offsets[i + 1]
+    """
+    offsets = [0]
+    utterances = []
+    position = 0
+    with open(path, 'rb') as f:
+        for number, line in enumerate(f):
+            if line.strip():
+                utterances.append(number)
+            position += len(line)
+            offsets.append(position)
+    return {'offsets': offsets, 'utterances': utterances}
+
+def read_lines_range(path: str, entry: Dict, first: int, last: int) -> List[str]:
+    """Read lines first..last (0-based, inclusive) with one positioned read."""
+    offsets = entry['offsets']
+    start, end = offsets[first], offsets[last + 1]
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        data = os.pread(fd, end - start, start)
+    finally:
+        os.close(fd)
+    # Split on b'\n' only, the same way scan_offsets() counted lines
+    return [line.rstrip(b'\r').decode('utf-8', errors='replace') for line in data.split(b'\n')]
+
+class TextOffsetIndex:
+    """Persistent offset index keyed by site-relative path.
+
+    An entry is reused while the file's size and mtime are unchanged.
+    """
+    VERSION = 1
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.scanned = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> 'TextOffsetIndex':
+        index = cls(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == cls.VERSION:
+                index.entries = data.get('files', {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return index
+
+    def get(self, rel_path: str, full_path: str) -> Optional[Dict]:
+        """Return the offsets of one file, rescanning it only if it changed."""
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            with self._lock:
+                if self.entries.pop(rel_path, None) is not None:
+                    self._dirty = True
+            return None
+        with self._lock:
+            entry = self.entries.get(rel_path)
+            if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+                return entry
+        entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        entry.update(scan_offsets(full_path))
+        with self._lock:
+            self.entries[rel_path] = entry
+            self.scanned += 1
+            self._dirty = True
+        return entry
+
+    def update(self, files: Iterable[Tuple[str, str]], prune: bool = True) -> Dict[str, Dict]:
+        """Bring the index up to date for (rel_path, full_path) pairs.
+
+        Args:
+            prune: Drop entries for files that are not in `files`
+        """
+        result = {}
+        for rel_path, full_path in files:
+            entry = self.get(rel_path, full_path)
+            if entry is not None:
+                result[rel_path] = entry
+        if prune:
+            with self._lock:
+                for rel_path in set(self.entries) - set(result):
+                    del self.entries[rel_path]
+                    self._dirty = True
+        return result
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'files': self.entries}, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+def main():
+    from book_scanner import scan_book
+    from dialogue import book_text_documents
+
+    parser = argparse.ArgumentParser(
+        description='Index line and utterance offsets of the book text files',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('--book-path', default='book1', help='Path to the book directory (default: ./book1)')
+    parser.add_argument('--index', default=INDEX_FILE, help=f'Index file (default: {INDEX_FILE})')
+    args = parser.parse_args()
+
+    book = scan_book(args.book_path, read_texts=False)
+    if book is None:
+        print(f"Error: Book path {args.book_path} does not exist")
+        return 1
+    index = TextOffsetIndex.load(args.index)
+    files = index.update((rel_path, full_path) for rel_path, full_path, _ in book_text_documents(book))
+    index.save()
+    utterances = sum(len(entry['utterances']) for entry in files.values())
+    print(f"Indexed {len(files)} text files ({index.scanned} scanned, "
+          f"{len(files) - index.scanned} cached), {utterances} utterances")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,85 +6,126 @@ This script automatically scans all folders in the book structure and updates
 the audio_manifest.json files with the actual audio files present in each folder.
 
 Usage:
-    python update_audio_manifest.py [--dry-run] [--book-path BOOK_PATH]
+    python update_audio_manifest.py [--dry-run] [--book-path BOOK_PATH] [--jobs N]
+                                    [--summary-json FILE]
 
 Options:
     --dry-run        Show what would be changed without making actual changes
-    --book-path      Path to the book directory (default: ./book1)
+    --book-path      Path to one book directory (default: every bookN/ directory
+                     in the current directory)
+    --jobs           Number of folders to update in parallel (default: 1)
+    --summary-json   Write a JSON summary of the run to FILE ('-' for stdout,
+                     with the report on stderr)
+
+Manifests are written atomically (temporary file plus os.replace), so an
+interrupted run or a concurrent reader never sees a truncated manifest.
 
 python3 update_audio_manifest.py --dry-run --delete-wav
 """
 
 import os
+import sys
 import json
+import contextlib
+import time
 import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Set
+from typing import List, Optional
+
+from book_scanner import Chapter, Folder, discover_books, scan_book, scan_folder
 
-# Supported audio file extensions
-AUDIO_EXTENSIONS = {'.mp3', '.wav', '.m4a', '.ogg', '.flac'}
+def write_json_atomic(path: Path, data, indent: int = 0) -> None:
+    """Write JSON to path through a temporary file in the same directory.
 
-# Text file extension  
-TEXT_EXTENSION = '.txt'
+    os.replace is atomic, so readers see either the old or the new file.
+    """
+    try:
+        mode = path.stat().st_mode & 0o777
+    except OSError:
+        mode = 0o644
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        # mkstemp creates the file as 0600; keep the manifest readable
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
 
-def find_audio_files(directory: Path, delete_wav: bool = False) -> List[str]:
+def list_folder(directory: Path) -> Optional[Folder]:
+    """List a single directory with the shared book scanner."""
+    folder = Folder(name=directory.name, path=str(directory), rel_path=directory.name)
+    return folder if scan_folder(folder, read_texts=False) else None
+
+def find_audio_files(directory: Path, delete_wav: bool = False,
+                     audio_files: Optional[List[str]] = None) -> List[str]:
     """Find all audio files in a directory and return their filenames.
     
     Args:
         directory: Path to the directory to scan
         delete_wav: If True, delete all .wav files found
+        audio_files: Audio filenames already listed by the scanner; the
+                     directory is only listed when this is None
     
     Returns:
         List of audio filenames (excluding deleted .wav files)
     """
-    audio_files = []
-    
-    if not directory.exists():
-        return audio_files
-    
-    for file in directory.iterdir():
-        if file.is_file() and file.suffix.lower() in AUDIO_EXTENSIONS:
-            # Delete .wav files if requested
-            if delete_wav and file.suffix.lower() == '.wav':
-                try:
-                    file.unlink()
-                    print(f"  Deleted WAV file: {file.name}")
-                except OSError as e:
-                    print(f"  Warning: Could not delete {file.name}: {e}")
-                continue  # Don't add deleted files to the list
-            
-            audio_files.append(file.name)
+    if audio_files is None:
+        folder = list_folder(directory)
+        if folder is None:
+            return []
+        audio_files = folder.audio_files
+    
+    kept = []
+    for name in audio_files:
+        # Delete .wav files if requested
+        if delete_wav and name.lower().endswith('.wav'):
+            try:
+                (directory / name).unlink()
+                print(f"  Deleted WAV file: {name}")
+            except OSError as e:
+                print(f"  Warning: Could not delete {name}: {e}")
+            continue  # Don't add deleted files to the list
+        
+        kept.append(name)
     
     # Sort for consistent ordering
-    return sorted(audio_files)
+    return sorted(kept)
 
-def find_text_files(directory: Path) -> List[str]:
+def find_text_files(directory: Path, text_files: Optional[List[str]] = None) -> List[str]:
     """Find all text files in a directory and return their filenames (excluding title.txt).
     
     Args:
         directory: Path to the directory to scan
+        text_files: Text filenames already listed by the scanner; the
+                    directory is only listed when this is None
     
     Returns:
         List of text filenames (excluding title.txt)
     """
-    text_files = []
-    
-    if not directory.exists():
-        return text_files
-    
-    for file in directory.iterdir():
-        if file.is_file() and file.suffix.lower() == TEXT_EXTENSION:
-            # Exclude title.txt as requested
-            if file.name.lower() != 'title.txt':
-                text_files.append(file.name)
-    
-    # Sort for consistent ordering
-    return sorted(text_files)
+    if text_files is None:
+        folder = list_folder(directory)
+        if folder is None:
+            return []
+        text_files = folder.text_files
+    
+    # Exclude title.txt as requested
+    return sorted(name for name in text_files if name.lower() != 'title.txt')
 
-def update_audio_manifest(directory: Path, dry_run: bool = False, delete_wav: bool = False) -> bool:
+def update_audio_manifest(directory: Path, dry_run: bool = False, delete_wav: bool = False,
+                          audio_files: Optional[List[str]] = None) -> bool:
     """Update the audio_manifest.json file in the given directory."""
     manifest_path = directory / 'audio_manifest.json'
-    audio_files = find_audio_files(directory, delete_wav and not dry_run)
+    audio_files = find_audio_files(directory, delete_wav and not dry_run, audio_files)
     
     # Read existing manifest if it exists
     existing_manifest = []
@@ -110,18 +151,18 @@ def update_audio_manifest(directory: Path, dry_run: bool = False, delete_wav: bo
     
     # Write updated manifest
     try:
-        with open(manifest_path, 'w', encoding='utf-8') as f:
-            json.dump(audio_files, f, indent=0, ensure_ascii=False)
+        write_json_atomic(manifest_path, audio_files)
         print(f"Updated {manifest_path}: {audio_files}")
         return True
     except IOError as e:
         print(f"Error: Could not write to {manifest_path}: {e}")
         return False
 
-def update_text_manifest(directory: Path, dry_run: bool = False) -> bool:
+def update_text_manifest(directory: Path, dry_run: bool = False,
+                         text_files: Optional[List[str]] = None) -> bool:
     """Update the text_manifest.json file in the given directory."""
     manifest_path = directory / 'text_manifest.json'
-    text_files = find_text_files(directory)
+    text_files = find_text_files(directory, text_files)
     
     # Skip if no text files found (excluding title.txt)
     if not text_files:
@@ -160,16 +201,41 @@ def update_text_manifest(directory: Path, dry_run: bool = False) -> bool:
     
     # Write updated manifest
     try:
-        with open(manifest_path, 'w', encoding='utf-8') as f:
-            json.dump(text_files, f, indent=0, ensure_ascii=False)
+        write_json_atomic(manifest_path, text_files)
         print(f"Updated {manifest_path}: {text_files}")
         return True
     except IOError as e:
         print(f"Error: Could not write to {manifest_path}: {e}")
         return False
 
-def scan_book_directory(book_path: Path, dry_run: bool = False, delete_wav: bool = False) -> dict:
-    """Scan the entire book directory and update all audio and text manifests."""
+def update_folder(folder: Folder, dry_run: bool = False, delete_wav: bool = False) -> dict:
+    """Update both manifests of one folder and report what happened."""
+    directory = Path(folder.path)
+    result = {'folder': folder.rel_path, 'audio': 'unchanged', 'text': 'unchanged', 'error': None}
+    try:
+        # Update audio manifest
+        if update_audio_manifest(directory, dry_run, delete_wav, folder.audio_files):
+            result['audio'] = 'updated'
+        
+        # Update text manifest
+        if update_text_manifest(directory, dry_run, folder.text_files):
+            result['text'] = 'updated'
+    except Exception as e:
+        print(f"Error processing {directory}: {e}")
+        result['error'] = str(e)
+    return result
+
+def scan_book_directory(book_path: Path, dry_run: bool = False, delete_wav: bool = False,
+                        jobs: int = 1, results: Optional[List[dict]] = None) -> dict:
+    """Scan the entire book directory and update all audio and text manifests.
+    
+    All folder updates are planned from a single scan and then run on a
+    pool of `jobs` threads; folders are independent, so their manifests can
+    be rewritten concurrently.
+    
+    Args:
+        results: If given, per-folder results are appended to it in book order
+    """
     stats = {
         'audio_updated': 0,
         'audio_unchanged': 0,
@@ -187,83 +253,53 @@ def scan_book_directory(book_path: Path, dry_run: bool = False, delete_wav: bool
     print(f"Mode: {'DRY RUN' if dry_run else 'LIVE UPDATE'}")
     if delete_wav:
         print("WAV file deletion: ENABLED")
+    if jobs > 1:
+        print(f"Parallel jobs: {jobs}")
     print("-" * 50)
     
     # Find all directories that should have audio manifests
-    # This includes: chapter directories (C1, C2, etc.) and section directories (S1, S2, etc.)
+    # This includes: the Intro, chapter directories (C1, C2, etc.) and section
+    # directories (S1, S2, etc.). The shared scanner lists each one exactly once.
+    book = scan_book(str(book_path), read_texts=False)
+    if book is None:
+        print(f"Error: Could not scan {book_path}")
+        stats['errors'] += 1
+        return stats
     
-    for chapter_dir in book_path.iterdir():
-        if not chapter_dir.is_dir() or not chapter_dir.name.startswith('C'):
-            continue
-            
-        print(f"\nProcessing chapter: {chapter_dir.name}")
-        
-        # Update chapter-level audio and text manifests
-        stats['total_folders'] += 1
-        try:
-            # Update audio manifest
-            if update_audio_manifest(chapter_dir, dry_run, delete_wav):
-                stats['audio_updated'] += 1
-            else:
-                stats['audio_unchanged'] += 1
-                
-            # Update text manifest
-            if update_text_manifest(chapter_dir, dry_run):
-                stats['text_updated'] += 1
+    folders = book.folders
+    if jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            folder_results = list(executor.map(lambda folder: update_folder(folder, dry_run, delete_wav), folders))
+    else:
+        folder_results = []
+        for folder in folders:
+            if isinstance(folder, Chapter):
+                print(f"\nProcessing chapter: {folder.name}")
             else:
-                stats['text_unchanged'] += 1
-        except Exception as e:
-            print(f"Error processing {chapter_dir}: {e}")
+                print(f"  Processing section: {folder.name}")
+            folder_results.append(update_folder(folder, dry_run, delete_wav))
+    
+    for result in folder_results:
+        stats['total_folders'] += 1
+        if result['error']:
             stats['errors'] += 1
-        
-        # Process sections within the chapter
-        for section_dir in chapter_dir.iterdir():
-            if not section_dir.is_dir() or not section_dir.name.startswith('S'):
-                continue
-                
-            print(f"  Processing section: {section_dir.name}")
-            stats['total_folders'] += 1
-            
-            try:
-                # Update audio manifest
-                if update_audio_manifest(section_dir, dry_run, delete_wav):
-                    stats['audio_updated'] += 1
-                else:
-                    stats['audio_unchanged'] += 1
-                    
-                # Update text manifest
-                if update_text_manifest(section_dir, dry_run):
-                    stats['text_updated'] += 1
-                else:
-                    stats['text_unchanged'] += 1
-            except Exception as e:
-                print(f"Error processing {section_dir}: {e}")
-                stats['errors'] += 1
-    
-    # Also check special directories like 'Intro'
-    for special_dir in book_path.iterdir():
-        if special_dir.is_dir() and special_dir.name in ['Intro']:
-            print(f"\nProcessing special directory: {special_dir.name}")
-            stats['total_folders'] += 1
-            
-            try:
-                # Update audio manifest
-                if update_audio_manifest(special_dir, dry_run, delete_wav):
-                    stats['audio_updated'] += 1
-                else:
-                    stats['audio_unchanged'] += 1
-                    
-                # Update text manifest
-                if update_text_manifest(special_dir, dry_run):
-                    stats['text_updated'] += 1
-                else:
-                    stats['text_unchanged'] += 1
-            except Exception as e:
-                print(f"Error processing {special_dir}: {e}")
-                stats['errors'] += 1
+            continue
+        stats[f"audio_{result['audio']}"] += 1
+        stats[f"text_{result['text']}"] += 1
     
+    if results is not None:
+        results.extend(folder_results)
     return stats
 
+def write_summary(destination: str, summary: dict) -> None:
+    """Write the run summary as JSON to a file, or to stdout for '-'."""
+    data = json.dumps(summary, indent=2, ensure_ascii=False)
+    if destination == '-':
+        print(data)
+    else:
+        with open(destination, 'w', encoding='utf-8') as f:
+            f.write(data + '\n')
+
 def main():
     parser = argparse.ArgumentParser(
         description='Update audio_manifest.json files for the Economics book website',
@@ -280,8 +316,7 @@ def main():
     parser.add_argument(
         '--book-path',
         type=Path,
-        default=Path('./book1'),
-        help='Path to the book directory (default: ./book1)'
+        help='Path to one book directory (default: every bookN/ directory in the current directory)'
     )
     
     parser.add_argument(
@@ -290,30 +325,75 @@ def main():
         help='Delete all .wav files found during the scan'
     )
     
-    args = parser.parse_args()
-    
-    # Make sure we're working with absolute paths
-    book_path = args.book_path.resolve()
-    
-    # Run the scan
-    stats = scan_book_directory(book_path, args.dry_run, args.delete_wav)
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=1,
+        help='Number of folders to update in parallel (default: 1)'
+    )
     
-    # Print summary
-    print("\n" + "=" * 50)
-    print("SUMMARY")
-    print("=" * 50)
-    print(f"Total folders processed: {stats['total_folders']}")
-    print(f"Audio manifests updated: {stats['audio_updated']}")
-    print(f"Audio manifests unchanged: {stats['audio_unchanged']}")
-    print(f"Text manifests updated: {stats['text_updated']}")
-    print(f"Text manifests unchanged: {stats['text_unchanged']}")
-    print(f"Errors encountered: {stats['errors']}")
+    parser.add_argument(
+        '--summary-json',
+        metavar='FILE',
+        help="Write a JSON summary of the run to FILE ('-' for stdout)"
+    )
     
-    total_updates = stats['audio_updated'] + stats['text_updated']
-    if args.dry_run and total_updates > 0:
-        print(f"\nRun without --dry-run to apply {total_updates} changes")
+    args = parser.parse_args()
     
-    return 0 if stats['errors'] == 0 else 1
+    # With the summary on stdout, the report goes to stderr so stdout is just JSON
+    report_to = sys.stderr if args.summary_json == '-' else sys.stdout
+    with contextlib.redirect_stdout(report_to):
+        # Make sure we're working with absolute paths
+        if args.book_path is not None:
+            book_paths = [args.book_path.resolve()]
+        else:
+            book_paths = [Path(name).resolve() for name in discover_books('.')]
+            if not book_paths:
+                print("Error: No book directories (book1, book2, ...) found")
+                return 1
+    
+        if args.jobs < 1:
+            parser.error('--jobs must be at least 1')
+    
+        # Run the scan, one book after another
+        started = time.monotonic()
+        results = []
+        stats = {}
+        for book_path in book_paths:
+            for key, value in scan_book_directory(book_path, args.dry_run, args.delete_wav,
+                                                  args.jobs, results).items():
+                stats[key] = stats.get(key, 0) + value
+        duration = time.monotonic() - started
+    
+        # Print summary
+        print("\n" + "=" * 50)
+        print("SUMMARY")
+        print("=" * 50)
+        print(f"Total folders processed: {stats['total_folders']}")
+        print(f"Audio manifests updated: {stats['audio_updated']}")
+        print(f"Audio manifests unchanged: {stats['audio_unchanged']}")
+        print(f"Text manifests updated: {stats['text_updated']}")
+        print(f"Text manifests unchanged: {stats['text_unchanged']}")
+        print(f"Errors encountered: {stats['errors']}")
+    
+        total_updates = stats['audio_updated'] + stats['text_updated']
+        if args.dry_run and total_updates > 0:
+            print(f"\nRun without --dry-run to apply {total_updates} changes")
+    
+        exit_code = 0 if stats['errors'] == 0 else 1
+    if args.summary_json:
+        write_summary(args.summary_json, {
+            'book_paths': [str(book_path) for book_path in book_paths],
+            'dry_run': args.dry_run,
+            'jobs': args.jobs,
+            'duration_seconds': round(duration, 3),
+            'exit_code': exit_code,
+            'stats': stats,
+            'changed': [r for r in results if r['audio'] == 'updated' or r['text'] == 'updated'],
+            'errors': [r for r in results if r['error']],
+        })
+    
+    return exit_code
 
 if __name__ == '__main__':
     exit(main())
\ No newline at end of file
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Background warm-up of server.py's indexes, and a snapshot of its responses.
+
+Without warm-up nothing is built until it is first requested, so the
+first visitor after every restart pays for scanning the books, hashing
+the assets and reading audio metadata. Warmup runs those builds as named
+steps in a background thread while the server already accepts
+connections.
+
+Requests that arrive before warm-up has finished are answered from a
+snapshot of the response cache written at the last shutdown when it has
+an entry for them; otherwise they wait at most --warmup-timeout seconds
+for the step that builds their response and then get 503 with
+Retry-After, so cold-start latency stays bounded. The viewer falls back to the static files on 503.
+
+The snapshot holds each cached response's body, Last-Modified and cache
+key. Entries whose key still matches after the restart (e.g. an
+unchanged directory signature) also go straight back into the response
+cache, so warm-up only has to confirm them instead of rebuilding.
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+SNAPSHOT_FILE = '.response_snapshot.json'
+SNAPSHOT_VERSION = 1
+
+# Seconds a request made during warm-up waits before it gets 503
+DEFAULT_TIMEOUT = 2.0
+RETRY_AFTER_SECONDS = 1
+
+class Warmup:
+    """Runs named steps once, in order, in a background thread.
+
+    Each step is ready as soon as it has run, so a request only waits for
+    the step that builds what it needs. A step that fails is reported and
+    skipped; whatever it was meant to build is then built on first use as
+    before.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], object]]]):
+        self.steps = steps
+        self.errors: Dict[str, str] = {}
+        self.duration: Optional[float] = None
+        self._ready = {name: threading.Event() for name, _ in steps}
+        self._done = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name='warmup', daemon=True).start()
+
+    def _run(self):
+        started = time.perf_counter()
+        for name, step in self.steps:
+            try:
+                step()
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"Warning: Warm-up step {name} failed: {e}")
+            self._ready[name].set()
+        self.duration = time.perf_counter() - started
+        self._done.set()
+        print(f"Warm-up finished in {self.duration:.2f}s ({len(self.steps)} steps)")
+
+    def _event(self, name: Optional[str]) -> Optional[threading.Event]:
+        return self._done if name is None else self._ready.get(name)
+
+    def ready(self, name: Optional[str] = None) -> bool:
+        """Whether a step (or with no name, all of warm-up) has finished.
+
+        Names that are not steps are always ready.
+        """
+        event = self._event(name)
+        return event is None or event.is_set()
+
+    def wait(self, name: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """Wait for a step (or all of warm-up) to finish; returns whether it has."""
+        event = self._event(name)
+        return event is None or event.wait(timeout)
+
+def _freeze(value):
+    """Turn the lists of a JSON-decoded cache key back into tuples."""
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def load_snapshot(path: str) -> Dict[str, Dict]:
+    """Read a snapshot.
+
+    Returns:
+        {name: {'key': key or None, 'last_modified': str, 'body': bytes}}
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != SNAPSHOT_VERSION:
+            return {}
+        return {name: {'key': _freeze(entry['key']),
+                       'last_modified': entry['last_modified'],
+                       'body': entry['body'].encode('utf-8')}
+                for name, entry in data['entries'].items()}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"Warning: Could not read response snapshot: {e}")
+        return {}
+
+def save_snapshot(path: str, entries: Dict[str, Dict]):
+    """Write entries in the format load_snapshot() reads.
+
+    A key that cannot be stored as JSON is stored as None, so the entry
+    can be served during warm-up but never matches a cache lookup.
+    """
+    serialized = {}
+    for name, entry in entries.items():
+        key = entry['key']
+        try:
+            json.dumps(key)
+        except (TypeError, ValueError):
+            key = None
+        serialized[name] = {'key': key, 'last_modified': entry['last_modified'],
+                            'body': entry['body'].decode('utf-8')}
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': SNAPSHOT_VERSION, 'entries': serialized}, f,
+                      separators=(',', ':'), ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not save response snapshot: {e}")